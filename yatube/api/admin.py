@@ -0,0 +1,16 @@
+from django.contrib import admin
+
+from .models import Token
+
+
+class TokenAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'user', 'name', 'created',)
+    search_fields = ('user__username', 'name',)
+    readonly_fields = ('user', 'created',)
+
+    def has_add_permission(self, request):
+        # Ключ видно только при выпуске: manage.py issue_token.
+        return False
+
+
+admin.site.register(Token, TokenAdmin)
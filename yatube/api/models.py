@@ -0,0 +1,64 @@
+import hashlib
+import secrets
+
+from django.contrib.auth import get_user_model
+from django.db import models
+
+User = get_user_model()
+
+
+class Token(models.Model):
+    '''Ключ доступа к API на запись. В базе хранится только его хеш.'''
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='api_tokens')
+    key_hash = models.CharField(max_length=64, unique=True, editable=False)
+    name = models.CharField(max_length=100, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f'{self.user}: {self.name or self.pk}'
+
+    @staticmethod
+    def hash(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    @classmethod
+    def issue(cls, user, name=''):
+        '''Создаёт токен и возвращает ключ — показать его можно один раз.'''
+        key = secrets.token_hex(20)
+        cls.objects.create(user=user, key_hash=cls.hash(key), name=name)
+        return key
+
+    @classmethod
+    def user_for(cls, key):
+        token = cls.objects.select_related('user').filter(
+            key_hash=cls.hash(key), user__is_active=True).first()
+        return None if token is None else token.user
+
+
+class IdempotencyKey(models.Model):
+    '''Ключ клиента, под которым объект уже создан.
+
+    Удаляется вместе с объектом (см. ``signals``): иначе повтор ключа
+    вернул бы id, которого больше нет.
+    '''
+    POST = 'post'
+    COMMENT = 'comment'
+    KINDS = ((POST, 'Пост'), (COMMENT, 'Комментарий'))
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='+')
+    kind = models.CharField(max_length=10, choices=KINDS)
+    key = models.CharField(max_length=64)
+    object_id = models.PositiveIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(fields=('user', 'kind', 'key'),
+                                    name='unique_idempotency_key'),
+        )
+        indexes = (
+            models.Index(fields=('kind', 'object_id'),
+                         name='idempotency_object_idx'),
+        )
@@ -0,0 +1,102 @@
+'''Сериализация строк ``values_list`` в JSON без экземпляров моделей.
+
+Набор полей ресурса описан словарём «имя в ответе → (путь ORM,
+преобразование)». Запрос выбирает только нужные колонки (с JOIN для
+имени автора и слага группы) плюс ключ сортировки для курсора, а ответ
+собирается из кортежей. Параметр ``fields`` оставляет в ответе только
+перечисленные поля.
+'''
+import json
+
+from django.conf import settings
+
+from posts.utilits import CursorPaginator, encode_cursor
+
+STREAM_ROWS = 20
+
+
+class InvalidFields(Exception):
+    '''В ``fields`` есть поля, которых у ресурса нет.'''
+
+
+def _datetime(value):
+    return value.isoformat()
+
+
+def _media_url(name):
+    return settings.MEDIA_URL + name if name else None
+
+
+POST_FIELDS = {
+    'id': ('pk', None),
+    'text': ('text', None),
+    'pub_date': ('pub_date', _datetime),
+    'author': ('author__username', None),
+    'group': ('group__slug', None),
+    'image': ('image', _media_url),
+    'comments_count': ('comments_count', None),
+}
+COMMENT_FIELDS = {
+    'id': ('pk', None),
+    'author': ('author__username', None),
+    'text': ('text', None),
+    'created': ('created', _datetime),
+}
+
+dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+
+class Rows:
+    '''Какие колонки читать и как собрать из строки объект ответа.'''
+
+    def __init__(self, spec, requested=None, ordering=()):
+        names = list(spec) if not requested else requested.split(',')
+        unknown = set(names) - set(spec)
+        if unknown:
+            raise InvalidFields(', '.join(sorted(unknown)))
+        self.names = names
+        self.paths = [spec[name][0] for name in names]
+        self.converters = [spec[name][1] for name in names]
+        self.positions = []
+        for field in ordering:
+            path = field.lstrip('-')
+            if path not in self.paths:
+                self.paths.append(path)
+            self.positions.append(self.paths.index(path))
+
+    def select(self, queryset):
+        return queryset.values_list(*self.paths)
+
+    def as_dict(self, row):
+        return {name: value if convert is None or value is None
+                else convert(value)
+                for name, convert, value
+                in zip(self.names, self.converters, row)}
+
+
+class RowPaginator(CursorPaginator):
+    '''Курсорный паджинатор по кортежам: ключ берётся по позициям.'''
+
+    def __init__(self, rows, queryset, per_page, ordering):
+        super().__init__(rows.select(queryset), per_page, ordering=ordering)
+        self.positions = rows.positions
+
+    def _cursor_for(self, row, direction):
+        return encode_cursor([row[position] for position in self.positions],
+                             direction)
+
+
+def stream(rows, page):
+    '''Тело ответа со страницей, кусками по ``STREAM_ROWS`` строк.'''
+    yield '{"data":['
+    chunk = []
+    for number, row in enumerate(page):
+        chunk.append(dumps(rows.as_dict(row)))
+        if len(chunk) == STREAM_ROWS:
+            yield (',' if number >= STREAM_ROWS else '') + ','.join(chunk)
+            chunk = []
+    if chunk:
+        yield (',' if len(page) > len(chunk) else '') + ','.join(chunk)
+    yield '],"next_cursor":%s,"previous_cursor":%s}' % (
+        dumps(page.paginator.next_cursor),
+        dumps(page.paginator.previous_cursor))
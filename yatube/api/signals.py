@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from posts.models import Comment, Post
+
+from .models import IdempotencyKey
+
+KINDS = {Post: IdempotencyKey.POST, Comment: IdempotencyKey.COMMENT}
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Comment)
+def object_deleted(sender, instance, **kwargs):
+    IdempotencyKey.objects.filter(kind=KINDS[sender],
+                                  object_id=instance.pk).delete()
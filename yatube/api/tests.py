@@ -0,0 +1,302 @@
+import gzip
+import json
+
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, FeedEntry, Follow, Group, Post, UserStats
+from yatube.constants import API_BATCH_SIZE, API_PAGE_SIZE
+
+from . import writes
+from .models import Token
+
+User = get_user_model()
+
+
+def read_json(response):
+    content = b''.join(response.streaming_content)
+    if response.get('Content-Encoding') == 'gzip':
+        content = gzip.decompress(content)
+    return json.loads(content)
+
+
+class ReadApiTest(TestCase):
+    TOTAL = API_PAGE_SIZE + 7
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        for i in range(cls.TOTAL):
+            Post.objects.create(text=f'Пост {i}', author=cls.user,
+                                group=cls.group if i % 2 else None)
+        cls.post = Post.objects.order_by('-pub_date', '-pk').first()
+        for i in range(3):
+            Comment.objects.create(text=f'Комментарий {i}',
+                                   author=cls.reader, post=cls.post)
+        Follow.objects.create(user=cls.reader, author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def walk(self, url, **params):
+        '''Все страницы ленты по курсорам.'''
+        items, cursor = [], None
+        while True:
+            query = dict(params, cursor=cursor) if cursor else params
+            data = read_json(self.client.get(url, query))
+            items.extend(data['data'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                return items
+
+    def test_feeds_page_through_all_posts(self):
+        expected = {
+            reverse('api:posts'): Post.objects.all(),
+            reverse('api:group_posts', args=('group',)):
+                Post.objects.filter(group=ReadApiTest.group),
+            reverse('api:profile_posts', args=('auth',)):
+                Post.objects.filter(author=ReadApiTest.user),
+        }
+        for url, posts in expected.items():
+            with self.subTest(url=url):
+                ids = [item['id'] for item in self.walk(url, limit=20)]
+                self.assertEqual(ids, list(posts.order_by(
+                    '-pub_date', '-pk').values_list('pk', flat=True)))
+
+    def test_item_shape_and_sparse_fields(self):
+        response = self.client.get(reverse('api:posts'))
+        self.assertEqual(response['Content-Type'],
+                         'application/json; charset=utf-8')
+        data = read_json(response)
+        self.assertEqual(len(data['data']), API_PAGE_SIZE)
+        first = data['data'][0]
+        self.assertEqual(first['author'], 'auth')
+        self.assertEqual(first['text'], f'Пост {self.TOTAL - 1}')
+        self.assertEqual(set(first), {'id', 'text', 'pub_date', 'author',
+                                      'group', 'image', 'comments_count'})
+        sparse = read_json(self.client.get(reverse('api:posts'),
+                                           {'fields': 'id,author'}))
+        self.assertEqual(set(sparse['data'][0]), {'id', 'author'})
+        response = self.client.get(reverse('api:posts'), {'fields': 'secret'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_gzip_and_not_modified(self):
+        url = reverse('api:posts')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(read_json(response)['data']), API_PAGE_SIZE)
+        repeated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeated.status_code, 304)
+
+    def test_post_detail_with_comments(self):
+        url = reverse('api:post_detail', args=(ReadApiTest.post.pk,))
+        data = self.client.get(url, {'comment_fields': 'text'}).json()
+        self.assertEqual(data['data']['id'], ReadApiTest.post.pk)
+        self.assertEqual(data['data']['comments_count'], 3)
+        self.assertEqual(data['comments'][0], {'text': 'Комментарий 2'})
+        self.assertIsNone(data['comments_next_cursor'])
+        comments = self.walk(reverse('api:post_comments',
+                                     args=(ReadApiTest.post.pk,)), limit=2)
+        self.assertEqual([item['text'] for item in comments],
+                         ['Комментарий 2', 'Комментарий 1', 'Комментарий 0'])
+
+    def test_follow_feed_needs_login(self):
+        url = reverse('api:follow_posts')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(ReadApiTest.reader)
+        self.assertEqual(len(self.walk(url)), self.TOTAL)
+
+    def test_missing_objects(self):
+        for url in (reverse('api:post_detail', args=(0,)),
+                    reverse('api:group_posts', args=('missing',)),
+                    reverse('api:profile_posts', args=('nobody',))):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 404)
+                self.assertIn('error', response.json())
+
+    def test_page_query_count(self):
+        self.client.get(reverse('api:posts'))
+        with self.assertNumQueries(1):
+            read_json(self.client.get(reverse('api:posts'), {'limit': 50}))
+
+
+class WriteApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='writer')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        cls.post = Post.objects.create(text='Пост автора', author=cls.author)
+        cls.key = Token.issue(cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {self.key}')
+
+    def send(self, name, data, *args, method='post'):
+        return getattr(self.client, method)(
+            reverse(f'api:{name}', args=args), json.dumps(data),
+            content_type='application/json')
+
+    def test_token_required(self):
+        anonymous = Client(enforce_csrf_checks=True)
+        anonymous.force_login(WriteApiTest.user)
+        for auth in ('', 'Token wrong'):
+            with self.subTest(auth=auth):
+                response = anonymous.post(
+                    reverse('api:posts'), {'text': 'Пост'},
+                    content_type='application/json', HTTP_AUTHORIZATION=auth)
+                self.assertEqual(response.status_code, 401)
+        self.assertFalse(Post.objects.filter(text='Пост').exists())
+
+    def test_issue_token_command(self):
+        out = StringIO()
+        call_command('issue_token', 'author', stdout=out)
+        self.assertEqual(Token.user_for(out.getvalue().strip()),
+                         WriteApiTest.author)
+
+    def test_create_post_is_idempotent(self):
+        item = {'key': 'cross-1', 'text': 'Новый пост', 'group': 'group'}
+        response = self.send('posts', item)
+        self.assertEqual(response.status_code, 201)
+        created = response.json()
+        post = Post.objects.get(pk=created['id'])
+        self.assertEqual((post.author, post.group),
+                         (WriteApiTest.user, WriteApiTest.group))
+        repeated = self.send('posts', item)
+        self.assertEqual(repeated.status_code, 200)
+        self.assertEqual(repeated.json(), dict(created, status='exists'))
+        self.assertEqual(Post.objects.filter(text='Новый пост').count(), 1)
+
+    def test_deleted_ids_and_keys_are_not_reused(self):
+        created = self.send('posts', {'key': 'once', 'text': 'Пост'}).json()
+        Post.objects.filter(pk=created['id']).delete()
+        replayed = self.send('posts', {'key': 'once', 'text': 'Пост'})
+        self.assertEqual(replayed.json()['status'], 'created')
+        self.assertGreater(replayed.json()['id'], created['id'])
+        batch = self.send('posts_batch', {'items': [
+            {'text': 'Первый'}, {'text': 'Второй'}]}).json()['results']
+        self.assertEqual([item['id'] for item in batch],
+                         [replayed.json()['id'] + 1,
+                          replayed.json()['id'] + 2])
+
+    def test_only_key_collisions_are_retried(self):
+        calls = []
+
+        @writes._retrying
+        def write(user):
+            calls.append(user)
+            raise IntegrityError('NOT NULL constraint failed')
+
+        with self.assertRaises(IntegrityError):
+            write(WriteApiTest.user)
+        self.assertEqual(len(calls), 1)
+
+    def test_post_batch_results_and_derived_data(self):
+        Follow.objects.create(user=WriteApiTest.author,
+                              author=WriteApiTest.user)
+        items = [{'key': 'a', 'text': 'Первый', 'group': 'group'},
+                 {'key': 'b', 'text': ' '},
+                 {'key': 'c', 'text': 'Без группы', 'group': 'missing'},
+                 {'text': 'Без ключа'},
+                 {'key': 'a', 'text': 'Повтор в пакете'},
+                 'не объект']
+        with self.assertNumQueries(23):
+            response = self.send('posts_batch', {'items': items})
+        results = response.json()['results']
+        self.assertEqual([item['status'] for item in results],
+                         ['created', 'invalid', 'invalid', 'created',
+                          'exists', 'invalid'])
+        self.assertEqual(set(results[2]['errors']), {'group'})
+        self.assertEqual(results[4]['id'], results[0]['id'])
+        new_ids = [results[0]['id'], results[3]['id']]
+        self.assertEqual(UserStats.objects.get(
+            user=WriteApiTest.user).posts_count, 2)
+        self.assertEqual(Group.objects.get(pk=WriteApiTest.group.pk)
+                         .posts_count, 1)
+        self.assertEqual(set(FeedEntry.objects.filter(
+            user=WriteApiTest.author).values_list('post_id', flat=True)),
+            set(new_ids))
+        data = read_json(self.client.get(reverse('api:posts')))
+        self.assertEqual([item['id'] for item in data['data'][:2]],
+                         new_ids[::-1])
+
+    def test_batch_limits(self):
+        for body in ({}, {'items': []},
+                     {'items': [{'text': 'x'}] * (API_BATCH_SIZE + 1)}):
+            with self.subTest(body=body):
+                self.assertEqual(
+                    self.send('posts_batch', body).status_code, 400)
+        response = self.client.post(reverse('api:posts_batch'), 'не json',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_comments(self):
+        post = WriteApiTest.post
+        response = self.send('post_comments', {'key': 'k', 'text': 'Ответ'},
+                             post.pk)
+        self.assertEqual(response.status_code, 201)
+        results = self.send('comments_batch', {'items': [
+            {'key': 'k', 'post': post.pk, 'text': 'Ответ'},
+            {'key': 'm', 'post': post.pk, 'text': 'Ещё'},
+            {'key': 'n', 'post': 0, 'text': 'Мимо'},
+        ]}).json()['results']
+        self.assertEqual([item['status'] for item in results],
+                         ['exists', 'created', 'invalid'])
+        self.assertEqual(results[0]['id'], response.json()['id'])
+        self.assertEqual(Post.objects.get(pk=post.pk).comments_count, 2)
+        data = self.client.get(reverse('api:post_detail', args=(post.pk,)),
+                               {'comment_fields': 'text'}).json()
+        self.assertEqual(data['data']['comments_count'], 2)
+        self.assertEqual(data['comments'], [{'text': 'Ещё'},
+                                            {'text': 'Ответ'}])
+
+    def test_follow_and_unfollow(self):
+        response = self.send('follow', {}, 'author')
+        self.assertEqual(response.json()['status'], 'created')
+        self.assertEqual(self.send('follow', {}, 'author').json()['status'],
+                         'exists')
+        self.assertTrue(FeedEntry.objects.filter(
+            user=WriteApiTest.user, post=WriteApiTest.post).exists())
+        response = self.send('follow', {}, 'author', method='delete')
+        self.assertEqual(response.json()['status'], 'deleted')
+        self.assertFalse(Follow.objects.filter(
+            user=WriteApiTest.user).exists())
+        self.assertEqual(
+            UserStats.objects.get(user=WriteApiTest.author).followers_count,
+            0)
+
+    def test_follows_batch(self):
+        other = User.objects.create_user(username='other')
+        results = self.send('follows_batch', {'items': [
+            {'author': 'author'},
+            {'author': 'other'},
+            {'author': 'other', 'action': 'unfollow'},
+            {'author': 'writer'},
+            {'author': 'nobody', 'action': 'maybe'},
+        ]}).json()['results']
+        self.assertEqual([item['status'] for item in results],
+                         ['created', 'created', 'deleted', 'invalid',
+                          'invalid'])
+        self.assertEqual(set(results[4]['errors']), {'author', 'action'})
+        self.assertEqual(list(Follow.objects.filter(
+            user=WriteApiTest.user).values_list('author', flat=True)),
+            [WriteApiTest.author.pk])
+        stats = UserStats.objects.get(user=WriteApiTest.user)
+        self.assertEqual(stats.following_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=other).followers_count, 0)
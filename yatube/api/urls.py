@@ -0,0 +1,25 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    path('posts/', views.by_method(get=views.posts, post=views.create_post),
+         name='posts'),
+    path('posts/batch/', views.create_posts_batch, name='posts_batch'),
+    path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path('posts/<int:post_id>/comments/',
+         views.by_method(get=views.post_comments, post=views.create_comment),
+         name='post_comments'),
+    path('comments/batch/', views.create_comments_batch,
+         name='comments_batch'),
+    path('groups/<slug:slug>/posts/', views.group_posts, name='group_posts'),
+    path('profiles/<str:username>/posts/',
+         views.profile_posts, name='profile_posts'),
+    path('profiles/<str:username>/follow/',
+         views.by_method(post=views.follow, delete=views.follow),
+         name='follow'),
+    path('follows/batch/', views.follows_batch, name='follows_batch'),
+    path('follow/posts/', views.follow_posts, name='follow_posts'),
+]
@@ -0,0 +1,234 @@
+'''API v1: чтение лент и постов, запись по токену.
+
+Ленты отдаются страницами по курсору (``?cursor=``, ``?limit=``), тело
+ответа собирается из строк ``values_list`` и уходит потоком, сжатым
+gzip, если клиент его принимает. ``?fields=`` (у поста с комментариями
+ещё ``?comment_fields=``) оставляет только нужные поля. ETag и ``304`` —
+как у HTML-страниц.
+
+Запись принимает JSON и заголовок ``Authorization: Token <ключ>``
+(ключ выдаёт ``manage.py issue_token``); сессия для записи не
+используется, поэтому и CSRF не нужен. У каждого вида записи есть
+пакетный вариант, ``{"items": [...]}``, с результатом по каждому
+элементу — см. ``writes``.
+'''
+import json
+from functools import wraps
+from http import HTTPStatus
+
+from django.http import (HttpResponseNotAllowed, JsonResponse,
+                         StreamingHttpResponse)
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_GET, require_POST
+
+from core.db.routers import read_only
+from posts.caching import (POSTS, author_scope, follow_scope, group_scope,
+                           post_scope)
+from posts.conditional import PageValidators
+from posts.feed import FEED_ORDERING, follow_feed
+from posts.models import Comment, Post
+from posts.object_cache import author_cache, group_cache, post_cache
+from posts.utilits import COMMENT_ORDERING, CURSOR_PARAM
+from yatube.constants import API_MAX_PAGE_SIZE, API_PAGE_SIZE
+
+from .models import Token
+from .serializers import (COMMENT_FIELDS, POST_FIELDS, InvalidFields,
+                          RowPaginator, Rows, stream)
+from .writes import (CREATED, FOLLOW, INVALID, UNFOLLOW, BatchError,
+                     change_follows, create_comments, create_posts)
+
+POST_ORDERING = ('-pub_date', '-pk')
+JSON_CONTENT_TYPE = 'application/json; charset=utf-8'
+
+
+def error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def json_response(data, status=HTTPStatus.OK):
+    return JsonResponse(data, status=status,
+                        json_dumps_params={'ensure_ascii': False})
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', API_PAGE_SIZE))
+    except ValueError:
+        return API_PAGE_SIZE
+    return min(max(limit, 1), API_MAX_PAGE_SIZE)
+
+
+def _page(request, spec, queryset, ordering, fields='fields'):
+    rows = Rows(spec, request.GET.get(fields), ordering)
+    paginator = RowPaginator(rows, queryset, _limit(request), ordering)
+    return rows, paginator.get_page(request.GET.get(CURSOR_PARAM))
+
+
+def feed_response(request, scopes, queryset, ordering=POST_ORDERING,
+                  spec=POST_FIELDS):
+    '''Страница ленты потоком JSON с валидаторами областей ``scopes``.'''
+    validators = PageValidators(request, *scopes)
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    try:
+        rows, page = _page(request, spec, queryset, ordering)
+    except InvalidFields as unknown:
+        return error(f'Нет полей: {unknown}', HTTPStatus.BAD_REQUEST)
+    return validators.apply(StreamingHttpResponse(
+        stream(rows, page), content_type=JSON_CONTENT_TYPE))
+
+
+def api_view(view):
+    '''Общие декораторы представлений API.'''
+    return read_only(require_GET(gzip_page(view)))
+
+
+@api_view
+def posts(request):
+    return feed_response(request, (POSTS,), Post.objects.all())
+
+
+@api_view
+def group_posts(request, slug):
+    group = group_cache.get(slug)
+    if group is None:
+        return error('Группа не найдена', HTTPStatus.NOT_FOUND)
+    return feed_response(request, (group_scope(group.pk),),
+                         Post.objects.filter(group_id=group.pk))
+
+
+@api_view
+def profile_posts(request, username):
+    author = author_cache.get(username)
+    if author is None:
+        return error('Автор не найден', HTTPStatus.NOT_FOUND)
+    return feed_response(request, (author_scope(author.pk),),
+                         Post.objects.filter(author_id=author.pk))
+
+
+@api_view
+def follow_posts(request):
+    if not request.user.is_authenticated:
+        return error('Нужна авторизация', HTTPStatus.UNAUTHORIZED)
+    scopes = (POSTS, follow_scope(request.user.pk))
+    return feed_response(request, scopes, follow_feed(request.user),
+                         FEED_ORDERING)
+
+
+@api_view
+def post_detail(request, post_id):
+    if post_cache.get(post_id) is None:
+        return error('Пост не найден', HTTPStatus.NOT_FOUND)
+    validators = PageValidators(request, post_scope(post_id))
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    try:
+        rows = Rows(POST_FIELDS, request.GET.get('fields'))
+        comment_rows, comments = _page(
+            request, COMMENT_FIELDS, Comment.objects.filter(post_id=post_id),
+            COMMENT_ORDERING, fields='comment_fields')
+    except InvalidFields as unknown:
+        return error(f'Нет полей: {unknown}', HTTPStatus.BAD_REQUEST)
+    post = rows.select(Post.objects.filter(pk=post_id)).get()
+    return validators.apply(json_response({
+        'data': rows.as_dict(post),
+        'comments': [comment_rows.as_dict(row) for row in comments],
+        'comments_next_cursor': comments.paginator.next_cursor,
+    }))
+
+
+@api_view
+def post_comments(request, post_id):
+    if post_cache.get(post_id) is None:
+        return error('Пост не найден', HTTPStatus.NOT_FOUND)
+    return feed_response(request, (post_scope(post_id),),
+                         Comment.objects.filter(post_id=post_id),
+                         COMMENT_ORDERING, COMMENT_FIELDS)
+
+
+def by_method(**views):
+    '''Одно представление на URL: ``get=``, ``post=`` и так далее.'''
+    def view(request, *args, **kwargs):
+        handler = views.get(request.method.lower())
+        if handler is None:
+            return HttpResponseNotAllowed([name.upper() for name in views])
+        return handler(request, *args, **kwargs)
+    view.read_only = getattr(views.get('get'), 'read_only', False)
+    return csrf_exempt(view)
+
+
+def write_view(view):
+    '''Запись по токену: ``view(request, body, ...)`` с разобранным JSON.'''
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        scheme, _, key = request.META.get(
+            'HTTP_AUTHORIZATION', '').partition(' ')
+        user = Token.user_for(key) if scheme == 'Token' and key else None
+        if user is None:
+            return error('Нужен токен', HTTPStatus.UNAUTHORIZED)
+        try:
+            body = json.loads(request.body) if request.body else {}
+        except ValueError:
+            return error('Тело запроса — не JSON', HTTPStatus.BAD_REQUEST)
+        request.user = user
+        try:
+            return view(request, body, *args, **kwargs)
+        except BatchError as problem:
+            return error(str(problem), HTTPStatus.BAD_REQUEST)
+    return wrapper
+
+
+def _single(write, request, item):
+    outcome = write(request.user, [item])[0]
+    status = {CREATED: HTTPStatus.CREATED,
+              INVALID: HTTPStatus.BAD_REQUEST}.get(outcome['status'],
+                                                   HTTPStatus.OK)
+    return json_response(outcome, status)
+
+
+def _batch(write, request, body):
+    items = body.get('items') if isinstance(body, dict) else None
+    return json_response({'results': write(request.user, items)})
+
+
+def _item(body, **fields):
+    return dict(body if isinstance(body, dict) else {}, **fields)
+
+
+@write_view
+def create_post(request, body):
+    return _single(create_posts, request, body)
+
+
+@require_POST
+@write_view
+def create_posts_batch(request, body):
+    return _batch(create_posts, request, body)
+
+
+@write_view
+def create_comment(request, body, post_id):
+    return _single(create_comments, request, _item(body, post=post_id))
+
+
+@require_POST
+@write_view
+def create_comments_batch(request, body):
+    return _batch(create_comments, request, body)
+
+
+@write_view
+def follow(request, body, username):
+    action = FOLLOW if request.method == 'POST' else UNFOLLOW
+    return _single(change_follows, request,
+                   _item(body, author=username, action=action))
+
+
+@require_POST
+@write_view
+def follows_batch(request, body):
+    return _batch(change_follows, request, body)
@@ -0,0 +1,289 @@
+'''Пакетная запись постов, комментариев и подписок для API.
+
+Пакет проверяется заранее целиком: ключи, группы, посты и авторы
+читаются одним запросом на вид, а новые строки пишутся ``bulk_create``
+в одной транзакции. ``bulk_create`` не шлёт сигналов, поэтому счётчики,
+карточки постов, ленты, поисковый индекс и версии кэша обновляются
+здесь — так же, как в ``posts.signals``, но по одному разу на пакет,
+где это возможно.
+
+Ключ клиента (``key``) делает создание идемпотентным: повтор с тем же
+ключом возвращает уже созданный объект со статусом ``exists``.
+Подписка идемпотентна сама по себе.
+'''
+from itertools import chain
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Max
+
+from posts import cards, caching, counters, feed, search
+from posts.models import Comment, Follow, Group, Post, User
+from yatube.constants import API_BATCH_SIZE
+
+from .models import IdempotencyKey
+
+CREATED = 'created'
+EXISTS = 'exists'
+INVALID = 'invalid'
+DELETED = 'deleted'
+MISSING = 'missing'
+
+FOLLOW = 'follow'
+UNFOLLOW = 'unfollow'
+
+REQUIRED = 'Это поле необходимо заполнить'
+
+
+class BatchError(Exception):
+    '''Тело запроса — не список элементов допустимой длины.'''
+
+
+def result(key, status, object_id=None, errors=None):
+    item = {'key': key, 'status': status}
+    if object_id is not None:
+        item['id'] = object_id
+    if errors:
+        item['errors'] = errors
+    return item
+
+
+def _items(items):
+    if not isinstance(items, list) or not items:
+        raise BatchError('Ожидается непустой список items')
+    if len(items) > API_BATCH_SIZE:
+        raise BatchError(f'Не больше {API_BATCH_SIZE} элементов за раз')
+    return [item if isinstance(item, dict) else {} for item in items]
+
+
+def _key(item, errors):
+    key = item.get('key')
+    max_length = IdempotencyKey._meta.get_field('key').max_length
+    if key is not None and (not isinstance(key, str)
+                            or not 0 < len(key) <= max_length):
+        errors['key'] = f'Строка до {max_length} символов'
+        return None
+    return key
+
+
+def _text(item, errors):
+    text = item.get('text')
+    if not isinstance(text, str) or not text.strip():
+        errors['text'] = REQUIRED
+    return text
+
+
+def _reserve_sqlite_ids(model, count):
+    '''Первый из ``count`` id, взятых из ``sqlite_sequence``.
+
+    Таблицы Django в SQLite объявлены с AUTOINCREMENT: id удалённых
+    строк больше не выдаются, и счётчик таблицы хранится в
+    ``sqlite_sequence``. Блок id сдвигает этот счётчик; первая запись
+    в транзакции держит блокировку до конца, так что параллельный пакет
+    получит следующий блок.
+    '''
+    table, pk = model._meta.db_table, model._meta.pk.column
+    top = f'(SELECT COALESCE(MAX({pk}), 0) FROM {table})'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE sqlite_sequence SET seq = MAX(seq, {top}) + %s '
+            f'WHERE name = %s', [count, table])
+        if not cursor.rowcount:
+            cursor.execute(
+                f'INSERT INTO sqlite_sequence (name, seq) '
+                f'VALUES (%s, {top} + %s)', [table, count])
+        cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s',
+                       [table])
+        return cursor.fetchone()[0] - count + 1
+
+
+def _assign_ids(model, objects):
+    '''Первичные ключи заранее там, где ``bulk_create`` их не вернёт.'''
+    if connection.features.can_return_ids_from_bulk_insert:
+        return
+    if connection.vendor == 'sqlite':
+        first = _reserve_sqlite_ids(model, len(objects))
+    else:
+        first = (model.objects.aggregate(top=Max('pk'))['top'] or 0) + 1
+    for number, obj in enumerate(objects):
+        obj.pk = first + number
+
+
+class Collision(Exception):
+    '''Параллельный запрос уже записал тот же ключ или подписку.'''
+
+
+def _insert_unique(model, objects):
+    '''``bulk_create`` строк с уникальным ключом: занятый — ``Collision``.'''
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create(objects)
+    except IntegrityError as error:
+        raise Collision from error
+
+
+def _retrying(write):
+    '''Повторяет пакет, если параллельный запрос занял тот же ключ.
+
+    Прочие нарушения ограничений базы не прячутся: повторяется только
+    ``Collision``, которую поднимают сами функции записи.
+    '''
+    def wrapper(*args):
+        try:
+            return write(*args)
+        except Collision:
+            return write(*args)
+    return wrapper
+
+
+def _create(user, kind, items, clean, created):
+    '''Общий ход создания: ``clean(item, errors)`` строит объект.'''
+    results = [None] * len(items)
+    pending, first_with_key = [], {}
+    for index, item in enumerate(items):
+        errors = {}
+        key = _key(item, errors)
+        obj = clean(item, errors)
+        if errors:
+            results[index] = result(key, INVALID, errors=errors)
+        elif key is None or key not in first_with_key:
+            pending.append((index, key, obj))
+            if key is not None:
+                first_with_key[key] = index
+    known = dict(IdempotencyKey.objects.filter(
+        user=user, kind=kind, key__in=list(first_with_key),
+    ).values_list('key', 'object_id'))
+    new = [(index, key, obj) for index, key, obj in pending
+           if key not in known]
+    objects = [obj for _, _, obj in new]
+    model = type(objects[0]) if objects else None
+    with transaction.atomic():
+        if objects:
+            _assign_ids(model, objects)
+            model.objects.bulk_create(objects)
+            _insert_unique(IdempotencyKey, [
+                IdempotencyKey(user=user, kind=kind, key=key,
+                               object_id=obj.pk)
+                for _, key, obj in new if key is not None])
+            created(objects)
+    for index, key, obj in new:
+        results[index] = result(key, CREATED, obj.pk)
+        if key is not None:
+            known[key] = obj.pk
+    for index, item in enumerate(items):
+        if results[index] is None:
+            key = item['key']
+            results[index] = result(key, EXISTS, known[key])
+    return results
+
+
+def _posts_created(posts):
+    counters.posts_added(posts)
+    cards.add_posts(posts)
+    feed.fan_out_posts(posts)
+    for post in posts:
+        search.index_post(post)
+    caching.bump(*set(chain.from_iterable(
+        caching.post_scopes(post) for post in posts)))
+
+
+@_retrying
+def create_posts(user, items):
+    '''Посты пользователя из элементов ``{"key", "text", "group"}``.'''
+    items = _items(items)
+    slugs = {item.get('group') for item in items
+             if isinstance(item.get('group'), str)}
+    groups = dict(Group.objects.filter(slug__in=slugs).values_list(
+        'slug', 'pk'))
+
+    def clean(item, errors):
+        text = _text(item, errors)
+        group = item.get('group')
+        group_id = groups.get(group) if isinstance(group, str) else None
+        if group is not None and group_id is None:
+            errors['group'] = 'Нет такой группы'
+        return Post(author=user, text=text, group_id=group_id)
+
+    return _create(user, IdempotencyKey.POST, items, clean, _posts_created)
+
+
+def _comments_created(comments):
+    counters.comments_added(comments)
+    for comment in comments:
+        search.index_comment(comment)
+    caching.bump(*{caching.post_scope(comment.post_id)
+                   for comment in comments})
+
+
+@_retrying
+def create_comments(user, items):
+    '''Комментарии из элементов ``{"key", "post", "text"}``.'''
+    items = _items(items)
+    post_ids = set(Post.objects.filter(pk__in={
+        item.get('post') for item in items
+        if type(item.get('post')) is int
+    }).values_list('pk', flat=True))
+
+    def clean(item, errors):
+        text = _text(item, errors)
+        post_id = item.get('post')
+        if type(post_id) is not int or post_id not in post_ids:
+            errors['post'] = 'Нет такого поста'
+        return Comment(author=user, post_id=post_id, text=text)
+
+    return _create(user, IdempotencyKey.COMMENT, items, clean,
+                   _comments_created)
+
+
+@_retrying
+def change_follows(user, items):
+    '''Подписки и отписки из элементов ``{"key", "author", "action"}``.
+
+    Элементы применяются по порядку, а в базу уходит только итог:
+    подписка и отписка на одного автора в одном пакете гасят друг друга.
+    '''
+    items = _items(items)
+    authors = dict(User.objects.filter(username__in={
+        item.get('author') for item in items
+        if isinstance(item.get('author'), str)
+    }).values_list('username', 'pk'))
+    before = set(Follow.objects.filter(
+        user=user, author_id__in=authors.values(),
+    ).values_list('author_id', flat=True))
+    after, results = set(before), []
+    for item in items:
+        errors = {}
+        key = _key(item, errors)
+        action = item.get('action', FOLLOW)
+        author = item.get('author')
+        author_id = authors.get(author) if isinstance(author, str) else None
+        if author_id is None:
+            errors['author'] = 'Нет такого автора'
+        elif author_id == user.pk:
+            errors['author'] = 'Нельзя подписаться на себя'
+        if action not in (FOLLOW, UNFOLLOW):
+            errors['action'] = f'{FOLLOW} или {UNFOLLOW}'
+        if errors:
+            results.append(result(key, INVALID, errors=errors))
+        elif action == FOLLOW:
+            results.append(result(key, EXISTS if author_id in after
+                                  else CREATED))
+            after.add(author_id)
+        else:
+            results.append(result(key, DELETED if author_id in after
+                                  else MISSING))
+            after.discard(author_id)
+    follows = [Follow(user=user, author_id=author_id)
+               for author_id in after - before]
+    with transaction.atomic():
+        if follows:
+            _insert_unique(Follow, follows)
+            counters.follows_added(follows)
+            for follow in follows:
+                feed.backfill_feed(user.pk, follow.author_id)
+            caching.follow_changed(follows[0])
+        if before - after:
+            # Удаление через ORM: обработчики сигналов уберут автора
+            # из ленты и поправят счётчики.
+            Follow.objects.filter(
+                user=user, author_id__in=before - after).delete()
+    return results
@@ -0,0 +1,13 @@
+'''Встроенные бэкенды Django со счётчиками попаданий.'''
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from .stats import StatsMixin
+
+
+class StatsLocMemCache(StatsMixin, LocMemCache):
+    pass
+
+
+class StatsFileBasedCache(StatsMixin, FileBasedCache):
+    pass
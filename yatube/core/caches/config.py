@@ -0,0 +1,80 @@
+'''Настройка кэша из одной строки окружения ``CACHE_URL``.
+
+Поддерживаемые схемы::
+
+    locmem://[name]                    память процесса (по умолчанию)
+    file:///var/tmp/yatube-cache       файлы, общие для воркеров
+    sqlite:///var/tmp/yatube-cache.db  файл SQLite, общий для воркеров
+    memcached://host:port[,host:port]  memcached и совместимые серверы
+    dummy://                           кэш отключён
+
+Параметры строки запроса: ``timeout``, ``max_entries``,
+``cull_frequency``, ``key_prefix``, ``version``. Все бэкенды, кроме
+``dummy``, считают попадания (см. ``core.caches.stats``).
+'''
+from urllib.parse import parse_qsl, urlsplit
+
+from django.core.exceptions import ImproperlyConfigured
+
+BACKENDS = {
+    'locmem': 'core.caches.builtin.StatsLocMemCache',
+    'file': 'core.caches.builtin.StatsFileBasedCache',
+    'sqlite': 'core.caches.sqlite.StatsSQLiteCache',
+    'memcached': 'core.caches.memcached.StatsMemcachedCache',
+    'dummy': 'django.core.cache.backends.dummy.DummyCache',
+}
+
+OPTIONS = ('max_entries', 'cull_frequency')
+
+
+def _number(name, value):
+    try:
+        return int(value)
+    except ValueError:
+        raise ImproperlyConfigured(
+            f'CACHE_URL: {name} должен быть целым числом, а не {value!r}')
+
+
+def _location(parts):
+    if parts.scheme in ('file', 'sqlite'):
+        if not parts.path:
+            raise ImproperlyConfigured(
+                f'CACHE_URL: для {parts.scheme}:// нужен путь к файлу')
+        return parts.path
+    if parts.scheme == 'memcached':
+        if not parts.netloc:
+            raise ImproperlyConfigured(
+                'CACHE_URL: для memcached:// нужен адрес host:port')
+        return parts.netloc.split(',')
+    return parts.netloc
+
+
+def _apply_query(config, query):
+    for name, value in parse_qsl(query):
+        if name == 'timeout':
+            config['TIMEOUT'] = (None if value == 'none'
+                                 else _number(name, value))
+        elif name == 'version':
+            config['VERSION'] = _number(name, value)
+        elif name == 'key_prefix':
+            config['KEY_PREFIX'] = value
+        elif name in OPTIONS:
+            config.setdefault('OPTIONS', {})[name.upper()] = _number(
+                name, value)
+        else:
+            raise ImproperlyConfigured(
+                f'CACHE_URL: неизвестный параметр {name!r}')
+
+
+def cache_from_url(url):
+    '''Возвращает словарь для ``CACHES`` по строке вида ``scheme://...``.'''
+    parts = urlsplit(url)
+    if parts.scheme not in BACKENDS:
+        raise ImproperlyConfigured(
+            f'CACHE_URL: неизвестная схема {parts.scheme!r}, доступны '
+            + ', '.join(sorted(BACKENDS)))
+    config = {'BACKEND': BACKENDS[parts.scheme]}
+    if parts.scheme != 'dummy':
+        config['LOCATION'] = _location(parts)
+    _apply_query(config, parts.query)
+    return config
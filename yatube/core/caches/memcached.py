@@ -0,0 +1,226 @@
+'''Бэкенд memcached без сторонних библиотек.
+
+``Client`` говорит на текстовом протоколе memcached и повторяет ту часть
+API python-memcached, которой пользуется ``BaseMemcachedCache``. Подойдёт
+любой сервер с этим протоколом: memcached, совместимый режим прокси
+или локальная замена из ``core.caches.standin``. Сокеты свои у каждого
+потока и живут между запросами; при сетевой ошибке операция
+считается промахом, как у python-memcached.
+'''
+import os
+import pickle
+import socket
+import threading
+import zlib
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.memcached import BaseMemcachedCache
+
+from .stats import StatsMixin
+
+FLAG_BYTES = 0
+FLAG_PICKLE = 1
+FLAG_INT = 2
+FLAG_TEXT = 4
+
+SOCKET_TIMEOUT = 3
+
+
+class ProtocolError(Exception):
+    '''Сервер ответил не по протоколу memcached.'''
+
+
+def encode(value):
+    if isinstance(value, bool):
+        return FLAG_PICKLE, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    if isinstance(value, int):
+        return FLAG_INT, str(value).encode()
+    if isinstance(value, bytes):
+        return FLAG_BYTES, value
+    if isinstance(value, str):
+        return FLAG_TEXT, value.encode()
+    return FLAG_PICKLE, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def decode(flags, data):
+    if flags == FLAG_INT:
+        return int(data)
+    if flags == FLAG_TEXT:
+        return data.decode()
+    if flags == FLAG_PICKLE:
+        return pickle.loads(data)
+    return data
+
+
+class Connection:
+    def __init__(self, address, timeout):
+        host, _, port = address.rpartition(':')
+        self.sock = socket.create_connection((host, int(port)), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+
+    def send(self, *chunks):
+        self.sock.sendall(b''.join(chunks))
+
+    def readline(self):
+        line = self.reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ProtocolError('соединение закрыто сервером')
+        return line[:-2]
+
+    def read(self, size):
+        data = self.reader.read(size + 2)
+        if len(data) != size + 2:
+            raise ProtocolError('соединение закрыто сервером')
+        return data[:-2]
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+class Client:
+    def __init__(self, servers, socket_timeout=SOCKET_TIMEOUT, **options):
+        self.servers = [server.strip() for server in servers
+                        if server.strip()]
+        self.timeout = socket_timeout
+        self._local = threading.local()
+
+    def _server_for(self, key):
+        if len(self.servers) == 1:
+            return self.servers[0]
+        return self.servers[zlib.crc32(key.encode()) % len(self.servers)]
+
+    def _connection(self, server):
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.connections = {}
+            self._local.pid = os.getpid()
+        connection = self._local.connections.get(server)
+        if connection is None:
+            connection = Connection(server, self.timeout)
+            self._local.connections[server] = connection
+        return connection
+
+    def _call(self, server, request, fallback):
+        '''Выполняет запрос; при сетевой ошибке закрывает соединение.'''
+        try:
+            return request(self._connection(server))
+        except (OSError, ProtocolError):
+            self._drop(server)
+            return fallback
+
+    def _drop(self, server):
+        connection = getattr(self._local, 'connections', {}).pop(server, None)
+        if connection is not None:
+            try:
+                connection.close()
+            except OSError:
+                pass
+
+    def get(self, key):
+        return self.get_multi([key]).get(key)
+
+    def get_multi(self, keys):
+        by_server = {}
+        for key in keys:
+            by_server.setdefault(self._server_for(key), []).append(key)
+        found = {}
+        for server, server_keys in by_server.items():
+            found.update(self._call(
+                server, lambda c: self._get(c, server_keys), {}))
+        return found
+
+    @staticmethod
+    def _get(connection, keys):
+        connection.send(b'get ', ' '.join(keys).encode(), b'\r\n')
+        found = {}
+        while True:
+            line = connection.readline()
+            if line == b'END':
+                return found
+            parts = line.split()
+            if len(parts) < 4 or parts[0] != b'VALUE':
+                raise ProtocolError(line)
+            data = connection.read(int(parts[3]))
+            found[parts[1].decode()] = decode(int(parts[2]), data)
+
+    def _store(self, command, key, value, time):
+        flags, data = encode(value)
+        header = '{} {} {} {} {}\r\n'.format(
+            command, key, flags, int(time), len(data)).encode()
+
+        def request(connection):
+            connection.send(header, data, b'\r\n')
+            return connection.readline() == b'STORED'
+        return self._call(self._server_for(key), request, False)
+
+    def set(self, key, value, time=0):
+        return self._store('set', key, value, time)
+
+    def add(self, key, value, time=0):
+        return self._store('add', key, value, time)
+
+    def set_multi(self, mapping, time=0):
+        return [key for key, value in mapping.items()
+                if not self.set(key, value, time)]
+
+    def delete(self, key):
+        def request(connection):
+            connection.send('delete {}\r\n'.format(key).encode())
+            return connection.readline() == b'DELETED'
+        return self._call(self._server_for(key), request, False)
+
+    def delete_multi(self, keys):
+        return all([self.delete(key) for key in keys])
+
+    def _arith(self, command, key, delta):
+        def request(connection):
+            connection.send('{} {} {}\r\n'.format(
+                command, key, int(delta)).encode())
+            line = connection.readline()
+            return None if line == b'NOT_FOUND' else int(line)
+        return self._call(self._server_for(key), request, None)
+
+    def incr(self, key, delta=1):
+        return self._arith('incr', key, delta)
+
+    def decr(self, key, delta=1):
+        return self._arith('decr', key, delta)
+
+    def touch(self, key, time=0):
+        def request(connection):
+            connection.send('touch {} {}\r\n'.format(key, int(time)).encode())
+            return connection.readline() == b'TOUCHED'
+        return self._call(self._server_for(key), request, False)
+
+    def flush_all(self):
+        for server in self.servers:
+            self._call(server, lambda c: (c.send(b'flush_all\r\n'),
+                                          c.readline()), None)
+
+    def disconnect_all(self):
+        for server in list(getattr(self._local, 'connections', {})):
+            self._drop(server)
+
+
+class MemcachedCache(BaseMemcachedCache):
+    '''Memcached через встроенный ``Client``, без python-memcached.'''
+
+    def __init__(self, server, params):
+        import core.caches.memcached as library
+        super().__init__(server, params, library=library,
+                         value_not_found_exception=ValueError)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._cache.touch(key, self.get_backend_timeout(timeout))
+
+    def close(self, **kwargs):
+        # Соединения принадлежат потокам и переиспользуются между
+        # запросами, закрывать их в конце каждого запроса незачем.
+        pass
+
+
+class StatsMemcachedCache(StatsMixin, MemcachedCache):
+    pass
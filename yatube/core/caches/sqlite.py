@@ -0,0 +1,208 @@
+'''Общий для процессов кэш в отдельном файле SQLite.
+
+Не требует внешних сервисов: все воркеры на одной машине открывают один
+файл в режиме WAL, поэтому читатели не блокируют друг друга, а запись
+ждёт не дольше ``busy_timeout``. Соединение своё у каждого потока и
+пересоздаётся после fork.
+'''
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .stats import StatsMixin
+
+BUSY_TIMEOUT = 5
+CULL_EVERY = 100
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache_entry ('
+    ' key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)',
+    'CREATE INDEX IF NOT EXISTS cache_entry_expires ON cache_entry (expires)',
+)
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+        self._sets = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self._path, timeout=BUSY_TIMEOUT,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def _alive(now):
+        return '(expires IS NULL OR expires > {})'.format(float(now))
+
+    def _write(self, statements):
+        '''Выполняет запросы одной транзакцией с блокировкой записи.'''
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            result = statements(connection)
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return result
+
+    def _fetch(self, keys, version):
+        key_map = {self.make_key(key, version=version): key for key in keys}
+        if not key_map:
+            return {}
+        for key in key_map:
+            self.validate_key(key)
+        rows = self._connection().execute(
+            'SELECT key, value FROM cache_entry WHERE key IN ({}) AND {}'
+            .format(','.join('?' * len(key_map)), self._alive(time.time())),
+            list(key_map),
+        ).fetchall()
+        return {key_map[key]: pickle.loads(value) for key, value in rows}
+
+    def get(self, key, default=None, version=None):
+        return self._fetch([key], version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        return self._fetch(keys, version)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._connection().execute(
+            'SELECT 1 FROM cache_entry WHERE key = ? AND {}'.format(
+                self._alive(time.time())),
+            (key,),
+        ).fetchone() is not None
+
+    def _store(self, connection, key, value, timeout):
+        connection.execute(
+            'INSERT OR REPLACE INTO cache_entry (key, value, expires) '
+            'VALUES (?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+             self.get_backend_timeout(timeout)),
+        )
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        entries = [(self.make_key(key, version=version), value)
+                   for key, value in data.items()]
+        for key, _ in entries:
+            self.validate_key(key)
+
+        def store(connection):
+            for key, value in entries:
+                self._store(connection, key, value, timeout)
+        self._write(store)
+        self._maybe_cull(len(entries))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+
+        def store(connection):
+            connection.execute(
+                'DELETE FROM cache_entry WHERE key = ? AND NOT {}'.format(
+                    self._alive(time.time())),
+                (key,),
+            )
+            exists = connection.execute(
+                'SELECT 1 FROM cache_entry WHERE key = ?', (key,)).fetchone()
+            if exists:
+                return False
+            self._store(connection, key, value, timeout)
+            return True
+        added = self._write(store)
+        if added:
+            self._maybe_cull(1)
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+
+        def update(connection):
+            row = connection.execute(
+                'SELECT value FROM cache_entry WHERE key = ? AND {}'.format(
+                    self._alive(time.time())),
+                (key,),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                'UPDATE cache_entry SET value = ? WHERE key = ?',
+                (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key),
+            )
+            return value
+        return self._write(update)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._write(lambda connection: connection.execute(
+            'UPDATE cache_entry SET expires = ? WHERE key = ? AND {}'.format(
+                self._alive(time.time())),
+            (self.get_backend_timeout(timeout), key),
+        ).rowcount == 1)
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        for key in keys:
+            self.validate_key(key)
+        self._write(lambda connection: connection.executemany(
+            'DELETE FROM cache_entry WHERE key = ?',
+            [(key,) for key in keys],
+        ))
+
+    def clear(self):
+        self._write(lambda connection: connection.execute(
+            'DELETE FROM cache_entry'))
+
+    def _maybe_cull(self, written):
+        # Проверять размер на каждой записи дорого: раз в CULL_EVERY.
+        self._sets += written
+        if self._sets < CULL_EVERY:
+            return
+        self._sets = 0
+        self._write(self._cull)
+
+    def _cull(self, connection):
+        connection.execute(
+            'DELETE FROM cache_entry WHERE NOT {}'.format(
+                self._alive(time.time())))
+        count = connection.execute(
+            'SELECT COUNT(*) FROM cache_entry').fetchone()[0]
+        if count > self._max_entries and self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache_entry')
+        elif count > self._max_entries:
+            connection.execute(
+                'DELETE FROM cache_entry WHERE key IN ('
+                ' SELECT key FROM cache_entry'
+                ' ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency,),
+            )
+
+
+class StatsSQLiteCache(StatsMixin, SQLiteCache):
+    pass
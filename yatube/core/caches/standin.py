@@ -0,0 +1,165 @@
+'''Локальная замена memcached для тестов и разработки.
+
+Понимает подмножество текстового протокола, которым пользуется
+``core.caches.memcached.Client``: get/gets, set/add/replace, delete,
+incr/decr, touch и flush_all. Данные хранятся в памяти процесса.
+
+Запуск: ``python -m core.caches.standin 127.0.0.1:11211``.
+'''
+import socketserver
+import sys
+import threading
+import time
+
+# Время жизни больше 30 дней memcached считает абсолютным timestamp.
+RELATIVE_LIMIT = 60 * 60 * 24 * 30
+
+
+class Storage:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = {}
+
+    @staticmethod
+    def expires_at(exptime):
+        exptime = int(exptime)
+        if exptime == 0:
+            return None
+        if exptime < 0:
+            return 0
+        if exptime > RELATIVE_LIMIT:
+            return exptime
+        return time.time() + exptime
+
+    def lookup(self, key):
+        item = self.items.get(key)
+        if item is None:
+            return None
+        if item[2] is not None and item[2] <= time.time():
+            del self.items[key]
+            return None
+        return item
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            parts = line.decode().split()
+            if not parts:
+                continue
+            command = parts[0]
+            if command == 'quit':
+                return
+            handler = getattr(self, 'do_' + command, None)
+            if handler is None:
+                self.reply('ERROR')
+                continue
+            with self.server.storage.lock:
+                handler(self.server.storage, parts[1:])
+
+    def reply(self, *lines):
+        self.wfile.write(b''.join(
+            (line if isinstance(line, bytes) else line.encode()) + b'\r\n'
+            for line in lines))
+
+    def do_get(self, storage, keys):
+        lines = []
+        for key in keys:
+            item = storage.lookup(key)
+            if item is not None:
+                lines.append('VALUE {} {} {}'.format(key, item[0],
+                                                     len(item[1])))
+                lines.append(item[1])
+        self.reply(*lines, 'END')
+
+    do_gets = do_get
+
+    def _store(self, storage, args, condition):
+        key, flags, exptime, size = args[:4]
+        data = self.rfile.read(int(size) + 2)[:-2]
+        if not condition(storage.lookup(key)):
+            self.reply('NOT_STORED')
+            return
+        storage.items[key] = (int(flags), data, storage.expires_at(exptime))
+        self.reply('STORED')
+
+    def do_set(self, storage, args):
+        self._store(storage, args, lambda item: True)
+
+    def do_add(self, storage, args):
+        self._store(storage, args, lambda item: item is None)
+
+    def do_replace(self, storage, args):
+        self._store(storage, args, lambda item: item is not None)
+
+    def do_delete(self, storage, args):
+        if storage.lookup(args[0]) is None:
+            self.reply('NOT_FOUND')
+            return
+        del storage.items[args[0]]
+        self.reply('DELETED')
+
+    def _arith(self, storage, args, sign):
+        item = storage.lookup(args[0])
+        if item is None:
+            self.reply('NOT_FOUND')
+            return
+        if not item[1].isdigit():
+            self.reply('CLIENT_ERROR cannot increment or decrement '
+                       'non-numeric value')
+            return
+        value = max(int(item[1]) + sign * int(args[1]), 0)
+        storage.items[args[0]] = (item[0], str(value).encode(), item[2])
+        self.reply(str(value))
+
+    def do_incr(self, storage, args):
+        self._arith(storage, args, 1)
+
+    def do_decr(self, storage, args):
+        self._arith(storage, args, -1)
+
+    def do_touch(self, storage, args):
+        item = storage.lookup(args[0])
+        if item is None:
+            self.reply('NOT_FOUND')
+            return
+        storage.items[args[0]] = (item[0], item[1],
+                                  storage.expires_at(args[1]))
+        self.reply('TOUCHED')
+
+    def do_flush_all(self, storage, args):
+        storage.items.clear()
+        self.reply('OK')
+
+
+class StandInServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0)):
+        super().__init__(address, Handler)
+        self.storage = Storage()
+
+    @property
+    def location(self):
+        return '{}:{}'.format(*self.server_address[:2])
+
+    def start(self):
+        '''Запускает сервер в фоновом потоке и возвращает его адрес.'''
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.location
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    host, _, port = (sys.argv[1] if len(sys.argv) > 1
+                     else '127.0.0.1:11211').rpartition(':')
+    server = StandInServer((host, int(port)))
+    print('memcached stand-in на', server.location)
+    server.serve_forever()
@@ -0,0 +1,113 @@
+'''Счётчики попаданий и промахов кэша, общие для всех воркеров.
+
+Каждый процесс копит счётчики у себя и раз в ``STATS_FLUSH_EVERY``
+обращений добавляет их в сам кэш через ``incr``. При общем бэкенде
+(SQLite, файлы, memcached) так видна доля попаданий по всем воркерам.
+'''
+import threading
+from contextlib import contextmanager
+
+from django.core.cache import caches
+
+from core import metrics
+
+STATS_FLUSH_EVERY = 100
+STATS_KEYS = {'hits': 'cache-stats:hits', 'misses': 'cache-stats:misses'}
+
+_MISSING = object()
+
+
+class StatsMixin:
+    '''Подмешивается к бэкенду кэша и считает его get/get_many.'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._stats_local = threading.local()
+        self._pending = {'hits': 0, 'misses': 0}
+        self.local_stats = {'hits': 0, 'misses': 0}
+
+    def _counting(self):
+        return not getattr(self._stats_local, 'suspended', False)
+
+    @contextmanager
+    def _uncounted(self):
+        '''Служебные чтения (в том числе вложенные get базового класса).'''
+        previous = getattr(self._stats_local, 'suspended', False)
+        self._stats_local.suspended = True
+        try:
+            yield
+        finally:
+            self._stats_local.suspended = previous
+
+    def _record(self, hits, misses):
+        if not self._counting():
+            return
+        metrics.record_cache(hits, misses)
+        with self._stats_lock:
+            for name, delta in (('hits', hits), ('misses', misses)):
+                self._pending[name] += delta
+                self.local_stats[name] += delta
+            due = sum(self._pending.values()) >= STATS_FLUSH_EVERY
+        if due:
+            self.flush_stats()
+
+    def flush_stats(self):
+        '''Переносит накопленные счётчики процесса в общий кэш.'''
+        with self._stats_lock:
+            pending, self._pending = self._pending, {'hits': 0, 'misses': 0}
+        with self._uncounted():
+            for name, delta in pending.items():
+                if not delta:
+                    continue
+                key = STATS_KEYS[name]
+                self.add(key, 0, None)
+                try:
+                    self.incr(key, delta)
+                except ValueError:
+                    self.set(key, delta, None)
+
+    def shared_stats(self):
+        self.flush_stats()
+        with self._uncounted():
+            values = self.get_many(STATS_KEYS.values())
+        return {name: int(values.get(key) or 0)
+                for name, key in STATS_KEYS.items()}
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._record(0, 1)
+            return default
+        self._record(1, 0)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        with self._uncounted():
+            found = super().get_many(keys, version=version)
+        self._record(len(found), len(keys) - len(found))
+        return found
+
+    def has_key(self, key, version=None):
+        with self._uncounted():
+            return super().has_key(key, version=version)
+
+    def add(self, *args, **kwargs):
+        with self._uncounted():
+            return super().add(*args, **kwargs)
+
+    def incr(self, *args, **kwargs):
+        with self._uncounted():
+            return super().incr(*args, **kwargs)
+
+
+def cache_stats(alias='default'):
+    '''Сводка попаданий по всем воркерам: hits, misses и hit_ratio.'''
+    backend = caches[alias]
+    if not isinstance(backend, StatsMixin):
+        return None
+    stats = backend.shared_stats()
+    total = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / total if total else 0.0
+    return stats
@@ -0,0 +1,56 @@
+'''Профили базы данных SQLite.
+
+``development`` — файл с настройками SQLite по умолчанию.
+
+``production`` включает WAL: читатели не ждут писателя, а писатели
+не ждут читателей. Кроме того, профиль отдаёт под страницы только
+для чтения отдельный псевдоним ``replica`` — тот же файл, открытый
+в режиме ``mode=ro`` с ``query_only``; маршрутизирует туда
+``core.db.routers.ReadReplicaRouter``. Соединения обоих псевдонимов
+берутся из пула (``core.db.pool``), а не открываются на каждый запрос.
+'''
+from urllib.parse import quote
+
+from django.core.exceptions import ImproperlyConfigured
+
+REPLICA = 'replica'
+PROFILES = ('development', 'production')
+
+# Общие прагмы соединений рабочего профиля.
+TUNING = {
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+# Писатель в SQLite всё равно один, поэтому пул записи меньше.
+WRITE_POOL = {'SIZE': 8, 'TIMEOUT': 5, 'MAX_AGE': 600, 'CHECK_INTERVAL': 30}
+READ_POOL = {**WRITE_POOL, 'SIZE': 32}
+
+
+def sqlite_databases(path, profile='development'):
+    '''Словарь ``DATABASES`` для файла ``path`` в выбранном профиле.'''
+    if profile not in PROFILES:
+        raise ImproperlyConfigured(
+            f'Неизвестный профиль базы {profile!r}; доступны: '
+            + ', '.join(PROFILES))
+    if profile == 'development':
+        return {'default': {'ENGINE': 'django.db.backends.sqlite3',
+                            'NAME': path}}
+    return {
+        'default': {
+            'ENGINE': 'core.db.sqlite',
+            'NAME': path,
+            'PRAGMAS': {'journal_mode': 'WAL', **TUNING},
+            'TRANSACTION_MODE': 'IMMEDIATE',
+            'POOL': WRITE_POOL,
+        },
+        REPLICA: {
+            'ENGINE': 'core.db.sqlite',
+            'NAME': f'file:{quote(path)}?mode=ro',
+            'PRAGMAS': {**TUNING, 'query_only': 'ON'},
+            'POOL': READ_POOL,
+            'TEST': {'MIRROR': 'default'},
+        },
+    }
@@ -0,0 +1,209 @@
+'''Пул соединений с базой внутри процесса.
+
+Django держит по соединению на поток и псевдоним; при
+``CONN_MAX_AGE = 0`` оно закрывается в конце каждого запроса. Бэкенды
+с ``PooledConnectionMixin`` вместо закрытия возвращают соединение в пул,
+а новое берут из пула. Так стоимость открытия соединения (для SQLite —
+ещё и прагмы) платится один раз, а число соединений процесса ограничено
+независимо от числа потоков.
+
+Настройка — ключ ``POOL`` в настройках базы::
+
+    'POOL': {
+        'SIZE': 16,           # соединений на процесс
+        'TIMEOUT': 5,         # секунд ждать свободного соединения
+        'MAX_AGE': 600,       # секунд жизни соединения
+        'CHECK_INTERVAL': 30, # проверять простаивавшее дольше этого
+    }
+
+Без ключа ``POOL`` бэкенд работает как обычный.
+'''
+import os
+import threading
+from time import monotonic
+
+from core import metrics
+
+DEFAULTS = {'SIZE': 16, 'TIMEOUT': 5, 'MAX_AGE': 600, 'CHECK_INTERVAL': 30}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+def check(connection):
+    '''Проверка живости соединения: пустой запрос.'''
+    cursor = connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+    finally:
+        cursor.close()
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+class Pool:
+    def __init__(self, alias, size, timeout, max_age, check_interval):
+        self.alias = alias
+        self.size = size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self._idle = []
+        self._created = {}
+        self._open = 0
+        self._condition = threading.Condition()
+
+    def _event(self, name):
+        metrics.POOL_CONNECTIONS.inc((self.alias, name))
+
+    def _take(self):
+        '''Свободное соединение, None — можно открыть новое.
+
+        Вызывается под блокировкой; ждёт, пока пул полон.
+        '''
+        deadline = monotonic() + self.timeout
+        while True:
+            while self._idle:
+                connection, released = self._idle.pop()
+                if monotonic() - self._created[connection] > self.max_age:
+                    self._forget(connection)
+                    self._event('recycled')
+                    continue
+                return connection, released
+            if self._open < self.size:
+                self._open += 1
+                return None, None
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                raise PoolExhausted(
+                    f'Нет свободного соединения с {self.alias} '
+                    f'за {self.timeout} с')
+            self._condition.wait(remaining)
+
+    def acquire(self, connect):
+        '''Соединение из пула или новое через ``connect()``.'''
+        while True:
+            with metrics.timed('pool', metrics.POOL_WAIT_SECONDS,
+                               (self.alias,)):
+                with self._condition:
+                    connection, released = self._take()
+            if connection is None:
+                return self._connect(connect)
+            if monotonic() - released < self.check_interval:
+                self._event('reused')
+                return connection
+            try:
+                check(connection)
+            except Exception:
+                self.discard(connection)
+                self._event('broken')
+                continue
+            self._event('reused')
+            return connection
+
+    def _connect(self, connect):
+        try:
+            connection = connect()
+        except Exception:
+            with self._condition:
+                self._open -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._created[connection] = monotonic()
+        self._event('created')
+        return connection
+
+    def release(self, connection):
+        '''Возвращает соединение в пул или закрывает старое.'''
+        with self._condition:
+            created = self._created.get(connection)
+            if created is not None and monotonic() - created <= self.max_age:
+                self._idle.append((connection, monotonic()))
+                self._condition.notify()
+                return
+        self.discard(connection)
+        self._event('recycled')
+
+    def discard(self, connection):
+        with self._condition:
+            self._forget(connection)
+
+    def _forget(self, connection):
+        _close_quietly(connection)
+        if self._created.pop(connection, None) is not None:
+            self._open -= 1
+            self._condition.notify()
+
+    def close_idle(self):
+        with self._condition:
+            while self._idle:
+                self._forget(self._idle.pop()[0])
+
+    @property
+    def stats(self):
+        with self._condition:
+            return {'open': self._open, 'idle': len(self._idle)}
+
+
+def pool_for(alias, settings_dict):
+    '''Пул псевдонима в текущем процессе или None, если пул не настроен.
+
+    После fork дочерний процесс получает свои пулы: соединения родителя
+    в нём не используются.
+    '''
+    options = settings_dict.get('POOL')
+    if options is None:
+        return None
+    key = (os.getpid(), alias, settings_dict['NAME'])
+    with _pools_lock:
+        if key not in _pools:
+            options = {**DEFAULTS, **options}
+            _pools[key] = Pool(
+                alias, options['SIZE'], options['TIMEOUT'],
+                options['MAX_AGE'], options['CHECK_INTERVAL'])
+        return _pools[key]
+
+
+class PooledConnectionMixin:
+    '''Подмешивается к ``DatabaseWrapper`` бэкенда.'''
+
+    @property
+    def pool(self):
+        return pool_for(self.alias, self.settings_dict)
+
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        pool = self.pool
+        if pool is None:
+            return connect(conn_params)
+        try:
+            return pool.acquire(lambda: connect(conn_params))
+        except PoolExhausted as error:
+            raise self.Database.OperationalError(str(error)) from error
+
+    def _close(self):
+        pool = self.pool
+        if pool is None:
+            return super()._close()
+        connection = self.connection
+        # Соединение, закрытое внутри atomic, остаётся у обёртки до
+        # отката: отдавать его другому потоку нельзя.
+        if self.in_atomic_block:
+            pool.discard(connection)
+            return
+        try:
+            connection.rollback()
+        except self.Database.Error:
+            pool.discard(connection)
+            return
+        pool.release(connection)
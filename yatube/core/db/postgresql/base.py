@@ -0,0 +1,11 @@
+'''Бэкенд PostgreSQL с пулом соединений (ключ ``POOL``, см. ``core.db.pool``).
+
+Нужен ``psycopg2``, как и стандартному бэкенду Django.
+'''
+from django.db.backends.postgresql import base
+
+from core.db.pool import PooledConnectionMixin
+
+
+class DatabaseWrapper(PooledConnectionMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,67 @@
+'''Чтение страниц, которые ничего не пишут, из псевдонима ``replica``.
+
+Такие представления помечает декоратор ``read_only``.
+``ReadOnlyViewMiddleware`` включает маршрутизацию на время GET- и
+HEAD-запроса к ним, и ``ReadReplicaRouter`` отправляет чтения
+в реплику. Запись всегда идёт в ``default``. Без псевдонима ``replica``
+в настройках всё читается из ``default``.
+'''
+import threading
+
+from django.db import connections
+
+from core.db.config import REPLICA
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+_local = threading.local()
+
+
+def read_only(view):
+    '''Помечает представление, которому хватает реплики.'''
+    view.read_only = True
+    return view
+
+
+def replica_configured():
+    '''Есть отдельная реплика.
+
+    Тестовое зеркало указывает на ту же базу, что и ``default``: читать
+    через него значит не видеть данных из транзакции теста.
+    '''
+    databases = connections.databases
+    return (REPLICA in databases
+            and databases[REPLICA]['NAME'] != databases['default']['NAME'])
+
+
+def replica_enabled():
+    return getattr(_local, 'enabled', False) and replica_configured()
+
+
+class ReadOnlyViewMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            _local.enabled = False
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _local.enabled = (request.method in SAFE_METHODS
+                          and getattr(view_func, 'read_only', False))
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return REPLICA if replica_enabled() else None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
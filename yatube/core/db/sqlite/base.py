@@ -0,0 +1,30 @@
+'''Бэкенд SQLite с настройкой соединения и пулом соединений.
+
+Ключ ``PRAGMAS`` в настройках базы — словарь ``имя: значение``;
+прагмы выполняются при открытии соединения. Ключ ``TRANSACTION_MODE``
+(например, ``IMMEDIATE``) задаёт, как начинаются транзакции: с
+``BEGIN IMMEDIATE`` писатель берёт блокировку сразу и ждёт её
+``busy_timeout``, а не получает ``database is locked`` посреди
+транзакции, когда чтение приходится повышать до записи. Ключ ``POOL``
+включает пул соединений (см. ``core.db.pool``).
+'''
+from django.db.backends.sqlite3 import base
+
+from core.db.pool import PooledConnectionMixin
+
+
+class PragmasMixin:
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict.get('PRAGMAS', {}).items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict.get('TRANSACTION_MODE')
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
+
+
+class DatabaseWrapper(PooledConnectionMixin, PragmasMixin,
+                      base.DatabaseWrapper):
+    pass
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.caches.stats import cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает долю попаданий в кэш по всем воркерам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alias', default='default')
+
+    def handle(self, *args, **options):
+        stats = cache_stats(options['alias'])
+        if stats is None:
+            raise CommandError('Этот бэкенд кэша не считает попадания')
+        self.stdout.write(
+            'Попаданий: {hits}, промахов: {misses}, '
+            'доля попаданий: {hit_ratio:.1%}'.format(**stats))
@@ -0,0 +1,239 @@
+'''Метрики производительности запросов.
+
+``PerformanceMiddleware`` замеряет каждый запрос: общее время, число и
+время SQL-запросов, время рендеринга шаблонов, попадания и промахи кэша,
+ожидание соединения из пула и время подготовки картинок в потоке
+запроса. Итог уходит в заголовок
+``Server-Timing`` и в гистограммы по имени URL (``posts:index``), которые
+отдаёт ``/metrics`` в текстовом формате Prometheus.
+
+Каждый SQL-запрос заодно попадает в журнал ``query_log``.
+
+Гистограммы живут в памяти процесса: при нескольких воркерах каждый
+отдаёт свои значения.
+'''
+import collections
+import threading
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from time import perf_counter
+
+from django.db import connections
+
+from core import query_log
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+POOL_BUCKETS = (0.0001, 0.001, 0.01, 0.1, 0.5, 1, 5)
+UNRESOLVED = 'unresolved'
+
+_local = threading.local()
+
+
+def _escape(value):
+    return (str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(f'{name}="{_escape(value)}"'
+                             for name, value in pairs)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f'{self.name}{_labels(self.label_names, labels)} {value}'
+
+
+class Histogram(Counter):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=TIME_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value, labels=()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = {
+                    'counts': [0] * (len(self.buckets) + 1), 'sum': 0}
+            series['counts'][index] += 1
+            series['sum'] += value
+
+    def samples(self):
+        with self._lock:
+            values = {labels: (list(series['counts']), series['sum'])
+                      for labels, series in self._values.items()}
+        for labels, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                suffix = _labels(self.label_names, labels, [('le', bound)])
+                yield f'{self.name}_bucket{suffix} {cumulative}'
+            suffix = _labels(self.label_names, labels)
+            yield f'{self.name}_sum{suffix} {total}'
+            yield f'{self.name}_count{suffix} {cumulative}'
+
+
+REQUEST_SECONDS = Histogram(
+    'yatube_request_duration_seconds', 'Время ответа', ('view',))
+SQL_SECONDS = Histogram(
+    'yatube_request_sql_seconds', 'Время SQL-запросов за ответ', ('view',))
+QUERIES = Histogram(
+    'yatube_request_queries', 'SQL-запросов за ответ', ('view',),
+    QUERY_BUCKETS)
+TEMPLATE_SECONDS = Histogram(
+    'yatube_request_template_seconds', 'Время рендеринга шаблонов',
+    ('view',))
+RESPONSES = Counter(
+    'yatube_responses_total', 'Ответы по коду статуса', ('view', 'status'))
+CACHE_REQUESTS = Counter(
+    'yatube_cache_requests_total', 'Чтения кэша', ('view', 'result'))
+THUMBNAIL_SECONDS = Histogram(
+    'yatube_thumbnail_seconds', 'Подготовка копий одной картинки')
+POOL_WAIT_SECONDS = Histogram(
+    'yatube_db_pool_wait_seconds', 'Ожидание соединения из пула',
+    ('alias',), POOL_BUCKETS)
+POOL_CONNECTIONS = Counter(
+    'yatube_db_pool_connections_total', 'События пула соединений',
+    ('alias', 'event'))
+REGISTRY = (REQUEST_SECONDS, SQL_SECONDS, QUERIES, TEMPLATE_SECONDS,
+            RESPONSES, CACHE_REQUESTS, THUMBNAIL_SECONDS, POOL_WAIT_SECONDS,
+            POOL_CONNECTIONS)
+
+
+def render():
+    '''Все метрики в текстовом формате Prometheus.'''
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+class Recorder:
+    '''Замеры одного запроса; заодно обёртка выполнения SQL.'''
+
+    def __init__(self, request=None):
+        self.request = request
+        self.queries = 0
+        self.fingerprints = collections.Counter()
+        self.times = {'sql': 0.0, 'template': 0.0, 'thumbnails': 0.0,
+                      'pool': 0.0}
+        self.cache = {'hit': 0, 'miss': 0}
+
+    def __call__(self, execute, sql, params, many, context):
+        if query_log.suspended():
+            return execute(sql, params, many, context)
+        started = perf_counter()
+        result = execute(sql, params, many, context)
+        elapsed = perf_counter() - started
+        self.times['sql'] += elapsed
+        self.queries += 1
+        self.fingerprints[query_log.observe(
+            sql, params, many, elapsed, context['connection'],
+            view_name(self.request))] += 1
+        return result
+
+    def publish(self, view, status, total):
+        labels = (view,)
+        REQUEST_SECONDS.observe(total, labels)
+        SQL_SECONDS.observe(self.times['sql'], labels)
+        QUERIES.observe(self.queries, labels)
+        TEMPLATE_SECONDS.observe(self.times['template'], labels)
+        RESPONSES.inc((view, str(status)))
+        query_log.report_repeated(self.fingerprints, view)
+        for result, count in self.cache.items():
+            if count:
+                CACHE_REQUESTS.inc((view, result), count)
+
+    def server_timing(self, total):
+        parts = [
+            f'total;dur={total * 1000:.1f}',
+            f'db;dur={self.times["sql"] * 1000:.1f};'
+            f'desc="{self.queries} queries"',
+            f'tpl;dur={self.times["template"] * 1000:.1f}',
+            f'cache;desc="{self.cache["hit"]} hit {self.cache["miss"]} miss"',
+        ]
+        for name, label in (('thumbnails', 'thumb'), ('pool', 'pool')):
+            if self.times[name]:
+                parts.append(f'{label};dur={self.times[name] * 1000:.1f}')
+        return ', '.join(parts)
+
+
+def current():
+    '''Замеры текущего запроса или None вне запроса.'''
+    return getattr(_local, 'recorder', None)
+
+
+@contextmanager
+def timed(name, histogram=None, labels=()):
+    '''Добавляет время блока к замеру запроса и к гистограмме.'''
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = perf_counter() - started
+        recorder = current()
+        if recorder is not None:
+            recorder.times[name] += elapsed
+        if histogram is not None:
+            histogram.observe(elapsed, labels)
+
+
+def record_cache(hits, misses):
+    recorder = current()
+    if recorder is not None:
+        recorder.cache['hit'] += hits
+        recorder.cache['miss'] += misses
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else UNRESOLVED
+
+
+class PerformanceMiddleware:
+    '''Замеряет запрос и отдаёт итог в ``Server-Timing``.
+
+    Ставится первым, чтобы замер охватил остальные middleware.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = _local.recorder = Recorder(request)
+        started = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                response = self.get_response(request)
+        finally:
+            _local.recorder = None
+        total = perf_counter() - started
+        recorder.publish(view_name(request), response.status_code, total)
+        response['Server-Timing'] = recorder.server_timing(total)
+        return response
@@ -0,0 +1,148 @@
+'''Журнал SQL-запросов: медленные запросы, планы и сводка по отпечаткам.
+
+Каждый запрос из ``PerformanceMiddleware`` сводится к отпечатку: текст
+без литералов и с одним ``(...)`` вместо списков значений. Сводка копит
+по отпечатку число выполнений, суммарное и худшее время и имена URL,
+из которых запрос приходил; её отдаёт ``/metrics/queries``.
+
+Запрос дольше ``SLOW_QUERY_MS`` пишется в журнал ``yatube.queries``
+вместе с планом ``EXPLAIN QUERY PLAN`` (план снимается один раз на
+отпечаток). Отпечаток, повторённый за один ответ ``REPEATED_QUERY_LIMIT``
+раз и больше, — признак запросов в цикле, он тоже попадает в журнал.
+'''
+import hashlib
+import logging
+import re
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+logger = logging.getLogger('yatube.queries')
+
+MAX_FINGERPRINTS = 1000
+OVERFLOW = 'other'
+REPEATED_QUERY_LIMIT = 10
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+VALUES = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+REPEATED_VALUES = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+SPACES = re.compile(r'\s+')
+
+_local = threading.local()
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql):
+    '''Текст запроса без конкретных значений.'''
+    sql = STRING.sub('?', sql.replace('%s', '?'))
+    sql = NUMBER.sub('?', sql)
+    sql = REPEATED_VALUES.sub('(...)', VALUES.sub('(...)', sql))
+    return SPACES.sub(' ', sql).strip()
+
+
+def suspended():
+    '''Идёт служебный запрос журнала: его не нужно записывать.'''
+    return getattr(_local, 'suspended', False)
+
+
+def explain(connection, sql, params):
+    '''План запроса строкой или None, если план снять не удалось.'''
+    prefix = ('EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite'
+              else 'EXPLAIN ')
+    _local.suspended = True
+    try:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(prefix + sql, params)
+                return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+    except DatabaseError:
+        return None
+    finally:
+        _local.suspended = False
+
+
+def has_full_scan(plan):
+    '''В плане SQLite есть полный проход по таблице без индекса.'''
+    return any(line.startswith('SCAN ') and 'USING' not in line
+               for line in (plan or '').splitlines())
+
+
+class QueryLog:
+    '''Сводка запросов процесса по отпечаткам.'''
+
+    def __init__(self, limit=MAX_FINGERPRINTS):
+        self.limit = limit
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            if key != OVERFLOW and len(self._entries) >= self.limit:
+                return self._entry(OVERFLOW)
+            entry = self._entries[key] = {
+                'id': hashlib.sha1(key.encode()).hexdigest()[:12],
+                'fingerprint': key,
+                'count': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'views': set(),
+                'plan': None,
+                'full_scan': False,
+            }
+        return entry
+
+    def record(self, sql, elapsed, view):
+        milliseconds = elapsed * 1000
+        with self._lock:
+            entry = self._entry(fingerprint(sql))
+            entry['count'] += 1
+            entry['total_ms'] += milliseconds
+            entry['max_ms'] = max(entry['max_ms'], milliseconds)
+            entry['views'].add(view)
+        return entry
+
+    def top(self, limit=20, order='total_ms'):
+        with self._lock:
+            entries = [{**entry, 'views': sorted(entry['views'])}
+                       for entry in self._entries.values()]
+        entries.sort(key=lambda entry: entry[order], reverse=True)
+        for entry in entries:
+            entry['total_ms'] = round(entry['total_ms'], 3)
+            entry['max_ms'] = round(entry['max_ms'], 3)
+        return entries[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+
+
+QUERY_LOG = QueryLog()
+
+
+def observe(sql, params, many, elapsed, connection, view):
+    '''Учитывает выполненный запрос; возвращает его отпечаток.'''
+    entry = QUERY_LOG.record(sql, elapsed, view)
+    if elapsed * 1000 < settings.SLOW_QUERY_MS:
+        return entry['fingerprint']
+    if (entry['plan'] is None and not many
+            and sql.lstrip()[:6].upper() == 'SELECT'):
+        entry['plan'] = explain(connection, sql, params)
+        entry['full_scan'] = has_full_scan(entry['plan'])
+    logger.warning(
+        'Медленный запрос %.1f мс в %s [%s]%s: %s\nПлан:\n%s',
+        elapsed * 1000, view, entry['id'],
+        ' без индекса' if entry['full_scan'] else '',
+        entry['fingerprint'], entry['plan'] or '-')
+    return entry['fingerprint']
+
+
+def report_repeated(counts, view):
+    '''Пишет в журнал отпечатки, повторённые за ответ слишком часто.'''
+    for key, count in counts.items():
+        if count >= REPEATED_QUERY_LIMIT:
+            logger.warning('Запрос выполнен %d раз за ответ %s: %s',
+                           count, view, key)
@@ -0,0 +1,36 @@
+'''Профили шаблонов Django.
+
+``development`` — настройки Django по умолчанию: пока ``DEBUG``
+включён, шаблоны из ``DIRS`` и папок приложений читаются с диска
+и разбираются заново при каждом рендеринге, а ошибка показывает
+исходник шаблона.
+
+``production`` оборачивает загрузчики в кэширующий: каждый шаблон,
+включая подключаемые через ``include``, читается и компилируется один
+раз на процесс, отладочные сведения шаблонов не собираются. Правки
+шаблонов видны после перезапуска.
+'''
+from django.core.exceptions import ImproperlyConfigured
+
+BACKEND = 'core.template_backends.DjangoTemplates'
+PROFILES = ('development', 'production')
+
+LOADERS = (
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+)
+CACHED_LOADER = 'django.template.loaders.cached.Loader'
+
+
+def django_templates(dirs, context_processors, profile='development'):
+    '''Список ``TEMPLATES`` для выбранного профиля.'''
+    if profile not in PROFILES:
+        raise ImproperlyConfigured(
+            f'Неизвестный профиль шаблонов {profile!r}; доступны: '
+            + ', '.join(PROFILES))
+    options = {'context_processors': list(context_processors)}
+    if profile == 'development':
+        return [{'BACKEND': BACKEND, 'DIRS': list(dirs), 'APP_DIRS': True,
+                 'OPTIONS': options}]
+    options.update(debug=False, loaders=[(CACHED_LOADER, list(LOADERS))])
+    return [{'BACKEND': BACKEND, 'DIRS': list(dirs), 'OPTIONS': options}]
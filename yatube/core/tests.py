@@ -0,0 +1,440 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import InvalidCacheBackendError
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DatabaseError, OperationalError, connections
+from django.db.utils import ConnectionHandler
+from django.template import engines
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         modify_settings, override_settings)
+from django.urls import reverse
+
+from core import metrics, query_log
+from core.caches import stats
+from core.caches.config import cache_from_url
+from core.caches.memcached import StatsMemcachedCache
+from core.caches.sqlite import StatsSQLiteCache
+from core.caches.standin import StandInServer
+from core.db import pool, routers
+from core.db.config import REPLICA, sqlite_databases
+from core.template_config import CACHED_LOADER, django_templates
+
+
+class CacheUrlTest(SimpleTestCase):
+    def test_schemes(self):
+        """CACHE_URL превращается в настройки бэкенда."""
+        self.assertEqual(
+            cache_from_url('sqlite:///tmp/cache.db?timeout=30'),
+            {'BACKEND': 'core.caches.sqlite.StatsSQLiteCache',
+             'LOCATION': '/tmp/cache.db', 'TIMEOUT': 30},
+        )
+        self.assertEqual(
+            cache_from_url('memcached://a:11211,b:11211?max_entries=10'),
+            {'BACKEND': 'core.caches.memcached.StatsMemcachedCache',
+             'LOCATION': ['a:11211', 'b:11211'],
+             'OPTIONS': {'MAX_ENTRIES': 10}},
+        )
+        self.assertEqual(cache_from_url('locmem://')['LOCATION'], '')
+
+    def test_invalid_urls(self):
+        for url in ('redis://localhost', 'sqlite://', 'memcached://',
+                    'locmem://?timeout=soon', 'locmem://?colour=red'):
+            with self.subTest(url=url):
+                with self.assertRaises(ImproperlyConfigured):
+                    cache_from_url(url)
+
+
+class SharedBackendMixin:
+    '''Общие проверки для бэкендов, доступных из нескольких процессов.'''
+
+    def make_cache(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.cache = self.make_cache()
+        self.other = self.make_cache()
+        self.cache.clear()
+
+    def test_values_are_shared(self):
+        """Запись одного экземпляра видна другому, как другому воркеру."""
+        self.cache.set('post', {'text': 'Пост'})
+        self.assertEqual(self.other.get('post'), {'text': 'Пост'})
+        self.other.delete('post')
+        self.assertIsNone(self.cache.get('post'))
+
+    def test_operations(self):
+        self.assertTrue(self.cache.add('key', 1))
+        self.assertFalse(self.other.add('key', 2))
+        self.assertEqual(self.other.incr('key', 5), 6)
+        self.cache.set_many({'a': 'x', 'b': b'y'})
+        self.assertEqual(self.other.get_many(['a', 'b', 'c']),
+                         {'a': 'x', 'b': b'y'})
+        self.cache.set('gone', 1, 0)
+        self.assertIsNone(self.other.get('gone'))
+        self.assertTrue(self.cache.touch('key', None))
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_hit_ratio_across_instances(self):
+        """Доля попаданий складывается из счётчиков всех воркеров."""
+        self.cache.set('post', 1)
+        self.cache.get('post')
+        self.other.get('post')
+        self.other.get_many(['post', 'missing'])
+        self.cache.flush_stats()
+        self.assertEqual(self.other.shared_stats(),
+                         {'hits': 3, 'misses': 1})
+
+
+class SQLiteCacheTest(SharedBackendMixin, SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        super().setUp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self):
+        return StatsSQLiteCache(f'{self.directory}/cache.db', {})
+
+    def test_cull(self):
+        cache = StatsSQLiteCache(f'{self.directory}/cache.db',
+                                 {'OPTIONS': {'MAX_ENTRIES': 10}})
+        cache.set_many({f'key-{n}': n for n in range(100)})
+        cache.set('last', 1)
+        self.assertLess(
+            cache._connection().execute(
+                'SELECT COUNT(*) FROM cache_entry').fetchone()[0], 100)
+
+
+class MemcachedCacheTest(SharedBackendMixin, SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = StandInServer()
+        cls.location = cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
+
+    def make_cache(self):
+        return StatsMemcachedCache(self.location, {})
+
+    def test_server_unavailable(self):
+        """Недоступный сервер означает промах, а не ошибку страницы."""
+        cache = StatsMemcachedCache('127.0.0.1:1', {})
+        cache.set('key', 1)
+        self.assertIsNone(cache.get('key'))
+
+
+class CacheStatsCommandTest(SimpleTestCase):
+    @override_settings(CACHES={'default': cache_from_url('locmem://stats')})
+    def test_command_reports_hit_ratio(self):
+        with self.assertRaises(InvalidCacheBackendError):
+            stats.cache_stats('missing')
+        out = StringIO()
+        call_command('cache_stats', stdout=out)
+        self.assertIn('доля попаданий', out.getvalue())
+
+
+class HistogramTest(SimpleTestCase):
+    def test_prometheus_text(self):
+        histogram = metrics.Histogram('test_seconds', 'Тест', ('view',),
+                                      buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.5, 3):
+            histogram.observe(value, ('posts:"index"',))
+        self.assertEqual(list(histogram.samples()), [
+            'test_seconds_bucket{view="posts:\\"index\\"",le="0.1"} 1',
+            'test_seconds_bucket{view="posts:\\"index\\"",le="1"} 3',
+            'test_seconds_bucket{view="posts:\\"index\\"",le="+Inf"} 4',
+            'test_seconds_sum{view="posts:\\"index\\""} 4.05',
+            'test_seconds_count{view="posts:\\"index\\""} 4',
+        ])
+
+
+@modify_settings(MIDDLEWARE={
+    'remove': 'posts.page_cache.AnonymousPageCacheMiddleware'})
+class PerformanceMiddlewareTest(TestCase):
+    def count(self, view):
+        series = metrics.REQUEST_SECONDS._values.get((view,))
+        return sum(series['counts']) if series else 0
+
+    def test_server_timing_and_histograms(self):
+        client = Client()
+        before = self.count('posts:index')
+        client.get(reverse('posts:index'))
+        response = client.get(reverse('posts:index'))
+        timing = response['Server-Timing']
+        for part in ('total;dur=', 'db;dur=', 'queries"', 'tpl;dur=',
+                     'cache;desc='):
+            with self.subTest(part=part):
+                self.assertIn(part, timing)
+        self.assertNotIn('tpl;dur=0.0', timing)
+        self.assertEqual(self.count('posts:index'), before + 2)
+        with self.settings(DEBUG=True):
+            text = client.get(reverse('metrics')).content.decode()
+        self.assertIn('yatube_request_duration_seconds_count'
+                      '{view="posts:index"}', text)
+        self.assertIn('yatube_cache_requests_total'
+                      '{view="posts:index",result="hit"}', text)
+        self.assertIn('yatube_responses_total'
+                      '{view="posts:index",status="200"}', text)
+
+    def test_unresolved_urls(self):
+        before = self.count(metrics.UNRESOLVED)
+        Client().get('/no-such-page/')
+        self.assertEqual(self.count(metrics.UNRESOLVED), before + 1)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        client = Client()
+        self.assertEqual(client.get(reverse('metrics')).status_code, 401)
+        response = client.get(reverse('metrics'),
+                              HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+
+    @override_settings(METRICS_TOKEN=None, DEBUG=False)
+    def test_metrics_closed_without_token(self):
+        client = Client()
+        for url in (reverse('metrics'), reverse('query_stats')):
+            with self.subTest(url=url):
+                self.assertEqual(client.get(url).status_code, 403)
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(
+                client.get(reverse('query_stats')).status_code, 401)
+
+
+class QueryLogTest(TestCase):
+    def test_fingerprint(self):
+        self.assertEqual(
+            query_log.fingerprint(
+                "SELECT *  FROM t WHERE id = 5 AND name = 'it''s' "
+                "AND pk IN (%s, %s, %s) LIMIT 21"),
+            'SELECT * FROM t WHERE id = ? AND name = ? AND pk IN (...) '
+            'LIMIT ?')
+        self.assertEqual(
+            query_log.fingerprint(
+                'INSERT INTO "t2" ("a", "b") VALUES (%s, %s), (%s, %s)'),
+            'INSERT INTO "t2" ("a", "b") VALUES (...)')
+
+    def test_full_scan(self):
+        self.assertTrue(query_log.has_full_scan('SCAN posts_post'))
+        self.assertFalse(query_log.has_full_scan(
+            'SCAN posts_post USING INDEX post_pub_date_idx\n'
+            'SEARCH auth_user USING INTEGER PRIMARY KEY (rowid=?)'))
+        self.assertFalse(query_log.has_full_scan(None))
+
+    def test_overflow(self):
+        log = query_log.QueryLog(limit=1)
+        log.record('SELECT 1', 0.001, 'a')
+        log.record('SELECT a FROM b', 0.002, 'b')
+        log.record('SELECT 2', 0.003, 'c')
+        top = log.top(order='count')
+        self.assertEqual([entry['fingerprint'] for entry in top],
+                         ['SELECT ?', query_log.OVERFLOW])
+        self.assertEqual(top[0]['count'], 2)
+        self.assertEqual(top[0]['views'], ['a', 'c'])
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_slow_queries_are_logged_with_plan(self):
+        query_log.QUERY_LOG.reset()
+        cache.clear()
+        with self.assertLogs('yatube.queries', 'WARNING') as logs:
+            Client().get(reverse('posts:index'))
+        self.assertIn('в posts:index', logs.output[0])
+        self.assertIn('План:', logs.output[0])
+        with self.settings(DEBUG=True):
+            stats = Client().get(
+                reverse('query_stats')).json()['queries']
+        select = next(entry for entry in stats
+                      if entry['fingerprint'].startswith('SELECT'))
+        self.assertEqual(select['views'], ['posts:index'])
+        self.assertTrue(select['plan'])
+
+    def test_repeated_queries(self):
+        with self.assertLogs('yatube.queries', 'WARNING') as logs:
+            query_log.report_repeated(
+                {'SELECT ? FROM t': query_log.REPEATED_QUERY_LIMIT,
+                 'SELECT ? FROM u': 1}, 'posts:index')
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('SELECT ? FROM t', logs.output[0])
+
+
+class TemplateProfileTest(SimpleTestCase):
+    def test_profiles(self):
+        development = django_templates(['templates'], ())[0]
+        self.assertTrue(development['APP_DIRS'])
+        self.assertNotIn('loaders', development['OPTIONS'])
+        production = django_templates(['templates'], (), 'production')[0]
+        self.assertFalse(production['OPTIONS']['debug'])
+        [(loader, inner)] = production['OPTIONS']['loaders']
+        self.assertEqual(loader, CACHED_LOADER)
+        self.assertEqual(len(inner), 2)
+        with self.assertRaises(ImproperlyConfigured):
+            django_templates(['templates'], (), 'fast')
+
+    def test_production_compiles_templates_once(self):
+        config = django_templates(settings.TEMPLATES[0]['DIRS'], (),
+                                  'production')[0]
+        with override_settings(TEMPLATES=[config]):
+            engine = engines.all()[0].engine
+            first = engine.get_template('posts/includes/post_card.html')
+            self.assertIs(
+                engine.get_template('posts/includes/post_card.html'), first)
+
+
+class DatabaseProfileTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'db.sqlite3')
+        self.handler = ConnectionHandler(
+            sqlite_databases(self.path, 'production'))
+        self.addCleanup(self.handler.close_all)
+
+    def test_profiles(self):
+        self.assertEqual(list(sqlite_databases(self.path)), ['default'])
+        self.assertEqual(list(sqlite_databases(self.path, 'production')),
+                         ['default', REPLICA])
+        with self.assertRaises(ImproperlyConfigured):
+            sqlite_databases(self.path, 'fast')
+
+    def test_pragmas_and_read_only_replica(self):
+        with self.handler['default'].cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('CREATE TABLE t (id INTEGER PRIMARY KEY)')
+            cursor.execute('INSERT INTO t VALUES (1)')
+        with self.handler[REPLICA].cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM t')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            with self.assertRaises(DatabaseError):
+                cursor.execute('INSERT INTO t VALUES (2)')
+
+    def test_transactions_take_write_lock_at_once(self):
+        connection = self.handler['default']
+        connection.ensure_connection()
+        connection._start_transaction_under_autocommit()
+        self.addCleanup(connection.connection.rollback)
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        with self.assertRaises(sqlite3.OperationalError):
+            other.execute('BEGIN IMMEDIATE')
+
+
+@mock.patch.dict(connections.databases, {REPLICA: {'NAME': 'replica.db'}})
+class ReadReplicaRouterTest(SimpleTestCase):
+    def route(self, view, method='get'):
+        request = getattr(RequestFactory(), method)('/')
+        middleware = routers.ReadOnlyViewMiddleware(
+            lambda request: routers.ReadReplicaRouter().db_for_read(None))
+        middleware.process_view(request, view, (), {})
+        return middleware(request)
+
+    def test_reads_of_read_only_views_go_to_replica(self):
+        read_view = routers.read_only(lambda request: None)
+        self.assertEqual(self.route(read_view), REPLICA)
+        self.assertIsNone(self.route(read_view, 'post'))
+        self.assertIsNone(self.route(lambda request: None))
+        self.assertIsNone(routers.ReadReplicaRouter().db_for_read(None))
+
+    def test_writes_and_migrations_use_default(self):
+        router = routers.ReadReplicaRouter()
+        self.assertEqual(router.db_for_write(None), 'default')
+        self.assertFalse(router.allow_migrate(REPLICA, 'posts'))
+        self.assertTrue(router.allow_migrate('default', 'posts'))
+
+    def test_test_mirror_is_not_a_replica(self):
+        with mock.patch.dict(connections.databases[REPLICA],
+                             {'NAME': connections.databases[
+                                 'default']['NAME']}):
+            self.assertFalse(routers.replica_configured())
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.databases = sqlite_databases(
+            os.path.join(directory, 'db.sqlite3'), 'production')
+
+    def connection(self, **options):
+        settings_dict = self.databases['default']
+        settings_dict['POOL'] = {**settings_dict['POOL'], **options}
+        connection = ConnectionHandler(self.databases)['default']
+        self.addCleanup(connection.pool.close_idle)
+        return connection
+
+    def raw(self, connection):
+        connection.ensure_connection()
+        raw = connection.connection
+        connection.close()
+        return raw
+
+    def test_connections_are_reused(self):
+        connection = self.connection()
+        first = self.raw(connection)
+        self.assertIs(self.raw(connection), first)
+        other = ConnectionHandler(self.databases)['default']
+        self.assertIs(self.raw(other), first)
+        self.assertEqual(connection.pool.stats, {'open': 1, 'idle': 1})
+
+    def test_max_age_recycles_connections(self):
+        connection = self.connection(MAX_AGE=0)
+        first = self.raw(connection)
+        self.assertIsNot(self.raw(connection), first)
+        self.assertEqual(connection.pool.stats, {'open': 0, 'idle': 0})
+
+    def test_broken_idle_connection_is_replaced(self):
+        connection = self.connection(CHECK_INTERVAL=0)
+        first = self.raw(connection)
+        first.close()
+        second = self.raw(connection)
+        self.assertIsNot(second, first)
+        self.assertEqual(connection.pool.stats, {'open': 1, 'idle': 1})
+
+    def test_pool_size_limit(self):
+        connection = self.connection(SIZE=1, TIMEOUT=0.01)
+        connection.ensure_connection()
+        self.addCleanup(connection.close)
+        other = ConnectionHandler(self.databases)['default']
+        with self.assertRaises(OperationalError):
+            other.ensure_connection()
+
+    def test_released_connection_is_rolled_back(self):
+        connection = self.connection()
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (id INTEGER PRIMARY KEY)')
+        connection._start_transaction_under_autocommit()
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO t VALUES (1)')
+        connection.close()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM t')
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertFalse(connection.connection.in_transaction)
+        connection.close()
+
+    def test_pool_wait_is_measured(self):
+        before = metrics.POOL_WAIT_SECONDS._values.get(('default',))
+        before = sum(before['counts']) if before else 0
+        self.raw(self.connection())
+        self.assertEqual(
+            sum(metrics.POOL_WAIT_SECONDS._values[('default',)]['counts']),
+            before + 1)
+        self.assertIsInstance(pool.pool_for('default',
+                                            self.databases['default']),
+                              pool.Pool)
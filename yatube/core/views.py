@@ -1,6 +1,13 @@
 from http import HTTPStatus
 
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from core import metrics, query_log
+
+QUERY_STATS_LIMIT = 50
 
 
 def page_not_found(request, exception):
@@ -11,3 +18,46 @@ def page_not_found(request, exception):
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html',
                   status=HTTPStatus.FORBIDDEN)
+
+
+def _metrics_denied(request):
+    '''Ответ с отказом, если метрики этому запросу не положены.
+
+    Без ``METRICS_TOKEN`` метрики открыты только при ``DEBUG``.
+    '''
+    token = settings.METRICS_TOKEN
+    if not token:
+        return (None if settings.DEBUG
+                else HttpResponse(status=HTTPStatus.FORBIDDEN))
+    if not constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return HttpResponse(status=HTTPStatus.UNAUTHORIZED)
+    return None
+
+
+def prometheus_metrics(request):
+    '''Метрики процесса для Prometheus.'''
+    denied = _metrics_denied(request)
+    if denied:
+        return denied
+    return HttpResponse(metrics.render(),
+                        content_type=metrics.CONTENT_TYPE)
+
+
+def query_stats(request):
+    '''Самые затратные отпечатки SQL-запросов процесса.
+
+    ``?order=count`` сортирует по числу выполнений, ``?limit=`` задаёт
+    длину списка.
+    '''
+    denied = _metrics_denied(request)
+    if denied:
+        return denied
+    order = 'count' if request.GET.get('order') == 'count' else 'total_ms'
+    try:
+        limit = int(request.GET.get('limit', QUERY_STATS_LIMIT))
+    except ValueError:
+        limit = QUERY_STATS_LIMIT
+    return JsonResponse(
+        {'queries': query_log.QUERY_LOG.top(limit, order)},
+        json_dumps_params={'ensure_ascii': False})
@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.db.models.expressions import RawSQL
 
 from .models import Group, Post
+from .search import is_enabled, matching_ids_sql
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -10,6 +12,14 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по полнотекстовому индексу вместо LIKE '%...%' по text.
+        if not search_term or not is_enabled():
+            return super().get_search_results(request, queryset,
+                                              search_term)
+        return queryset.filter(
+            pk__in=RawSQL(*matching_ids_sql(search_term))), False
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
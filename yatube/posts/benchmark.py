@@ -0,0 +1,322 @@
+'''Нагрузочные данные и замер страниц постов.
+
+``seed`` быстро наполняет базу правдоподобным объёмом данных: записи
+идут через ``bulk_create`` с заранее известными id, а производные данные
+(счётчики, индекс, ленты) пересчитываются в конце одним проходом, как
+при импорте. Популярность авторов распределена по Ципфу: у немногих
+авторов большинство подписчиков.
+
+``run`` гоняет страницы тестовым клиентом (полный цикл WSGI-обработчика
+с middleware) и для каждого сценария считает задержки p50/p99, число
+запросов к базе и пиковое выделение памяти (tracemalloc, отдельным
+проходом, чтобы трассировка не искажала задержки). Самые затратные
+отпечатки SQL-запросов прогона сохраняются вместе с результатом.
+'''
+import platform
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import timedelta
+from itertools import accumulate
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.db.models import Max, Min
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from core import query_log
+
+from .models import Comment, Follow, Group, Post, User, UserStats
+from .transfer import rebuild_derived, restore_dates
+from yatube.constants import TRANSFER_BATCH_SIZE
+
+SCENARIOS = ('index', 'group_list', 'profile', 'post_detail',
+             'follow_index', 'add_comment')
+WORDS = ('горы', 'море', 'котики', 'город', 'поезд', 'дорога', 'лес',
+         'книга', 'утро', 'река', 'друзья', 'фотография', 'зима', 'лето',
+         'новости', 'работа', 'музыка', 'кофе', 'прогулка', 'вечер')
+# Показатель степени закона Ципфа для подписок и для авторства.
+FOLLOW_SKEW = 1.1
+POSTING_SKEW = 0.8
+SEED_PERIOD = timedelta(days=365)
+SAMPLE_SIZE = 200
+FINGERPRINTS_REPORTED = 20
+
+
+def _zipf_weights(count, skew):
+    return list(accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+
+
+def _next_id(model):
+    return (model.objects.aggregate(top=Max('pk'))['top'] or 0) + 1
+
+
+def _text(rng, words):
+    return ' '.join(rng.choices(WORDS, k=words)).capitalize()
+
+
+def _date(rng, now):
+    return now - timedelta(
+        seconds=rng.randrange(int(SEED_PERIOD.total_seconds())))
+
+
+def _write(model, batch, date_field):
+    # auto_now_add заменит даты при вставке: запоминаем их до неё.
+    dates = ({obj.pk: getattr(obj, date_field) for obj in batch}
+             if date_field else None)
+    with transaction.atomic():
+        model.objects.bulk_create(batch, ignore_conflicts=True)
+        if dates:
+            restore_dates(model, date_field, dates)
+
+
+def _save(model, objects, batch_size, date_field=None):
+    '''Пишет объекты пачками, каждая пачка — своя транзакция.
+
+    ``date_field`` — поле с ``auto_now_add``, которому нужны даты
+    объектов; первичные ключи тогда задаются заранее.
+    '''
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) == batch_size:
+            _write(model, batch, date_field)
+            batch = []
+    _write(model, batch, date_field)
+
+
+def _follows(rng, user_ids, per_user):
+    '''Подписки: число на читателя равномерно в [0, 2 * per_user].'''
+    weights = _zipf_weights(len(user_ids), FOLLOW_SKEW)
+    for user_id in user_ids:
+        wanted = rng.randint(0, 2 * per_user)
+        authors = set(rng.choices(user_ids, cum_weights=weights, k=wanted))
+        for author_id in authors - {user_id}:
+            yield Follow(user_id=user_id, author_id=author_id)
+
+
+def seed(users=100_000, posts=1_000_000, groups=200, comments=500_000,
+         follows=20, batch_size=TRANSFER_BATCH_SIZE, random_seed=0):
+    '''Добавляет нагрузочные данные; возвращает число созданных записей.'''
+    rng = random.Random(random_seed)
+    now = timezone.now()
+    first_user = _next_id(User)
+    user_ids = list(range(first_user, first_user + users))
+    # Общий хеш: пароль ``bench`` у всех, без тысяч вызовов PBKDF2.
+    password = make_password('bench')
+    _save(User, (User(pk=pk, username=f'bench{pk}', password=password)
+                 for pk in user_ids), batch_size)
+    first_group = _next_id(Group)
+    group_ids = list(range(first_group, first_group + groups))
+    _save(Group, (Group(pk=pk, slug=f'bench-{pk}', title=f'Группа {pk}',
+                        description=_text(rng, 12))
+                  for pk in group_ids), batch_size)
+    # Пишут много не те, на кого больше подписаны.
+    writers = rng.sample(user_ids, len(user_ids))
+    writer_weights = _zipf_weights(len(writers), POSTING_SKEW)
+    first_post = _next_id(Post)
+    _save(Post, (
+        Post(pk=first_post + number,
+             author_id=rng.choices(writers, cum_weights=writer_weights)[0],
+             group_id=(rng.choice(group_ids)
+                       if group_ids and rng.random() < 0.5 else None),
+             text=_text(rng, rng.randint(5, 60)),
+             pub_date=_date(rng, now))
+        for number in range(posts)), batch_size, 'pub_date')
+    post_ids = range(first_post, first_post + posts)
+    first_comment = _next_id(Comment)
+    _save(Comment, (
+        Comment(pk=first_comment + number,
+                post_id=rng.choice(post_ids),
+                author_id=rng.choice(user_ids),
+                text=_text(rng, rng.randint(3, 20)),
+                created=_date(rng, now))
+        for number in range(comments if posts else 0)), batch_size,
+        'created')
+    _save(Follow, _follows(rng, user_ids, follows), batch_size)
+    rebuild_derived()
+    return {'users': users, 'groups': groups, 'posts': posts,
+            'comments': comments if posts else 0,
+            'follows': Follow.objects.filter(user_id__in=user_ids).count()}
+
+
+def percentile(values, share):
+    '''Перцентиль по ближайшему рангу.'''
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[max(0, round(share * len(ordered)) - 1)]
+
+
+class Targets:
+    '''Случайные, но существующие группы, авторы и посты для запросов.'''
+
+    def __init__(self, rng, size=SAMPLE_SIZE):
+        self.rng = rng
+        bounds = Post.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        candidates = ([rng.randint(bounds['low'], bounds['high'])
+                       for _ in range(size)] if bounds['low'] else [])
+        self.posts = list(Post.objects.filter(
+            pk__in=candidates).values_list('pk', 'author__username'))
+        self.groups = list(Group.objects.order_by('?').values_list(
+            'slug', flat=True)[:size])
+        self.reader = User.objects.filter(
+            pk__in=UserStats.objects.order_by('-following_count').values(
+                'user_id')[:1]).first()
+
+    def skipped(self, scenario):
+        if scenario == 'group_list':
+            return not self.groups
+        if scenario in ('follow_index', 'add_comment'):
+            return not self.posts or self.reader is None
+        return not self.posts
+
+    def request(self, scenario):
+        '''``(метод, адрес, данные)`` очередного запроса сценария.'''
+        post_id, username = (self.rng.choice(self.posts)
+                             if self.posts else (None, None))
+        if scenario == 'index':
+            return 'get', reverse('posts:index'), None
+        if scenario == 'group_list':
+            return 'get', reverse('posts:group_list',
+                                  args=(self.rng.choice(self.groups),)), None
+        if scenario == 'profile':
+            return 'get', reverse('posts:profile', args=(username,)), None
+        if scenario == 'post_detail':
+            return 'get', reverse('posts:post_detail', args=(post_id,)), None
+        if scenario == 'follow_index':
+            return 'get', reverse('posts:follow_index'), None
+        return ('post', reverse('posts:add_comment', args=(post_id,)),
+                {'text': _text(self.rng, 8)})
+
+
+def _client(targets, scenario):
+    client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+    if scenario in ('follow_index', 'add_comment'):
+        client.force_login(targets.reader)
+    return client
+
+
+def _send(client, targets, scenario, clear_cache):
+    method, url, data = targets.request(scenario)
+    if clear_cache:
+        cache.clear()
+    response = getattr(client, method)(url, data)
+    return response.status_code < 400
+
+
+class QueryCounter:
+    '''Считает запросы ко всем базам, не открывая лишних соединений.'''
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(targets, scenario, requests, warmup, allocations,
+            clear_cache=False):
+    client = _client(targets, scenario)
+    for _ in range(warmup):
+        _send(client, targets, scenario, clear_cache)
+    timings, queries, errors = [], [], 0
+    for _ in range(requests):
+        counter = QueryCounter()
+        with ExitStack() as stack:
+            # Страницы для чтения могут ходить в реплику, а не в default.
+            for db in connections.all():
+                stack.enter_context(db.execute_wrapper(counter))
+            started = time.perf_counter()
+            ok = _send(client, targets, scenario, clear_cache)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count)
+        errors += not ok
+    peaks = []
+    for _ in range(allocations):
+        # Пик считается от start(): reset_peak() есть только с Python 3.9.
+        tracemalloc.start()
+        try:
+            _send(client, targets, scenario, clear_cache)
+            peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+        finally:
+            tracemalloc.stop()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'p50_ms': round(percentile(timings, 0.5), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'queries_p50': percentile(queries, 0.5),
+        'queries_max': max(queries),
+        'alloc_peak_kb_p50': (round(percentile(peaks, 0.5), 1)
+                              if peaks else None),
+        'alloc_peak_kb_max': round(max(peaks), 1) if peaks else None,
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'), cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scenarios=SCENARIOS, requests=200, warmup=20, allocations=20,
+        clear_cache=False, random_seed=0):
+    '''Замеряет сценарии; результат пригоден для сохранения в JSON.'''
+    targets = Targets(random.Random(random_seed))
+    query_log.QUERY_LOG.reset()
+    results = {}
+    for scenario in scenarios:
+        if targets.skipped(scenario):
+            results[scenario] = {'skipped': True}
+            continue
+        results[scenario] = measure(targets, scenario, requests, warmup,
+                                    allocations, clear_cache)
+    return {
+        'meta': {
+            'commit': _commit(),
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'cache': settings.CACHES['default']['BACKEND'],
+            'clear_cache': clear_cache,
+        },
+        'data': {
+            'users': User.objects.count(),
+            'groups': Group.objects.count(),
+            'posts': Post.objects.count(),
+            'comments': Comment.objects.count(),
+            'follows': Follow.objects.count(),
+        },
+        'scenarios': results,
+        'fingerprints': query_log.QUERY_LOG.top(FINGERPRINTS_REPORTED),
+    }
+
+
+def compare(baseline, current, metrics=('p50_ms', 'p99_ms', 'queries_p50')):
+    '''Изменения метрик относительно прошлого замера, в процентах.'''
+    changes = {}
+    for scenario, result in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(scenario, {})
+        changes[scenario] = {
+            metric: round((result[metric] - before[metric])
+                          / before[metric] * 100, 1)
+            for metric in metrics
+            if result.get(metric) is not None and before.get(metric)
+        }
+    return changes
@@ -0,0 +1,117 @@
+'''Версии кэшированных фрагментов лент.
+
+Ключ фрагмента включает версии областей, от которых зависит его
+содержимое: ``posts`` (все посты), ``group:<id>``, ``author:<id>``,
+``post:<id>``, ``follow:<id>`` (подписки читателя) и ``meta`` (имена
+авторов и слаги групп, которые видны в каждой ленте). Сигналы заменяют
+версию области новой случайной меткой, поэтому фрагменты можно хранить
+часами: устаревший фрагмент просто перестаёт находиться по ключу.
+
+Метка начинается со времени сброса в секундах: по составной версии
+``changed_at`` восстанавливает время последнего изменения для
+``Last-Modified``.
+'''
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'feed-version:{}'
+
+META = 'meta'
+POSTS = 'posts'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def follow_scope(user_id):
+    return f'follow:{user_id}'
+
+
+def _new_version():
+    return f'{int(time.time())}-{uuid.uuid4().hex}'
+
+
+def feed_version(*scopes):
+    '''Составная версия фрагмента для тега ``{% cache %}``.'''
+    scopes = (META,) + scopes
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), None)
+            versions[key] = cache.get(key)
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+def _replace_versions(scopes):
+    cache.set_many({VERSION_KEY.format(scope): _new_version()
+                    for scope in scopes}, None)
+
+
+def changed_at(version):
+    '''Время последнего сброса из составной версии или None.'''
+    parts = (part.partition('-') for part in version.split('.'))
+    stamps = [int(stamp) for stamp, dash, _ in parts
+              if dash and stamp.isdigit()]
+    if not stamps:
+        return None
+    return datetime.fromtimestamp(max(stamps), timezone.utc)
+
+
+def bump(*scopes):
+    '''Сбрасывает версии сразу и ещё раз после фиксации транзакции.
+
+    Повторный сброс выбрасывает фрагменты, которые параллельный запрос
+    успел собрать из данных до фиксации.
+    '''
+    _replace_versions(scopes)
+    transaction.on_commit(lambda: _replace_versions(scopes))
+
+
+def post_scopes(post, old_group_id=None):
+    scopes = [POSTS, author_scope(post.author_id), post_scope(post.pk)]
+    for group_id in {post.group_id, old_group_id} - {None}:
+        scopes.append(group_scope(group_id))
+    return scopes
+
+
+def post_changed(post, old_group_id=None):
+    bump(*post_scopes(post, old_group_id))
+
+
+def image_changed(post):
+    '''Готовы копии картинки поста: ленты целиком (``posts``) не сбрасываются.
+
+    Иначе каждая картинка сбрасывала бы все ленты сайта; главная покажет
+    картинку вместо заглушки со следующим сбросом.
+    '''
+    bump(*(scope for scope in post_scopes(post) if scope != POSTS))
+
+
+def comment_changed(comment):
+    bump(post_scope(comment.post_id))
+
+
+def group_changed(group):
+    bump(META, group_scope(group.pk))
+
+
+def follow_changed(follow):
+    bump(follow_scope(follow.user_id))
+
+
+def meta_changed():
+    bump(META)
@@ -0,0 +1,143 @@
+'''Карточки постов — денормализованная таблица для лент.
+
+``PostCard`` хранит всё, что выводит строка ленты: текст, дату, имя
+и ссылку на автора, слаг группы и копии картинки. Страница главной,
+группы или профиля — один проход по индексу ``PostCard`` без JOIN и без
+отдельного запроса копий картинок; из строк собираются объекты
+``Post`` с уже заполненными автором, группой и копиями, так что шаблоны
+не меняются. Поля, которых в карточке нет, объект дочитает при
+обращении, как поле из ``defer()``.
+
+Карточки обновляют обработчики сигналов ``Post``, ``User`` и ``Group``
+и ``build_derivatives``; массовые вставки вызывают ``add_posts``,
+а ``rebuild`` пересобирает таблицу целиком.
+'''
+import json
+
+from .models import Group, ImageDerivative, Post, PostCard, User
+
+POST_FIELDS = ('id', 'text', 'pub_date', 'author_id', 'group_id', 'image')
+AUTHOR_FIELDS = ('id', 'username', 'first_name', 'last_name')
+GROUP_FIELDS = ('id', 'slug')
+DERIVATIVE_FIELDS = ('post_id', 'file', 'format', 'width', 'height')
+
+
+def pack_derivatives(derivatives):
+    return json.dumps([[item.file.name, item.format, item.width,
+                        item.height] for item in derivatives])
+
+
+def _post_fields(post):
+    return {'pub_date': post.pub_date, 'text': post.text,
+            'image': post.image.name or '', 'author_id': post.author_id,
+            'group_id': post.group_id}
+
+
+def _author_fields(author):
+    return {'author_username': author.username,
+            'author_first_name': author.first_name,
+            'author_last_name': author.last_name}
+
+
+def _group_fields(group):
+    return {'group_slug': group.slug if group is not None else ''}
+
+
+def _card(post, author, group, model=PostCard):
+    return model(post_id=post.pk, **_post_fields(post),
+                 **_author_fields(author), **_group_fields(group))
+
+
+def post_saved(post, created, image_changed):
+    fields = dict(_post_fields(post), **_author_fields(post.author),
+                  **_group_fields(post.group))
+    if image_changed:
+        # Старые копии удалятся, новые запишет build_derivatives.
+        fields['derivatives'] = '[]'
+    if created or not PostCard.objects.filter(pk=post.pk).update(**fields):
+        PostCard.objects.create(post_id=post.pk, **fields)
+
+
+def author_changed(author):
+    fields = _author_fields(author)
+    PostCard.objects.filter(author_id=author.pk).exclude(**fields).update(
+        **fields)
+
+
+def group_changed(group):
+    fields = _group_fields(group)
+    PostCard.objects.filter(group_id=group.pk).exclude(**fields).update(
+        **fields)
+
+
+def derivatives_changed(post_id, derivatives):
+    PostCard.objects.filter(pk=post_id).update(
+        derivatives=pack_derivatives(derivatives))
+
+
+def _related(posts, name):
+    '''Связанные объекты постов по id: из кэша поста или одним запросом.'''
+    field = Post._meta.get_field(name)
+    found = {getattr(post, field.attname): field.get_cached_value(post)
+             for post in posts if field.is_cached(post)}
+    missing = {getattr(post, field.attname) for post in posts} - {None}
+    missing -= set(found)
+    if missing:
+        found.update(field.related_model.objects.in_bulk(missing))
+    return found
+
+
+def add_posts(posts):
+    '''Карточки постов, записанных ``bulk_create`` без сигналов.'''
+    authors, groups = _related(posts, 'author'), _related(posts, 'group')
+    PostCard.objects.bulk_create(
+        _card(post, authors[post.author_id], groups.get(post.group_id))
+        for post in posts)
+
+
+def rebuild(batch_size=1000, post_model=Post, card_model=PostCard):
+    '''Пересобирает карточки всех постов; возвращает их число.
+
+    Миграция передаёт сюда исторические модели.
+    '''
+    card_model.objects.all().delete()
+    posts = post_model.objects.select_related('author', 'group').order_by(
+        'pk').prefetch_related('derivatives')
+    total, last = 0, 0
+    while True:
+        # iterator() не выполняет prefetch_related: читаем пачками по id.
+        batch = list(posts.filter(pk__gt=last)[:batch_size])
+        if not batch:
+            return total
+        cards = []
+        for post in batch:
+            card = _card(post, post.author, post.group, card_model)
+            card.derivatives = pack_derivatives(post.derivatives.all())
+            cards.append(card)
+        card_model.objects.bulk_create(cards)
+        total += len(cards)
+        last = batch[-1].pk
+
+
+def hydrate(card):
+    '''``Post`` из карточки: автор, группа и копии картинки уже на месте.'''
+    db = card._state.db
+    post = Post.from_db(db, POST_FIELDS, (
+        card.post_id, card.text, card.pub_date, card.author_id,
+        card.group_id, card.image))
+    post.author = User.from_db(db, AUTHOR_FIELDS, (
+        card.author_id, card.author_username, card.author_first_name,
+        card.author_last_name))
+    post.group = (Group.from_db(db, GROUP_FIELDS,
+                                (card.group_id, card.group_slug))
+                  if card.group_id is not None else None)
+    if card.image:
+        derivatives = post.derivatives.all()
+        # Как после prefetch_related: шаблон берёт копии без запроса.
+        derivatives._result_cache = [
+            ImageDerivative.from_db(db, DERIVATIVE_FIELDS,
+                                    (card.post_id, *row))
+            for row in json.loads(card.derivatives)]
+        derivatives._prefetch_done = True
+        post._prefetched_objects_cache = {'derivatives': derivatives}
+    return post
@@ -0,0 +1,71 @@
+'''Условные GET-запросы для лент и страницы поста.
+
+Валидаторы страницы строятся из версий областей кэша (см. ``caching``),
+а не из самой страницы: версия меняется при любом изменении данных,
+которые страница показывает. ETag включает ещё читателя и параметры
+запроса (курсор страницы), ``Last-Modified`` — время последнего сброса
+версий. Представление проверяет валидаторы сразу после поиска группы,
+автора или поста: на совпадающий ``If-None-Match`` или
+``If-Modified-Since`` ответ ``304`` уходит без запроса страницы и без
+рендеринга шаблона.
+
+Версия помечена временем с точностью до секунды, поэтому в секунду
+сброса ``Last-Modified`` не отдаётся и ``If-Modified-Since`` не
+проверяется: запись в ту же секунду дала бы ``304`` на устаревшую
+страницу. Отвечать ``304`` в это время может только ETag.
+
+ETag слабый: токен CSRF в формах каждый раз маскируется по-новому, так
+что байты страниц совпадают только по смыслу.
+'''
+import hashlib
+import time
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .caching import changed_at, feed_version
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def page_etag(request, version):
+    reader = request.user.pk if request.user.is_authenticated else 0
+    digest = hashlib.md5(
+        f'{version}|{reader}|{request.GET.urlencode()}'.encode()).hexdigest()
+    return 'W/' + quote_etag(digest)
+
+
+class PageValidators:
+    '''ETag и Last-Modified страницы, зависящей от областей ``scopes``.'''
+
+    def __init__(self, request, *scopes):
+        self.request = request
+        self.scopes = scopes
+        self.version = feed_version(*scopes)
+        self.etag = page_etag(request, self.version)
+        self.modified = changed_at(self.version)
+        if (self.modified is not None
+                and self.modified.timestamp() >= int(time.time())):
+            self.modified = None
+        # По ним кэш страниц проверяет, не устарела ли сохранённая копия.
+        request.page_validators = self
+
+    def not_modified(self):
+        '''Ответ ``304`` (или ``412``) на условный запрос, иначе None.'''
+        if self.request.method not in SAFE_METHODS:
+            return None
+        response = get_conditional_response(
+            self.request, etag=self.etag,
+            last_modified=self.modified and int(self.modified.timestamp()))
+        return response and self.apply(response)
+
+    def apply(self, response):
+        '''Ставит валидаторы на ответ страницы.'''
+        if response.status_code not in (200, 304):
+            return response
+        response['ETag'] = self.etag
+        if self.modified is not None:
+            response['Last-Modified'] = http_date(self.modified.timestamp())
+        # Браузер хранит страницу, но каждый раз переспрашивает сервер.
+        patch_cache_control(response, no_cache=True)
+        return response
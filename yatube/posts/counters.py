@@ -0,0 +1,151 @@
+'''Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются атомарными ``UPDATE ... SET n = n ± 1`` в обработчиках
+сигналов, то есть в той же транзакции, что и сама запись. Расхождения
+(массовые вставки, правки напрямую в базе) исправляет команда
+``manage.py reconcile_counters``.
+'''
+from collections import Counter
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def _bump(queryset, **deltas):
+    # Счётчик не уходит ниже нуля, даже если он уже разошёлся с данными.
+    queryset = queryset.filter(**{f'{field}__gte': -delta
+                                  for field, delta in deltas.items()
+                                  if delta < 0})
+    return queryset.update(**{field: F(field) + delta
+                              for field, delta in deltas.items()})
+
+
+def _count(queryset, field):
+    '''Подзапрос COUNT(*) по связанным строкам для массового UPDATE.'''
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def recount_users(users=None):
+    '''Пересчитывает счётчики пользователей, создавая недостающие строки.'''
+    users = User.objects.all() if users is None else users
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=pk) for pk in users.filter(
+            stats__isnull=True).values_list('pk', flat=True).iterator()),
+        ignore_conflicts=True,
+    )
+    return UserStats.objects.filter(user__in=users).annotate(
+        real_posts=_count(Post.objects.all(), 'author'),
+        real_followers=_count(Follow.objects.all(), 'author'),
+        real_following=_count(Follow.objects.all(), 'user'),
+    ).exclude(
+        posts_count=F('real_posts'),
+        followers_count=F('real_followers'),
+        following_count=F('real_following'),
+    ).update(
+        posts_count=_count(Post.objects.all(), 'author'),
+        followers_count=_count(Follow.objects.all(), 'author'),
+        following_count=_count(Follow.objects.all(), 'user'),
+    )
+
+
+def recount_posts(posts=None):
+    posts = Post.objects.all() if posts is None else posts
+    return posts.annotate(
+        real_comments=_count(Comment.objects.all(), 'post'),
+    ).exclude(
+        comments_count=F('real_comments'),
+    ).update(comments_count=_count(Comment.objects.all(), 'post'))
+
+
+def recount_groups(groups=None):
+    groups = Group.objects.all() if groups is None else groups
+    return groups.annotate(
+        real_posts=_count(Post.objects.all(), 'group'),
+    ).exclude(
+        posts_count=F('real_posts'),
+    ).update(posts_count=_count(Post.objects.all(), 'group'))
+
+
+def stats_for(user):
+    '''Счётчики пользователя; строка создаётся, если её ещё нет.'''
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        recount_users(User.objects.filter(pk=user.pk))
+        return UserStats.objects.get(pk=user.pk)
+
+
+def _bump_user(user_id, **deltas):
+    if not _bump(UserStats.objects.filter(user_id=user_id), **deltas):
+        if all(delta > 0 for delta in deltas.values()):
+            recount_users(User.objects.filter(pk=user_id))
+
+
+def post_added(post):
+    _bump_user(post.author_id, posts_count=1)
+    if post.group_id is not None:
+        _bump(Group.objects.filter(pk=post.group_id), posts_count=1)
+
+
+def post_removed(post):
+    _bump_user(post.author_id, posts_count=-1)
+    if post.group_id is not None:
+        _bump(Group.objects.filter(pk=post.group_id), posts_count=-1)
+
+
+def post_moved(old_group_id, new_group_id):
+    if old_group_id == new_group_id:
+        return
+    if old_group_id is not None:
+        _bump(Group.objects.filter(pk=old_group_id), posts_count=-1)
+    if new_group_id is not None:
+        _bump(Group.objects.filter(pk=new_group_id), posts_count=1)
+
+
+def comment_added(comment):
+    _bump(Post.objects.filter(pk=comment.post_id), comments_count=1)
+
+
+def comment_removed(comment):
+    _bump(Post.objects.filter(pk=comment.post_id), comments_count=-1)
+
+
+def follow_added(follow):
+    _bump_user(follow.user_id, following_count=1)
+    _bump_user(follow.author_id, followers_count=1)
+
+
+def posts_added(posts):
+    '''Как ``post_added`` для пачки: по одному UPDATE на автора и группу.'''
+    for author_id, total in Counter(post.author_id for post in posts).items():
+        _bump_user(author_id, posts_count=total)
+    groups = Counter(post.group_id for post in posts
+                     if post.group_id is not None)
+    for group_id, total in groups.items():
+        _bump(Group.objects.filter(pk=group_id), posts_count=total)
+
+
+def comments_added(comments):
+    posts = Counter(comment.post_id for comment in comments)
+    for post_id, total in posts.items():
+        _bump(Post.objects.filter(pk=post_id), comments_count=total)
+
+
+def follows_added(follows):
+    following = Counter(follow.user_id for follow in follows)
+    for user_id, total in following.items():
+        _bump_user(user_id, following_count=total)
+    followers = Counter(follow.author_id for follow in follows)
+    for author_id, total in followers.items():
+        _bump_user(author_id, followers_count=total)
+
+
+def follow_removed(follow):
+    _bump_user(follow.user_id, following_count=-1)
+    _bump_user(follow.author_id, followers_count=-1)
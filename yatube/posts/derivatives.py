@@ -0,0 +1,134 @@
+'''Наборы уменьшенных копий картинок постов.
+
+Картинка кадрируется по центру до пропорций ленты ``IMAGE_ASPECT`` и
+сохраняется в каждой ширине ``IMAGE_WIDTHS``, не превышающей исходную,
+в каждом формате из ``FORMATS``, который умеет кодировать установленный
+Pillow. Размеры и вес копий записываются в ``ImageDerivative``, так что
+шаблон собирает ``<picture>`` и ``srcset`` без обращения к файлам.
+'''
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, features
+
+from . import cards
+from .models import ImageDerivative, Post
+from yatube.constants import IMAGE_ASPECT, IMAGE_WIDTHS
+
+UPLOAD_TO = 'posts/derivatives/'
+
+# features.check() предупреждает о незнакомых старому Pillow форматах.
+SUPPORTED = frozenset(features.get_supported())
+
+
+class Format:
+    def __init__(self, name, pillow_name, mime_type, feature=None,
+                 **save_options):
+        self.name = name
+        self.pillow_name = pillow_name
+        self.mime_type = mime_type
+        self.feature = feature
+        self.save_options = save_options
+
+    @property
+    def available(self):
+        return self.feature is None or self.feature in SUPPORTED
+
+
+# Порядок важен: браузер берёт первый подходящий <source>, последний
+# формат служит запасным <img>.
+FORMATS = (
+    Format('avif', 'AVIF', 'image/avif', feature='avif', quality=60),
+    Format('webp', 'WEBP', 'image/webp', feature='webp', quality=80,
+           method=4),
+    Format('jpeg', 'JPEG', 'image/jpeg', quality=82, optimize=True,
+           progressive=True),
+)
+
+
+def available_formats():
+    return [spec for spec in FORMATS if spec.available]
+
+
+def crop_to_aspect(image, aspect=IMAGE_ASPECT):
+    '''Обрезает картинку по центру до заданных пропорций.'''
+    width, height = image.size
+    target_width, target_height = aspect
+    if width * target_height > height * target_width:
+        new_width = height * target_width // target_height
+        left = (width - new_width) // 2
+        return image.crop((left, 0, left + new_width, height))
+    new_height = width * target_height // target_width
+    top = (height - new_height) // 2
+    return image.crop((0, top, width, top + new_height))
+
+
+def widths_for(source_width):
+    # Маленькие картинки не растягиваем дальше наименьшей ширины.
+    return [width for width in IMAGE_WIDTHS
+            if width <= source_width] or [IMAGE_WIDTHS[0]]
+
+
+def _encode(image, spec):
+    buffer = BytesIO()
+    image.save(buffer, spec.pillow_name, **spec.save_options)
+    return buffer.getvalue()
+
+
+def build_derivatives(post):
+    '''Строит набор копий картинки поста взамен прежнего.'''
+    with default_storage.open(post.image.name) as source:
+        image = Image.open(source)
+        image = crop_to_aspect(image.convert('RGB'))
+    stem = os.path.splitext(os.path.basename(post.image.name))[0]
+    created = []
+    for width in widths_for(image.width):
+        height = round(width * image.height / image.width)
+        resized = image.resize((width, height), Image.LANCZOS)
+        for spec in available_formats():
+            data = _encode(resized, spec)
+            name = default_storage.save(
+                f'{UPLOAD_TO}{post.pk}/{stem}-{width}.{spec.name}',
+                ContentFile(data))
+            created.append(ImageDerivative(
+                post_id=post.pk, file=name, format=spec.name,
+                width=width, height=height, size=len(data)))
+    with transaction.atomic():
+        if Post.objects.select_for_update().filter(pk=post.pk).exists():
+            stale = list(ImageDerivative.objects.filter(post_id=post.pk))
+            ImageDerivative.objects.filter(post_id=post.pk).delete()
+            ImageDerivative.objects.bulk_create(created)
+            cards.derivatives_changed(post.pk, created)
+        else:
+            # Пост удалили, пока строились копии.
+            stale, created = created, []
+    for derivative in stale:
+        default_storage.delete(derivative.file.name)
+    return created
+
+
+def picture(derivatives):
+    '''Данные для ``<picture>``: источники по форматам и запасной img.'''
+    by_format = {}
+    for derivative in derivatives:
+        by_format.setdefault(derivative.format, []).append(derivative)
+    if not by_format:
+        return None
+    sources = []
+    for spec in FORMATS:
+        if spec.name in by_format:
+            sources.append({
+                'type': spec.mime_type,
+                'srcset': ', '.join(
+                    f'{item.file.url} {item.width}w'
+                    for item in sorted(by_format[spec.name],
+                                       key=lambda item: item.width)),
+                'largest': max(by_format[spec.name],
+                               key=lambda item: item.width),
+            })
+    fallback = sources.pop()
+    return {'sources': sources, 'img': fallback['largest'],
+            'srcset': fallback['srcset']}
@@ -0,0 +1,162 @@
+'''Материализованная лента подписок (fan-out on write).
+
+Новый пост сразу раскладывается в ленты подписчиков автора, поэтому
+чтение ленты — один проход по индексу ``(user, pub_date)`` таблицы
+``FeedEntry``. Лента каждого пользователя ограничена ``FEED_SIZE``
+записями. Посты авторов, у которых больше ``FEED_FANOUT_LIMIT``
+подписчиков, не раскладываются: их лента подписчика добирает при
+чтении (fan-out on read). Когда автор перестаёт быть популярным,
+его свежие посты раскладываются в ленты подписчиков разом, иначе
+написанное в популярности из лент бы пропало.
+'''
+from django.db import connection
+from django.db.models import F, OuterRef, Q, Subquery
+
+from .models import FeedEntry, Follow, Post, UserStats
+from yatube.constants import FEED_BATCH_SIZE, FEED_FANOUT_LIMIT, FEED_SIZE
+
+FEED_ORDERING = ('-feed_date', '-feed_post')
+
+
+def is_popular(author_id):
+    return UserStats.objects.filter(
+        user_id=author_id, followers_count__gt=FEED_FANOUT_LIMIT).exists()
+
+
+def trim_feeds(user_ids):
+    '''Оставляет в лентах пользователей не больше FEED_SIZE записей.'''
+    oldest_kept = FeedEntry.objects.filter(
+        user_id=OuterRef('user_id')
+    ).order_by('-pub_date').values('pub_date')[FEED_SIZE - 1:FEED_SIZE]
+    FeedEntry.objects.filter(
+        user_id__in=user_ids,
+        pub_date__lt=Subquery(oldest_kept),
+    ).delete()
+
+
+def fan_out_post(post):
+    '''Раскладывает новый пост в ленты подписчиков автора.'''
+    fan_out_posts([post])
+
+
+def fan_out_posts(posts):
+    '''Раскладывает новые посты одного автора, читая подписчиков раз.'''
+    author_id = posts[0].author_id
+    if is_popular(author_id):
+        return
+    follower_ids = list(Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True))
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for post in posts for user_id in follower_ids),
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    for start in range(0, len(follower_ids), FEED_BATCH_SIZE):
+        trim_feeds(follower_ids[start:start + FEED_BATCH_SIZE])
+
+
+def backfill_feed(user_id, author_id):
+    '''Добавляет в ленту свежие посты автора, на которого подписались.
+
+    Посты популярного автора лента добирает при чтении.
+    '''
+    if is_popular(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date').values_list('pk', 'pub_date')[:FEED_SIZE]
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+         for pk, pub_date in posts),
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim_feeds([user_id])
+
+
+def fill_feeds():
+    '''Собирает ленты всех пользователей заново одним INSERT ... SELECT.
+
+    Нужно после массовой загрузки, которая обходит сигналы. В ленту
+    попадают FEED_SIZE свежих постов авторов, кроме популярных.
+    '''
+    FeedEntry.objects.all().delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {FeedEntry._meta.db_table} '
+            f'(user_id, post_id, pub_date) '
+            f'SELECT user_id, post_id, pub_date FROM ('
+            f' SELECT follow.user_id, post.id AS post_id, post.pub_date,'
+            f' ROW_NUMBER() OVER (PARTITION BY follow.user_id'
+            f' ORDER BY post.pub_date DESC, post.id DESC) AS position'
+            f' FROM {Follow._meta.db_table} follow'
+            f' JOIN {Post._meta.db_table} post'
+            f' ON post.author_id = follow.author_id'
+            f' LEFT JOIN {UserStats._meta.db_table} stats'
+            f' ON stats.user_id = follow.author_id'
+            f' WHERE COALESCE(stats.followers_count, 0) <= %s'
+            f') ranked WHERE position <= %s',
+            [FEED_FANOUT_LIMIT, FEED_SIZE])
+        return cursor.rowcount
+
+
+def drop_author_from_feed(user_id, author_id):
+    FeedEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def fan_out_author(author_id):
+    '''Раскладывает FEED_SIZE свежих постов автора всем подписчикам.'''
+    entries, follows = FeedEntry._meta.db_table, Follow._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {entries} (user_id, post_id, pub_date) '
+            f'SELECT follow.user_id, post.id, post.pub_date'
+            f' FROM {follows} follow, ('
+            f'  SELECT id, pub_date FROM {Post._meta.db_table}'
+            f'  WHERE author_id = %s ORDER BY pub_date DESC LIMIT %s'
+            f' ) post'
+            f' WHERE follow.author_id = %s AND NOT EXISTS ('
+            f'  SELECT 1 FROM {entries} entry'
+            f'  WHERE entry.user_id = follow.user_id'
+            f'  AND entry.post_id = post.id)',
+            [author_id, FEED_SIZE, author_id])
+    follower_ids = list(Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True))
+    for start in range(0, len(follower_ids), FEED_BATCH_SIZE):
+        trim_feeds(follower_ids[start:start + FEED_BATCH_SIZE])
+
+
+def follow_removed(follow):
+    '''Убирает автора из ленты отписавшегося.
+
+    Если отписка вывела автора из популярных, его посты раскладываются
+    подписчикам: чтение их больше не добирает.
+    '''
+    drop_author_from_feed(follow.user_id, follow.author_id)
+    if UserStats.objects.filter(user_id=follow.author_id,
+                                followers_count=FEED_FANOUT_LIMIT).exists():
+        fan_out_author(follow.author_id)
+
+
+def popular_authors_of(user):
+    return list(Follow.objects.filter(
+        user=user, author__stats__followers_count__gt=FEED_FANOUT_LIMIT,
+    ).values_list('author_id', flat=True))
+
+
+def follow_feed(user):
+    '''Посты ленты подписок; сортировать по ``FEED_ORDERING``.
+
+    Обычно это диапазон индекса ленты пользователя. Если пользователь
+    подписан на популярных авторов, их посты добавляются при чтении.
+    '''
+    popular = popular_authors_of(user)
+    if not popular:
+        return Post.objects.filter(feed_entries__user=user).annotate(
+            feed_date=F('feed_entries__pub_date'),
+            feed_post=F('feed_entries__post_id'))
+    return Post.objects.filter(
+        Q(pk__in=FeedEntry.objects.filter(user=user).values('post_id'))
+        | Q(author_id__in=popular)
+    ).annotate(feed_date=F('pub_date'), feed_post=F('pk'))
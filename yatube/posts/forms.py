@@ -1,6 +1,7 @@
 from django import forms
 
 from .models import Comment, Post
+from .uploads import check_upload, make_master
 
 
 class PostForm(forms.ModelForm):
@@ -18,6 +19,24 @@ class PostForm(forms.ModelForm):
             "text": "Текст нового поста"
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Лимиты проверяются до ImageField: он читает файл целиком.
+        self.upload_error = None
+        upload = self.files.get('image')
+        if upload is not None:
+            try:
+                check_upload(upload)
+            except forms.ValidationError as error:
+                self.upload_error = error
+                self.files = self.files.copy()
+                self.files.pop('image')
+
+    def clean_image(self):
+        if self.upload_error is not None:
+            raise self.upload_error
+        return make_master(self.cleaned_data['image'])
+
     def clean_field(self):
         data = self.cleaned_data["text"]
         if data == '':
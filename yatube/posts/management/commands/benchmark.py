@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержки, запросы к базе и память страниц постов; '
+            'результат сохраняется в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append',
+                            choices=benchmark.SCENARIOS, dest='scenarios',
+                            help='По умолчанию все сценарии')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--allocations', type=int, default=20,
+                            help='Запросов под tracemalloc')
+        parser.add_argument('--clear-cache', action='store_true',
+                            help='Очищать кэш перед каждым запросом')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Файл для результата в JSON')
+        parser.add_argument('--compare',
+                            help='Прошлый результат для сравнения')
+
+    def handle(self, *args, **options):
+        result = benchmark.run(
+            scenarios=options['scenarios'] or benchmark.SCENARIOS,
+            requests=options['requests'], warmup=options['warmup'],
+            allocations=options['allocations'],
+            clear_cache=options['clear_cache'], random_seed=options['seed'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(result, file, ensure_ascii=False, indent=2)
+        changes = {}
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                changes = benchmark.compare(json.load(file), result)
+        for scenario, stats in result['scenarios'].items():
+            if stats.get('skipped'):
+                self.stdout.write(f'{scenario}: пропущен, нет данных')
+                continue
+            self.stdout.write(
+                '{name}: p50 {p50_ms} мс, p99 {p99_ms} мс, запросов '
+                '{queries_p50}, память {alloc_peak_kb_p50} КБ, ошибок '
+                '{errors}'.format(name=scenario, **stats))
+            for metric, change in changes.get(scenario, {}).items():
+                self.stdout.write(f'  {metric}: {change:+}%')
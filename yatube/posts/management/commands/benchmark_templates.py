@@ -0,0 +1,27 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from posts import render_benchmark
+
+
+class Command(BaseCommand):
+    help = ('Замеряет рендеринг страницы ленты в каждом профиле шаблонов: '
+            'разметка в цикле против общей карточки поста')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--output', help='Файл для результата в JSON')
+
+    def handle(self, *args, **options):
+        result = render_benchmark.run(repeat=options['repeat'],
+                                      warmup=options['warmup'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(result, file, ensure_ascii=False, indent=2)
+        for profile, layouts in result.items():
+            for layout, stats in layouts.items():
+                self.stdout.write(
+                    '{profile}/{layout}: p50 {p50_ms} мс, p99 {p99_ms} мс'
+                    .format(profile=profile, layout=layout, **stats))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from posts import caching
+from posts.derivatives import build_derivatives
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Строит копии картинок для постов, у которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Пересобрать копии и у готовых постов')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').only(
+            'author_id', 'group_id', 'image')
+        if not options['all']:
+            posts = posts.filter(derivatives__isnull=True)
+        built, scopes = 0, set()
+        for post in posts.iterator():
+            build_derivatives(post)
+            scopes.update(caching.post_scopes(post))
+            built += 1
+        # Один сброс на весь прогон, а не на каждую картинку.
+        if scopes:
+            caching.bump(*scopes)
+        self.stdout.write(f'Подготовлено картинок: {built}')
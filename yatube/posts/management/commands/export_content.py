@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = 'Выгружает группы, посты, комментарии и подписки в JSONL или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output',
+                            help='Файл JSONL (можно .gz) или каталог CSV')
+        parser.add_argument('--format', choices=transfer.FORMATS,
+                            default=transfer.JSONL)
+
+    def handle(self, *args, **options):
+        counts = transfer.export(options['output'], options['format'])
+        for model, total in counts.items():
+            self.stdout.write(f'Выгружено {model}: {total}')
@@ -0,0 +1,50 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import transfer
+from yatube.constants import TRANSFER_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = ('Загружает выгрузку export_content пачками; прерванная '
+            'загрузка продолжается с контрольной точки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('input',
+                            help='Файл JSONL (можно .gz) или каталог CSV')
+        parser.add_argument('--format', choices=transfer.FORMATS,
+                            help='По умолчанию: CSV для каталога')
+        parser.add_argument('--batch-size', type=int,
+                            default=TRANSFER_BATCH_SIZE)
+        parser.add_argument('--checkpoint',
+                            help='По умолчанию: <input>.checkpoint')
+        parser.add_argument('--restart', action='store_true',
+                            help='Начать заново, забыв контрольную точку')
+        parser.add_argument('--skip-derived', action='store_true',
+                            help='Не пересчитывать счётчики, индекс и ленты')
+
+    def handle(self, *args, **options):
+        source = options['input']
+        if not os.path.exists(source):
+            raise CommandError(f'Нет такого файла или каталога: {source}')
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пачки должен быть положительным')
+        format = options['format'] or (
+            transfer.CSV if os.path.isdir(source) else transfer.JSONL)
+        checkpoint = (options['checkpoint']
+                      or source.rstrip(os.sep) + '.checkpoint')
+        if options['restart'] and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        importer = transfer.Importer(checkpoint, options['batch_size'])
+        if importer.finished:
+            self.stdout.write('Загрузка уже завершена; --restart начнёт '
+                              'её заново')
+            return
+        try:
+            importer.load(transfer.read(source, format, importer.position))
+        except (ValueError, KeyError) as error:
+            raise CommandError(f'Некорректная запись: {error!r}')
+        importer.finish(derived=not options['skip_derived'])
+        for model, total in importer.counts.items():
+            self.stdout.write(f'Загружено {model}: {total}')
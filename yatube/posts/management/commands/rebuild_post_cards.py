@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import caching, cards
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает карточки постов, из которых читаются ленты'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = cards.rebuild()
+        caching.bump(caching.POSTS)
+        self.stdout.write(f'Собрано карточек: {total}')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики и исправляет расхождения'
+
+    def handle(self, *args, **options):
+        fixed = {
+            'пользователей': counters.recount_users(),
+            'постов': counters.recount_posts(),
+            'групп': counters.recount_groups(),
+        }
+        for name, total in fixed.items():
+            self.stdout.write(f'Исправлено счётчиков {name}: {total}')
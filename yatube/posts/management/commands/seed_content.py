@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from posts import benchmark
+from yatube.constants import TRANSFER_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Наполняет базу нагрузочными данными для benchmark'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--groups', type=int, default=200)
+        parser.add_argument('--comments', type=int, default=500_000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Подписок на читателя в среднем')
+        parser.add_argument('--batch-size', type=int,
+                            default=TRANSFER_BATCH_SIZE)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        created = benchmark.seed(
+            users=options['users'], posts=options['posts'],
+            groups=options['groups'], comments=options['comments'],
+            follows=options['follows'], batch_size=options['batch_size'],
+            random_seed=options['seed'])
+        for model, total in created.items():
+            self.stdout.write(f'Создано {model}: {total}')
@@ -0,0 +1,182 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:05
+'''Таблицы FTS5 поискового индекса и их первое заполнение.
+
+Стеммер и заполнение заморожены здесь копией ``posts.stemmer`` и
+``posts.search`` на момент миграции: правки этих модулей не должны
+менять историю. Индекс, построенный другой версией стеммера,
+пересобирает ``manage.py rebuild_search_index``.
+'''
+import re
+from functools import lru_cache
+
+from django.db import migrations
+
+TOKENIZE = "tokenize = 'unicode61 remove_diacritics 2'"
+CREATE = (
+    f'CREATE VIRTUAL TABLE posts_search USING fts5(text, {TOKENIZE})',
+    'CREATE VIRTUAL TABLE posts_comment_search USING fts5('
+    f'text, post_id UNINDEXED, {TOKENIZE})',
+)
+BATCH_SIZE = 1000
+WORD = re.compile(r'\w+')
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND = (
+    ('в', 'вши', 'вшись'),
+    ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'),
+)
+ADJECTIVE = (
+    (),
+    ('ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем',
+     'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю',
+     'ая', 'яя', 'ою', 'ею'),
+)
+PARTICIPLE = (
+    ('ем', 'нн', 'вш', 'ющ', 'щ'),
+    ('ивш', 'ывш', 'ующ'),
+)
+REFLEXIVE = ((), ('ся', 'сь'))
+VERB = (
+    ('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет',
+     'ют', 'ны', 'ть', 'ешь', 'нно'),
+    ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй',
+     'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют',
+     'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'),
+)
+NOUN = (
+    (),
+    ('а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии',
+     'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам',
+     'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия',
+     'ья', 'я'),
+)
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+CYRILLIC_WORD = re.compile('^[а-я]+$')
+
+
+def _strip(word, groups):
+    '''Отрезает самое длинное окончание класса или возвращает None.
+
+    Окончания первой группы отрезаются, только если перед ними «а» или
+    «я», которые при этом остаются.
+    '''
+    best = None
+    for group, suffixes in enumerate(groups):
+        for suffix in suffixes:
+            if not word.endswith(suffix):
+                continue
+            stem = word[:-len(suffix)]
+            if group == 0 and not stem.endswith(('а', 'я')):
+                continue
+            if best is None or len(suffix) > len(word) - len(best):
+                best = stem
+    return best
+
+
+def _region(word, start=0):
+    '''Начало области после первой пары «гласная + согласная».'''
+    for index in range(start + 1, len(word)):
+        if word[index] not in VOWELS and word[index - 1] in VOWELS:
+            return index + 1
+    return len(word)
+
+
+def _step1(rv):
+    stem = _strip(rv, PERFECTIVE_GERUND)
+    if stem is not None:
+        return stem
+    rv = _strip(rv, REFLEXIVE) or rv
+    stem = _strip(rv, ADJECTIVE)
+    if stem is not None:
+        return _strip(stem, PARTICIPLE) or stem
+    for groups in (VERB, NOUN):
+        stem = _strip(rv, groups)
+        if stem is not None:
+            return stem
+    return rv
+
+
+@lru_cache(maxsize=65536)
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    if not CYRILLIC_WORD.match(word):
+        return word
+    first_vowel = next(
+        (index for index, char in enumerate(word) if char in VOWELS), None)
+    if first_vowel is None:
+        return word
+    prefix, rv = word[:first_vowel + 1], word[first_vowel + 1:]
+    rv = _step1(rv)
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    word = prefix + rv
+    r2 = _region(word, _region(word))
+    for suffix in DERIVATIONAL:
+        if word.endswith(suffix) and len(word) - len(suffix) >= r2:
+            word = word[:-len(suffix)]
+            break
+    rv = word[first_vowel + 1:]
+    for suffix in SUPERLATIVE:
+        if rv.endswith(suffix):
+            rv = rv[:-len(suffix)]
+            break
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    elif rv.endswith('ь'):
+        rv = rv[:-1]
+    return word[:first_vowel + 1] + rv
+
+
+def to_document(text):
+    return ' '.join(stem(word) for word in WORD.findall(text))
+
+
+def fill(cursor, table, names, rows):
+    placeholders = ', '.join(['%s'] * (len(names) + 1))
+    sql = (f'INSERT INTO {table} (rowid, {", ".join(names)}) '
+           f'VALUES ({placeholders})')
+    batch = []
+    for rowid, text, *rest in rows.order_by().iterator():
+        batch.append((rowid, to_document(text), *rest))
+        if len(batch) == BATCH_SIZE:
+            cursor.executemany(sql, batch)
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+
+
+def create_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    for statement in CREATE:
+        schema_editor.execute(statement)
+    alias = connection.alias
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    with connection.cursor() as cursor:
+        fill(cursor, 'posts_search', ('text',),
+             Post.objects.using(alias).values_list('pk', 'text'))
+        fill(cursor, 'posts_comment_search', ('text', 'post_id'),
+             Comment.objects.using(alias).values_list(
+                 'pk', 'text', 'post_id'))
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE posts_search')
+        schema_editor.execute('DROP TABLE posts_comment_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:29
+
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def fill_cards(apps, schema_editor):
+    '''Карточки существующих постов: замороженная копия ``cards.rebuild``.'''
+    alias = schema_editor.connection.alias
+    Post = apps.get_model('posts', 'Post')
+    PostCard = apps.get_model('posts', 'PostCard')
+    ImageDerivative = apps.get_model('posts', 'ImageDerivative')
+    posts = Post.objects.using(alias).order_by('pk').values_list(
+        'pk', 'pub_date', 'text', 'image', 'author_id', 'author__username',
+        'author__first_name', 'author__last_name', 'group_id',
+        'group__slug')
+    last = 0
+    while True:
+        batch = list(posts.filter(pk__gt=last)[:BATCH_SIZE])
+        if not batch:
+            return
+        derivatives = defaultdict(list)
+        for post_id, *row in ImageDerivative.objects.using(alias).filter(
+                post_id__in=[row[0] for row in batch]).order_by(
+                'post_id', 'format', 'width').values_list(
+                'post_id', 'file', 'format', 'width', 'height'):
+            derivatives[post_id].append(row)
+        PostCard.objects.using(alias).bulk_create(
+            PostCard(post_id=pk, pub_date=pub_date, text=text,
+                     image=image or '', author_id=author_id,
+                     author_username=username,
+                     author_first_name=first_name,
+                     author_last_name=last_name, group_id=group_id,
+                     group_slug=slug or '',
+                     derivatives=json.dumps(derivatives[pk]))
+            for (pk, pub_date, text, image, author_id, username,
+                 first_name, last_name, group_id, slug) in batch)
+        last = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0011_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostCard',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='posts.Post')),
+                ('pub_date', models.DateTimeField()),
+                ('text', models.TextField()),
+                ('image', models.CharField(blank=True, max_length=100)),
+                ('author_username', models.CharField(max_length=150)),
+                ('author_first_name', models.CharField(blank=True, max_length=30)),
+                ('author_last_name', models.CharField(blank=True, max_length=150)),
+                ('group_slug', models.SlugField(blank=True, db_index=False)),
+                ('derivatives', models.TextField(default='[]')),
+                ('author', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('group', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='posts.Group')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='postcard',
+            index=models.Index(fields=['pub_date'], name='card_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postcard',
+            index=models.Index(fields=['group', 'pub_date'], name='card_group_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postcard',
+            index=models.Index(fields=['author', 'pub_date'], name='card_author_pub_date_idx'),
+        ),
+        migrations.RunPython(fill_cards, migrations.RunPython.noop),
+    ]
@@ -1,20 +1,35 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
 
 from yatube.constants import SYMBOLS_ON_POST
 
 User = get_user_model()
 
 
+def without_counters(instance, kwargs, counters):
+    '''Не даёт обновлению устаревшего объекта затереть счётчики.'''
+    if not instance._state.adding and kwargs.get('update_fields') is None:
+        kwargs['update_fields'] = [
+            field.name for field in instance._meta.concrete_fields
+            if not field.primary_key and field.name not in counters
+        ]
+    return kwargs
+
+
 class Group(models.Model):
     ''' Класс Group предназначен для работы с группами.'''
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    posts_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self) -> str:
         return self.title
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **without_counters(self, kwargs,
+                                               ('posts_count',)))
+
 
 class Post(models.Model):
     ''' Класс Post предназначен для работы с постами.'''
@@ -37,10 +52,27 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        ordering = ('-pub_date', '-pk')
+        indexes = (
+            models.Index(fields=('pub_date',), name='post_pub_date_idx'),
+            models.Index(fields=('group', 'pub_date'),
+                         name='post_group_pub_date_idx'),
+            models.Index(fields=('author', 'pub_date'),
+                         name='post_author_pub_date_idx'),
+        )
 
     def __str__(self) -> str:
         return self.text[:SYMBOLS_ON_POST]
 
+    def save(self, *args, **kwargs):
+        # Счётчики и ленты обновляются в post_save той же транзакцией.
+        kwargs = without_counters(self, kwargs, ('comments_count',))
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class Comment(models.Model):
 
@@ -58,10 +90,18 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('-created',)
+        indexes = (
+            models.Index(fields=('post', 'created'),
+                         name='comment_post_created_idx'),
+        )
 
     def __str__(self):
         return self.text[:SYMBOLS_ON_POST]
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class Follow(models.Model):
     user = models.ForeignKey(User,
@@ -70,3 +110,105 @@ class Follow(models.Model):
     author = models.ForeignKey(User,
                                related_name='following',
                                on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(fields=('user', 'author'),
+                                    name='unique_follow'),
+        )
+        indexes = (
+            models.Index(fields=('author', 'user'),
+                         name='follow_author_user_idx'),
+        )
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class UserStats(models.Model):
+    ''' Денормализованные счётчики пользователя.'''
+    user = models.OneToOneField(User,
+                                primary_key=True,
+                                related_name='stats',
+                                on_delete=models.CASCADE)
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+
+class FeedEntry(models.Model):
+    ''' Запись материализованной ленты подписок пользователя.'''
+    user = models.ForeignKey(User,
+                             related_name='feed_entries',
+                             on_delete=models.CASCADE)
+    post = models.ForeignKey(Post,
+                             related_name='feed_entries',
+                             on_delete=models.CASCADE)
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(fields=('user', 'post'),
+                                    name='unique_feed_entry'),
+        )
+        indexes = (
+            models.Index(fields=('user', '-pub_date', '-post'),
+                         name='feed_user_pub_date_idx'),
+        )
+
+
+class ImageDerivative(models.Model):
+    ''' Уменьшенная копия картинки поста в одной ширине и формате.'''
+    post = models.ForeignKey(Post,
+                             related_name='derivatives',
+                             on_delete=models.CASCADE)
+    file = models.FileField(max_length=255)
+    format = models.CharField(max_length=10)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    size = models.PositiveIntegerField('Размер, байт')
+
+    class Meta:
+        ordering = ('post', 'format', 'width')
+        constraints = (
+            models.UniqueConstraint(fields=('post', 'format', 'width'),
+                                    name='unique_image_derivative'),
+        )
+
+
+class PostCard(models.Model):
+    ''' Строка ленты: всё, что выводит карточка поста, в одной таблице.'''
+    post = models.OneToOneField(Post,
+                                primary_key=True,
+                                related_name='card',
+                                on_delete=models.CASCADE)
+    pub_date = models.DateTimeField()
+    text = models.TextField()
+    image = models.CharField(max_length=100, blank=True)
+    # Индексы по автору и группе — составные, см. Meta.
+    author = models.ForeignKey(User,
+                               related_name='+',
+                               db_index=False,
+                               on_delete=models.CASCADE)
+    author_username = models.CharField(max_length=150)
+    author_first_name = models.CharField(max_length=30, blank=True)
+    author_last_name = models.CharField(max_length=150, blank=True)
+    group = models.ForeignKey(Group,
+                              blank=True,
+                              null=True,
+                              related_name='+',
+                              db_index=False,
+                              on_delete=models.SET_NULL)
+    group_slug = models.SlugField(blank=True, db_index=False)
+    # Копии картинки в JSON: [[файл, формат, ширина, высота], ...].
+    derivatives = models.TextField(default='[]')
+
+    class Meta:
+        indexes = (
+            models.Index(fields=('pub_date',), name='card_pub_date_idx'),
+            models.Index(fields=('group', 'pub_date'),
+                         name='card_group_pub_date_idx'),
+            models.Index(fields=('author', 'pub_date'),
+                         name='card_author_pub_date_idx'),
+        )
@@ -0,0 +1,171 @@
+'''Кэш постов, групп и авторов, которых ищут представления.
+
+Каждый вид объектов хранится в двух уровнях: LRU-словарь процесса
+ограниченного размера и общий кэш Django. Запись хранит объект
+в pickle вместе с областями кэша (см. ``caching``) и версией, с которой
+объект был прочитан; запись годна, пока версия не изменилась, так что
+сигналы, сбрасывающие ленты, сбрасывают и объекты — во всех процессах
+сразу. Каждый вызов получает свою копию объекта: представление может
+её менять и сохранять.
+
+При промахе объект из базы читает один поток процесса, а между
+процессами — тот, кто первым взял блокировку в общем кэше. Остальные
+ждут, пока он положит объект в кэш, поэтому наплыв читателей на
+популярный пост даёт одно чтение из базы.
+'''
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.http import Http404
+
+from .caching import author_scope, feed_version, group_scope, post_scope
+from .models import Group, Post, User
+from yatube.constants import (OBJECT_CACHE_SIZE, OBJECT_CACHE_TIMEOUT,
+                              OBJECT_LOCK_TIMEOUT)
+
+OBJECT_KEY = 'object:{}:{}'
+LOCK_POLL = 0.01
+LOCK_STRIPES = 64
+
+
+def _detach(obj, seen=None):
+    '''Отвязывает объект и связанные с ним от базы, откуда они прочитаны.
+
+    Объект из реплики иначе потянул бы связанные запросы в реплику и в
+    представлениях, которые пишут.
+    '''
+    seen = seen if seen is not None else set()
+    if obj is None or id(obj) in seen:
+        return
+    seen.add(id(obj))
+    obj._state.db = DEFAULT_DB_ALIAS
+    for related in obj._state.fields_cache.values():
+        _detach(related, seen)
+
+
+class ObjectCache:
+    '''Объекты одного вида по ключу поиска: id, слагу или имени.
+
+    ``fetch(key)`` читает объект из базы (None, если его нет),
+    ``scopes(obj)`` — области, при сбросе которых объект устаревает.
+    Области, известные до чтения, ``known(key)``, проверяются ещё раз
+    после чтения: объект, изменённый во время чтения, не сохраняется.
+    '''
+
+    def __init__(self, name, fetch, scopes, known=lambda key: (),
+                 size=OBJECT_CACHE_SIZE):
+        self.name = name
+        self.fetch = fetch
+        self.scopes = scopes
+        self.known = known
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def cache_key(self, key):
+        digest = hashlib.md5(str(key).encode()).hexdigest()
+        return OBJECT_KEY.format(self.name, digest)
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def _local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        return entry
+
+    def _fresh(self, entry):
+        return entry is not None and feed_version(*entry[0]) == entry[1]
+
+    def _shared(self, key):
+        entry = cache.get(self.cache_key(key))
+        if not self._fresh(entry):
+            return None
+        self._remember(key, entry)
+        return entry
+
+    def _load(self, key):
+        '''Читает объект из базы и кладёт его в оба уровня.'''
+        before = feed_version(*self.known(key))
+        obj = self.fetch(key)
+        if obj is None:
+            return None
+        _detach(obj)
+        scopes = self.scopes(obj)
+        entry = (scopes, feed_version(*scopes), pickle.dumps(obj))
+        if feed_version(*self.known(key)) == before:
+            cache.set(self.cache_key(key), entry, OBJECT_CACHE_TIMEOUT)
+            self._remember(key, entry)
+        return entry
+
+    def _wait(self, key):
+        '''Ждёт объект, который читает из базы другой процесс.'''
+        deadline = time.monotonic() + OBJECT_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL)
+            entry = self._shared(key)
+            if entry is not None:
+                return entry
+            if cache.get(self.cache_key(key) + ':lock') is None:
+                break
+        return None
+
+    def _miss(self, key):
+        lock_key = self.cache_key(key) + ':lock'
+        if cache.add(lock_key, 1, OBJECT_LOCK_TIMEOUT):
+            try:
+                return self._load(key)
+            finally:
+                cache.delete(lock_key)
+        return self._wait(key) or self._load(key)
+
+    def get(self, key):
+        '''Копия объекта или None, если такого нет.'''
+        entry = self._local(key)
+        if not self._fresh(entry):
+            stripe = self._key_locks[hash(key) % LOCK_STRIPES]
+            with stripe:
+                entry = self._local(key)
+                if not self._fresh(entry):
+                    entry = self._shared(key) or self._miss(key)
+        return None if entry is None else pickle.loads(entry[2])
+
+    def get_or_404(self, key):
+        obj = self.get(key)
+        if obj is None:
+            raise Http404(f'Нет объекта {self.name}: {key}')
+        return obj
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+post_cache = ObjectCache(
+    'post',
+    fetch=lambda pk: Post.objects.select_related(
+        'author__stats', 'group').filter(pk=pk).first(),
+    # Рядом с постом выводится число постов автора.
+    scopes=lambda post: (post_scope(post.pk), author_scope(post.author_id)),
+    known=lambda pk: (post_scope(pk),))
+group_cache = ObjectCache(
+    'group',
+    fetch=lambda slug: Group.objects.filter(slug=slug).first(),
+    scopes=lambda group: (group_scope(group.pk),))
+author_cache = ObjectCache(
+    'author',
+    fetch=lambda username: User.objects.select_related(
+        'stats').filter(username=username).first(),
+    scopes=lambda author: (author_scope(author.pk),))
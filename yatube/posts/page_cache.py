@@ -0,0 +1,109 @@
+'''Кэш целых страниц для анонимных читателей.
+
+Анонимы видят одни и те же ленты, поэтому страницу представления,
+помеченного ``cache_anonymous``, можно отдать из кэша, не проходя
+сессии, аутентификацию, CSRF и рендеринг. Ключ — путь с параметрами
+``PAGE_PARAMS`` (курсор страницы и формат ответа); запрос с любыми
+другими параметрами идёт мимо кэша, иначе мусорные ``?x=`` заполняли бы
+кэш и вытесняли из него версии областей. Вместе со страницей хранятся
+области кэша и версия, с которыми её собрало представление
+(``PageValidators``); запись годна, пока версия не изменилась, так что
+страницы сбрасывают те же сигналы, что и фрагменты лент.
+
+Запрос с cookie сессии идёт мимо кэша: читатель мог войти. Не
+сохраняются ответы, которые ставят cookie или выдали токен CSRF.
+Ответы помеченных представлений получают ``Vary: Cookie``, чтобы
+общие кэши перед сервером тоже не смешивали читателей.
+'''
+import hashlib
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import parse_http_date_safe
+
+from .caching import feed_version
+from .utilits import CURSOR_PARAM
+from yatube.constants import PAGE_CACHE_TIMEOUT
+
+PAGE_KEY = 'page:{}'
+SAFE_METHODS = ('GET', 'HEAD')
+PAGE_PARAMS = frozenset((CURSOR_PARAM, 'format'))
+
+
+def cache_anonymous(view):
+    '''Помечает представление, страницы которого можно хранить для анонимов.
+
+    Представление должно собирать ``PageValidators``: из них берутся
+    области, от которых зависит страница.
+    '''
+    view.cache_anonymous = True
+    return view
+
+
+def _cached_view(request):
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return False
+    return getattr(match.func, 'cache_anonymous', False)
+
+
+def page_key(request):
+    '''Ключ страницы или None, если в запросе есть чужие параметры.'''
+    if not PAGE_PARAMS.issuperset(request.GET):
+        return None
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    path = f'{request.path}?{query}'.encode()
+    return PAGE_KEY.format(hashlib.md5(path).hexdigest())
+
+
+def _storable(request, response):
+    return (request.method == 'GET'
+            and response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and not request.META.get('CSRF_COOKIE_USED')
+            and not request.user.is_authenticated
+            and getattr(request, 'page_validators', None) is not None)
+
+
+def _from_cache(request, key):
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    scopes, version, response = entry
+    if feed_version(*scopes) != version:
+        return None
+    return get_conditional_response(
+        request, etag=response.get('ETag'),
+        last_modified=parse_http_date_safe(response.get('Last-Modified')),
+        response=response) or response
+
+
+class AnonymousPageCacheMiddleware:
+    '''Ставится до ``SessionMiddleware``: попадание её не трогает.'''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in SAFE_METHODS or not _cached_view(request):
+            return self.get_response(request)
+        key = page_key(request)
+        if key is None or settings.SESSION_COOKIE_NAME in request.COOKIES:
+            response = self.get_response(request)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        response = _from_cache(request, key)
+        if response is not None:
+            return response
+        response = self.get_response(request)
+        patch_vary_headers(response, ('Cookie',))
+        if _storable(request, response):
+            validators = request.page_validators
+            cache.set(key, (validators.scopes, validators.version, response),
+                      PAGE_CACHE_TIMEOUT)
+        return response
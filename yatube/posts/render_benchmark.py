@@ -0,0 +1,112 @@
+'''Микробенчмарк рендеринга ленты без базы и без HTTP.
+
+Страница из ``POST_ON_PAGE`` постов (объекты в памяти, без картинок)
+рендерится движком каждого профиля шаблонов (см.
+``core.template_config``) в двух раскладках: ``inline`` — разметка
+поста прямо в цикле, как в шаблонах лент до общей карточки, и
+``post_card`` — цикл с ``include`` карточки
+``posts/includes/post_card.html``. Шаблоны ленты берутся загрузчиком,
+как шаблоны страниц: без кэширующего загрузчика каждый рендеринг
+заново читает и разбирает и ленту, и карточку.
+'''
+import statistics
+import time
+
+from django.conf import settings
+from django.template import Context, Engine
+from django.template.backends.django import get_installed_libraries
+from django.utils import timezone
+
+from core import template_config
+from .models import Group, Post, User
+from yatube.constants import POST_ON_PAGE
+
+LAYOUTS = {
+    'inline': '''{% for post in page_obj %}
+    <article>
+      <ul>
+        <li>
+          Автор:
+          <a href="{% url 'posts:profile' post.author.username %}">
+            {{ post.author.get_full_name }}</a>
+        </li>
+        <li>
+          Дата публикации: {{ post.pub_date|date:"d E Y"}}
+        </li>
+      </ul>
+      {% include 'posts/includes/post_image.html' %}
+      <p>
+        {{ post.text }}
+      </p>
+      <a href="{% url 'posts:post_detail' post.pk %}">подробная информация </a>
+      {% if post.group %}
+        <a href="{% url 'posts:group_list' post.group.slug %}">
+          все записи группы</a>
+      {% endif %}
+      {% if not forloop.last %}
+        <hr>
+      {% endif %}
+    </article>
+{% endfor %}''',
+    'post_card': '''{% for post in page_obj %}
+    {% include 'posts/includes/post_card.html' %}
+{% endfor %}''',
+}
+LOCMEM_LOADER = 'django.template.loaders.locmem.Loader'
+
+
+def engine(profile):
+    '''Движок как у профиля, плюс шаблоны раскладок из ``LAYOUTS``.'''
+    loaders = [(LOCMEM_LOADER, {f'{name}.html': source
+                                for name, source in LAYOUTS.items()}),
+               *template_config.LOADERS]
+    config = template_config.django_templates(
+        settings.TEMPLATES[0]['DIRS'], (), profile)[0]
+    debug = config['OPTIONS'].get('debug', True)
+    if 'loaders' in config['OPTIONS']:
+        loaders = [(template_config.CACHED_LOADER, loaders)]
+    return Engine(dirs=config['DIRS'], loaders=loaders, debug=debug,
+                  libraries=get_installed_libraries())
+
+
+def sample_page():
+    '''Посты в памяти: с автором и группой, как из карточек ленты.'''
+    now = timezone.now()
+    author = User(pk=1, username='author', first_name='Анна',
+                  last_name='Иванова')
+    group = Group(pk=1, slug='travel', title='Путешествия')
+    return [Post(pk=number, author=author,
+                 group=group if number % 2 else None, pub_date=now,
+                 text=' '.join(['Горы, море и дорога.'] * 12))
+            for number in range(1, POST_ON_PAGE + 1)]
+
+
+def _stats(times):
+    times = sorted(times)
+    return {'p50_ms': round(statistics.median(times), 3),
+            'p99_ms': round(times[max(0, round(0.99 * len(times)) - 1)],
+                            3)}
+
+
+def run(repeat=200, warmup=10):
+    '''Медиана и p99 времени рендеринга страницы, мс, по профилям.
+
+    Варианты чередуются на каждом повторе, чтобы фоновая нагрузка
+    машины сказывалась на всех одинаково.
+    '''
+    engines = {profile: engine(profile)
+               for profile in template_config.PROFILES}
+    context = {'page_obj': sample_page()}
+    times = {(profile, layout): []
+             for profile in engines for layout in LAYOUTS}
+    for attempt in range(warmup + repeat):
+        for (profile, layout), measured in times.items():
+            start = time.perf_counter()
+            engines[profile].get_template(f'{layout}.html').render(
+                Context(context))
+            if attempt >= warmup:
+                measured.append((time.perf_counter() - start) * 1000)
+    result = {profile: {} for profile in engines}
+    for (profile, layout), measured in times.items():
+        result[profile][layout] = _stats(measured)
+    return result
@@ -0,0 +1,215 @@
+'''Полнотекстовый поиск по постам на SQLite FTS5.
+
+Индекс — виртуальные таблицы ``posts_search`` (строка на пост) и
+``posts_comment_search`` (строка на комментарий), ``rowid`` в них равен
+``id`` записи. В индекс попадают основы слов (см. ``stemmer``), поэтому
+«котики» находят «котиков». Сигналы меняют по одной строке индекса той
+же транзакцией, что и саму запись; целиком индекс пересобирает команда
+``manage.py rebuild_search_index``.
+
+Выдача упорядочена по BM25 (совпадение в тексте поста весит больше, чем
+в комментарии) и листается курсором ``(score, id)``, как ленты.
+
+FTS5 есть только в SQLite: на других базах миграция таблиц индекса не
+создаёт, запись в индекс пропускается, а поиск сводится к
+``icontains`` по текстам постов и комментариев в порядке ленты.
+'''
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Comment, Post
+from .stemmer import stem
+from .utilits import FORWARD, CursorPaginator, InvalidCursor, decode_cursor
+
+POSTS_TABLE = 'posts_search'
+COMMENTS_TABLE = 'posts_comment_search'
+TEXT_WEIGHT = 1.0
+COMMENTS_WEIGHT = 0.3
+
+WORD = re.compile(r'\w+')
+
+
+def stems(text):
+    return [stem(word) for word in WORD.findall(text)]
+
+
+def to_document(text):
+    return ' '.join(stems(text))
+
+
+def to_match(query):
+    '''Выражение MATCH: все основы слов запроса, каждая в кавычках.'''
+    return ' AND '.join('"{}"'.format(word.replace('"', '""'))
+                        for word in dict.fromkeys(stems(query)))
+
+
+def is_enabled():
+    '''Есть ли в базе таблицы индекса (см. миграцию 0011).'''
+    return connection.vendor == 'sqlite'
+
+
+def _replace(table, rowid, columns):
+    if not is_enabled():
+        return
+    names = ', '.join(columns)
+    placeholders = ', '.join(['%s'] * (len(columns) + 1))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE rowid = %s', [rowid])
+        cursor.execute(
+            f'INSERT INTO {table} (rowid, {names}) VALUES ({placeholders})',
+            [rowid, *columns.values()])
+
+
+def _delete(table, rowid):
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE rowid = %s', [rowid])
+
+
+def index_post(post):
+    _replace(POSTS_TABLE, post.pk, {'text': to_document(post.text)})
+
+
+def remove_post(post_id):
+    _delete(POSTS_TABLE, post_id)
+
+
+def index_comment(comment):
+    _replace(COMMENTS_TABLE, comment.pk, {
+        'text': to_document(comment.text), 'post_id': comment.post_id})
+
+
+def remove_comment(comment_id):
+    _delete(COMMENTS_TABLE, comment_id)
+
+
+def rebuild(batch_size=1000, post_model=Post, comment_model=Comment):
+    '''Пересобирает индекс целиком; возвращает число документов.
+
+    Миграция передаёт сюда исторические модели.
+    '''
+    if not is_enabled():
+        return 0
+    total = 0
+    sources = (
+        (POSTS_TABLE, ('text',), post_model.objects.values_list(
+            'pk', 'text')),
+        (COMMENTS_TABLE, ('text', 'post_id'),
+         comment_model.objects.values_list('pk', 'text', 'post_id')),
+    )
+    for table, names, rows in sources:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table}')
+        batch = []
+        for rowid, text, *rest in rows.order_by().iterator():
+            batch.append((rowid, to_document(text), *rest))
+            if len(batch) == batch_size:
+                total += _insert(table, names, batch)
+                batch = []
+        total += _insert(table, names, batch)
+    return total
+
+
+def _insert(table, names, rows):
+    placeholders = ', '.join(['%s'] * (len(names) + 1))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} (rowid, {", ".join(names)}) '
+            f'VALUES ({placeholders})', rows)
+    return len(rows)
+
+
+# Посты, где все слова запроса есть в тексте поста или в одном из
+# комментариев, с лучшей оценкой BM25 (чем меньше, тем лучше).
+SCORES = (
+    f'SELECT post_id, MIN(score) AS score FROM ('
+    f' SELECT rowid AS post_id, bm25({POSTS_TABLE}) * %s AS score'
+    f' FROM {POSTS_TABLE} WHERE {POSTS_TABLE} MATCH %s'
+    f' UNION ALL'
+    f' SELECT post_id, bm25({COMMENTS_TABLE}) * %s'
+    f' FROM {COMMENTS_TABLE} WHERE {COMMENTS_TABLE} MATCH %s'
+    f') GROUP BY post_id'
+)
+
+
+def _scores_params(match):
+    return [TEXT_WEIGHT, match, COMMENTS_WEIGHT, match]
+
+
+def matching_ids_sql(query):
+    '''Подзапрос id подходящих постов для ``pk__in=RawSQL(...)``.'''
+    return (f'SELECT post_id FROM ({SCORES})',
+            _scores_params(to_match(query) or '""'))
+
+
+class SearchPaginator(CursorPaginator):
+    '''Выдача поиска по курсору ``(search_score, pk)``.
+
+    Навигация и курсоры — как у ``CursorPaginator``; меняется только
+    запрос страницы: сырой SQL к FTS5 вместо ORM.
+    '''
+
+    def __init__(self, query, per_page):
+        super().__init__(Post.objects.none(), per_page,
+                         ordering=('search_score', 'pk'))
+        self.match = to_match(query)
+
+    @staticmethod
+    def _check_values(values):
+        if (len(values) != 2
+                or not isinstance(values[0], (int, float))
+                or not isinstance(values[1], int)):
+            raise InvalidCursor(values)
+        return values
+
+    def _seek_sql(self, values, direction):
+        if values is None:
+            return '', []
+        sign = '>' if direction == FORWARD else '<'
+        return (f'WHERE score {sign} %s OR (score = %s AND post_id {sign} %s)',
+                [values[0], values[0], values[1]])
+
+    def page_queryset(self, cursor=None):
+        direction, values = FORWARD, None
+        if cursor:
+            direction, values = decode_cursor(cursor)
+            values = self._check_values(values)
+        if not self.match:
+            return direction, False, []
+        seek, seek_params = self._seek_sql(values, direction)
+        order = 'ASC' if direction == FORWARD else 'DESC'
+        with connection.cursor() as db_cursor:
+            db_cursor.execute(
+                f'SELECT post_id, score FROM ({SCORES}) {seek} '
+                f'ORDER BY score {order}, post_id {order} LIMIT %s',
+                [*_scores_params(self.match), *seek_params,
+                 self.per_page + 1])
+            scores = db_cursor.fetchall()
+        posts = Post.objects.select_related('author', 'group').in_bulk(
+            [post_id for post_id, _ in scores])
+        rows = []
+        for post_id, score in scores:
+            if post_id in posts:
+                posts[post_id].search_score = score
+                rows.append(posts[post_id])
+        return direction, values is not None, rows
+
+
+def plain_matches(query):
+    '''Посты с запросом в тексте или в комментарии, без индекса.'''
+    if not query:
+        return Post.objects.none()
+    commented = Comment.objects.filter(
+        text__icontains=query).values('post_id')
+    return Post.objects.select_related('author', 'group').filter(
+        Q(text__icontains=query) | Q(pk__in=commented))
+
+
+def results_paginator(query, per_page):
+    '''Выдача по индексу, а без него — по ``plain_matches``.'''
+    if is_enabled():
+        return SearchPaginator(query, per_page)
+    return CursorPaginator(plain_matches(query), per_page)
@@ -0,0 +1,105 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import cards, caching, counters, feed, search, thumbnails
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+# Вход пользователя сохраняет только last_login — ленты от него не зависят.
+LOGIN_FIELDS = frozenset(('last_login',))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, update_fields=None,
+               **kwargs):
+    if raw:
+        return
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+    elif update_fields is None or not LOGIN_FIELDS.issuperset(update_fields):
+        cards.author_changed(instance)
+        caching.meta_changed()
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    caching.meta_changed()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        caching.group_changed(instance)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, raw=False, **kwargs):
+    # При удалении группы ссылку карточки обнуляет SET_NULL.
+    if not raw:
+        cards.group_changed(instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_saved_post(sender, instance, raw=False, **kwargs):
+    if instance.pk is not None and not raw:
+        instance._saved_group_id, instance._saved_image = (
+            Post.objects.filter(pk=instance.pk).values_list(
+                'group_id', 'image').first() or (None, None))
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_group_id = instance.__dict__.pop('_saved_group_id', None)
+    image_changed = (instance.image.name
+                     != instance.__dict__.pop('_saved_image', None))
+    if image_changed:
+        thumbnails.schedule(instance)
+    cards.post_saved(instance, created, image_changed)
+    if created:
+        counters.post_added(instance)
+        feed.fan_out_post(instance)
+    else:
+        counters.post_moved(old_group_id, instance.group_id)
+    search.index_post(instance)
+    caching.post_changed(instance, old_group_id)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.post_removed(instance)
+    search.remove_post(instance.pk)
+    caching.post_changed(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.comment_added(instance)
+    search.index_comment(instance)
+    caching.comment_changed(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.comment_removed(instance)
+    search.remove_comment(instance.pk)
+    caching.comment_changed(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.follow_added(instance)
+        feed.backfill_feed(instance.user_id, instance.author_id)
+        caching.follow_changed(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.follow_removed(instance)
+    feed.follow_removed(instance)
+    caching.follow_changed(instance)
@@ -0,0 +1,20 @@
+from django import template
+
+from .. import thumbnails
+from ..derivatives import picture
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_picture(post):
+    '''Набор копий картинки поста; если его нет, ставит его в очередь.
+
+    Картинку, копии которой недавно не удалось собрать, не ставит.
+    '''
+    if not post.image:
+        return None
+    result = picture(post.derivatives.all())
+    if result is None and not thumbnails.failed(post.image.name):
+        thumbnails.schedule(post)
+    return result
@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.template import Context
+from django.test import TestCase
+from django.utils import timezone
+
+from .. import benchmark, render_benchmark
+from ..models import Comment, FeedEntry, Follow, Post, UserStats
+
+
+class BenchmarkTest(TestCase):
+    def test_seed_builds_skewed_graph_and_derived_data(self):
+        created = benchmark.seed(users=40, posts=200, groups=3,
+                                 comments=100, follows=5)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 100)
+        self.assertEqual(Follow.objects.count(), created['follows'])
+        top = UserStats.objects.order_by('-followers_count').first()
+        self.assertGreater(top.followers_count,
+                           3 * created['follows'] / 40)
+        self.assertTrue(FeedEntry.objects.exists())
+        post = Post.objects.order_by('?').first()
+        self.assertEqual(post.comments_count, post.comments.count())
+        # Даты разнесены по году, а не поставлены временем вставки.
+        day_ago = timezone.now() - timedelta(days=1)
+        self.assertGreater(Post.objects.filter(pub_date__lt=day_ago).count(),
+                           150)
+        self.assertGreater(
+            Comment.objects.filter(created__lt=day_ago).count(), 75)
+
+    def test_command_reports_every_scenario(self):
+        benchmark.seed(users=10, posts=30, groups=2, comments=10, follows=3)
+        handle, path = tempfile.mkstemp(dir=settings.BASE_DIR)
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        call_command('benchmark', requests=3, warmup=1, allocations=1,
+                     output=path, stdout=StringIO())
+        with open(path, encoding='utf-8') as file:
+            result = json.load(file)
+        self.assertEqual(set(result['scenarios']), set(benchmark.SCENARIOS))
+        for name, stats in result['scenarios'].items():
+            with self.subTest(scenario=name):
+                self.assertEqual(stats['errors'], 0)
+                # Страницы анонимам может отдать кэш страниц без базы.
+                if name in ('follow_index', 'add_comment'):
+                    self.assertGreater(stats['queries_max'], 0)
+                self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+        self.assertEqual(result['data']['posts'], 30)
+        out = StringIO()
+        call_command('benchmark', scenarios=['index'], requests=2,
+                     warmup=0, allocations=0, compare=path, stdout=out)
+        self.assertIn('p50_ms:', out.getvalue())
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(values, 0.5), 50)
+        self.assertEqual(benchmark.percentile(values, 0.99), 99)
+        self.assertIsNone(benchmark.percentile([], 0.5))
+
+
+class RenderBenchmarkTest(TestCase):
+    def test_layouts_render_the_same_posts(self):
+        posts = render_benchmark.sample_page()
+        for profile in render_benchmark.template_config.PROFILES:
+            engine = render_benchmark.engine(profile)
+            for layout in render_benchmark.LAYOUTS:
+                with self.subTest(profile=profile, layout=layout):
+                    page = engine.get_template(f'{layout}.html').render(
+                        Context({'page_obj': posts}))
+                    self.assertEqual(page.count('<article>'), len(posts))
+                    self.assertEqual(page.count('<hr>'), len(posts) - 1)
+
+    def test_command_reports_every_profile_and_layout(self):
+        out = StringIO()
+        call_command('benchmark_templates', repeat=2, warmup=0, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), len(
+            render_benchmark.template_config.PROFILES) * len(
+            render_benchmark.LAYOUTS))
+        self.assertIn('production/post_card: p50', out.getvalue())
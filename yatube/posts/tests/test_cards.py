@@ -0,0 +1,104 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from .. import cards
+from ..derivatives import picture
+from ..models import Group, ImageDerivative, Post, PostCard
+
+User = get_user_model()
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class PostCardTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth',
+                                            first_name='Иван',
+                                            last_name='Петров')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+
+    def setUp(self):
+        cache.clear()
+
+    def card(self, post):
+        return PostCard.objects.get(pk=post.pk)
+
+    def test_card_follows_post_author_and_group(self):
+        author = User.objects.create_user(username='author')
+        group = Group.objects.create(title='Другая', slug='other',
+                                     description='Описание')
+        post = Post.objects.create(text='Пост', author=author, group=group)
+        card = self.card(post)
+        self.assertEqual((card.text, card.pub_date, card.author_username,
+                          card.group_slug),
+                         ('Пост', post.pub_date, 'author', 'other'))
+        post.text = 'Правка'
+        post.group = None
+        post.save()
+        self.assertEqual((self.card(post).text, self.card(post).group_id),
+                         ('Правка', None))
+        post.group = group
+        post.save()
+        author.first_name = 'Пётр'
+        author.save()
+        group.slug = 'renamed'
+        group.save()
+        card = self.card(post)
+        self.assertEqual((card.author_first_name, card.group_slug),
+                         ('Пётр', 'renamed'))
+        group.delete()
+        self.assertIsNone(self.card(post).group_id)
+        post.delete()
+        self.assertFalse(PostCard.objects.exists())
+
+    def test_hydrated_post(self):
+        post = Post.objects.create(text='Пост', author=PostCardTest.user,
+                                   group=PostCardTest.group,
+                                   image='posts/cat.jpg')
+        built = [ImageDerivative(post=post, file=f'd/{width}.jpeg',
+                                 format='jpeg', width=width,
+                                 height=width // 3, size=1)
+                 for width in (320, 640)]
+        cards.derivatives_changed(post.pk, built)
+        with self.assertNumQueries(1):
+            hydrated = cards.hydrate(self.card(post))
+            self.assertEqual(hydrated, post)
+            self.assertEqual(hydrated.author.get_full_name(), 'Иван Петров')
+            self.assertEqual(hydrated.group.slug, 'group')
+            self.assertEqual(hydrated.image, post.image)
+            self.assertEqual(picture(hydrated.derivatives.all())['srcset'],
+                             picture(built)['srcset'])
+        # Чего нет в карточке, дочитывается из базы.
+        self.assertEqual(hydrated.group.title, 'Группа')
+
+    def test_bulk_created_posts_and_rebuild(self):
+        posts = [Post(pk=100 + i, author_id=PostCardTest.user.pk,
+                      group_id=PostCardTest.group.pk if i else None,
+                      text=f'Пост {i}') for i in range(3)]
+        Post.objects.bulk_create(posts)
+        # Автор и группа читаются одним запросом на вид.
+        with self.assertNumQueries(3):
+            cards.add_posts(posts)
+        self.assertEqual(PostCard.objects.filter(group_slug='group').count(),
+                         2)
+        PostCard.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_post_cards', stdout=out)
+        self.assertIn('3', out.getvalue())
+        self.assertEqual(PostCard.objects.count(), 3)
+
+    def test_feed_page_is_one_query(self):
+        for i in range(3):
+            Post.objects.create(text=f'Пост {i}', author=PostCardTest.user,
+                                image=f'posts/{i}.jpg')
+        with self.assertNumQueries(1):
+            response = Client().get(reverse('posts:index'))
+        self.assertEqual([post.text for post in response.context['page_obj']],
+                         ['Пост 2', 'Пост 1', 'Пост 0'])
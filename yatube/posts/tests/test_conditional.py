@@ -0,0 +1,137 @@
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, modify_settings
+from django.urls import reverse
+from django.utils.http import http_date
+
+from ..caching import POSTS, changed_at, feed_version
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+@modify_settings(MIDDLEWARE={
+    'remove': 'posts.page_cache.AnonymousPageCacheMiddleware'})
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        cls.post = Post.objects.create(text='Пост', author=cls.user,
+                                       group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(ConditionalGetTest.reader)
+        self.pages = {
+            'index': reverse('posts:index'),
+            'group': reverse('posts:group_list', args=('group',)),
+            'profile': reverse('posts:profile', args=('auth',)),
+            'post': reverse('posts:post_detail',
+                            args=(ConditionalGetTest.post.pk,)),
+        }
+
+    def revalidate(self, url, response, client=None):
+        return (client or self.client).get(
+            url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_page_is_not_rendered(self):
+        for name, url in self.pages.items():
+            with self.subTest(page=name):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response['ETag'].startswith('W/"'))
+                self.assertIn('no-cache', response['Cache-Control'])
+                # Группу, автора и пост отдаёт кэш объектов.
+                with self.assertNumQueries(0):
+                    repeated = self.revalidate(url, response)
+                self.assertEqual(repeated.status_code, 304)
+                self.assertEqual(repeated['ETag'], response['ETag'])
+                self.assertFalse(repeated.content)
+
+    def test_if_modified_since(self):
+        url = self.pages['index']
+        self.client.get(url)
+        later = time.time() + 2
+        with mock.patch('time.time', return_value=later):
+            response = self.client.get(url)
+            repeated = self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(repeated.status_code, 304)
+
+    def test_no_last_modified_in_second_of_change(self):
+        '''В секунду сброса новая запись не прячется за If-Modified-Since'''
+        url = self.pages['index']
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('Last-Modified'))
+        Post.objects.create(text='Свежий пост', author=ConditionalGetTest.user)
+        repeated = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=http_date(time.time()))
+        self.assertEqual(repeated.status_code, 200)
+        self.assertContains(repeated, 'Свежий пост')
+
+    def test_changes_produce_new_etag(self):
+        changes = {
+            'index': lambda: Post.objects.create(
+                text='Новый', author=ConditionalGetTest.reader),
+            'group': lambda: Post.objects.create(
+                text='Новый', author=ConditionalGetTest.reader,
+                group=ConditionalGetTest.group),
+            'profile': lambda: Post.objects.create(
+                text='Новый', author=ConditionalGetTest.user),
+            'post': lambda: Comment.objects.create(
+                text='Комментарий', post=ConditionalGetTest.post,
+                author=ConditionalGetTest.reader),
+        }
+        for name, change in changes.items():
+            with self.subTest(page=name):
+                url = self.pages[name]
+                response = self.client.get(url)
+                change()
+                self.assertEqual(
+                    self.revalidate(url, response).status_code, 200)
+
+    def test_reader_and_cursor_change_etag(self):
+        url = self.pages['profile']
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(
+            url, response, self.reader_client).status_code, 200)
+        self.assertNotEqual(
+            self.client.get(url, {'cursor': 'x'})['ETag'], response['ETag'])
+
+    def test_follow_changes_profile_for_reader(self):
+        url = self.pages['profile']
+        response = self.reader_client.get(url)
+        Follow.objects.create(user=ConditionalGetTest.reader,
+                              author=ConditionalGetTest.user)
+        self.assertEqual(self.revalidate(
+            url, response, self.reader_client).status_code, 200)
+
+    def test_follow_page_for_reader(self):
+        url = reverse('posts:follow_index')
+        response = self.reader_client.get(url)
+        self.assertEqual(self.revalidate(
+            url, response, self.reader_client).status_code, 304)
+        Follow.objects.create(user=ConditionalGetTest.reader,
+                              author=ConditionalGetTest.user)
+        self.assertEqual(self.revalidate(
+            url, response, self.reader_client).status_code, 200)
+
+    def test_missing_page_is_not_found(self):
+        response = self.client.get(
+            reverse('posts:group_list', args=('missing',)))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_changed_at_reads_version_time(self):
+        modified = changed_at(feed_version(POSTS))
+        self.assertIsNotNone(modified)
+        self.assertIsNone(changed_at('legacy.0123abcd'))
@@ -1,20 +1,25 @@
 import shutil
 import tempfile
 from http import HTTPStatus
+from io import BytesIO
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
 from ..models import Comment, Group, Post
+from ..uploads import EXIF_ORIENTATION, BoundedUploadHandler
 
 User = get_user_model()
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
+@override_settings(THUMBNAIL_WORKERS=0)
 class PostFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -169,3 +174,72 @@ class PostFormTests(TestCase):
                 author=self.user,
             ).exists()
         )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ImageUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(ImageUploadTests.user)
+
+    @staticmethod
+    def image_file(name, size=(300, 200), fmt='PNG', **save_options):
+        buffer = BytesIO()
+        image = Image.new('RGB', size, (20, 120, 220))
+        image.save(buffer, fmt, **save_options)
+        return SimpleUploadedFile(name, buffer.getvalue(),
+                                  content_type=Image.MIME[fmt])
+
+    def create_post(self, image):
+        return self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с картинкой', 'image': image})
+
+    def test_upload_limits(self):
+        '''Слишком тяжёлая или большая картинка не принимается'''
+        limits = {
+            'posts.uploads.IMAGE_MAX_BYTES': 'весит больше',
+            'posts.uploads.IMAGE_MAX_PIXELS': 'мегапикселей',
+        }
+        for limit, message in limits.items():
+            with self.subTest(limit=limit), mock.patch(limit, 100):
+                response = self.create_post(self.image_file('big.png'))
+                self.assertContains(response, message)
+                self.assertFalse(Post.objects.exists())
+
+    def test_upload_handler_stops_writing_past_limit(self):
+        handler = BoundedUploadHandler()
+        handler.new_file('image', 'big.png', 'image/png', None)
+        with mock.patch('posts.uploads.IMAGE_MAX_BYTES', 10):
+            handler.receive_data_chunk(b'x' * 8, 0)
+            handler.receive_data_chunk(b'x' * 8, 8)
+        upload = handler.file_complete(16)
+        self.assertEqual(upload.size, 16)
+        self.assertEqual(len(upload.read()), 8)
+
+    def test_master_is_transposed_and_stripped(self):
+        '''EXIF-поворот применяется один раз, метаданные удаляются'''
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = 6
+        self.create_post(self.image_file('photo.jpg', fmt='JPEG',
+                                         exif=exif.tobytes()))
+        with Image.open(Post.objects.get().image) as image:
+            self.assertEqual(image.size, (200, 300))
+            self.assertNotIn(EXIF_ORIENTATION, image.getexif())
+
+    @mock.patch('posts.uploads.IMAGE_MASTER_SIZE', 60)
+    def test_master_is_downscaled(self):
+        self.create_post(self.image_file('wide.png'))
+        post = Post.objects.get()
+        self.assertEqual(post.image.name, 'posts/wide.png')
+        self.assertEqual((post.image.width, post.image.height), (60, 40))
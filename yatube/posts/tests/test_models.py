@@ -1,7 +1,16 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
 from django.test import TestCase
 
-from ..models import SYMBOLS_ON_POST, Group, Post
+from yatube.constants import POST_ON_PAGE
+
+from ..feed import FEED_ORDERING, follow_feed
+from ..models import (SYMBOLS_ON_POST, Comment, Follow, Group, Post,
+                      UserStats)
+from ..utilits import CursorPaginator, encode_cursor
 
 User = get_user_model()
 
@@ -29,3 +38,145 @@ class PostModelTest(TestCase):
         group_test_title = str(group)
         self.assertEqual(post_test_title, post.text[:SYMBOLS_ON_POST])
         self.assertEqual(group_test_title, group.title)
+
+
+class FeedQueryPlanTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Тестовый текст поста',
+            group=cls.group,
+        )
+        Follow.objects.create(user=cls.reader, author=cls.user)
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        self.assertRegex(plan, r'USING (COVERING )?INDEX', plan)
+        self.assertNotIn('TEMP B-TREE', plan, plan)
+        for step in plan.splitlines():
+            self.assertFalse('SCAN' in step and 'USING' not in step, plan)
+
+    def test_feed_queries_use_indexes(self):
+        """Запросы лент идут по индексам без сортировки в памяти."""
+        post = FeedQueryPlanTest.post
+        cursor = encode_cursor([post.pub_date, post.pk])
+        feeds = {
+            'index': (Post.objects.all(), ('-pub_date', '-pk')),
+            'group': (FeedQueryPlanTest.group.posts.all(),
+                      ('-pub_date', '-pk')),
+            'profile': (FeedQueryPlanTest.user.posts.all(),
+                        ('-pub_date', '-pk')),
+            'follow': (follow_feed(FeedQueryPlanTest.reader),
+                       FEED_ORDERING),
+            'comments': (post.comments.all(), ('-created', '-pk')),
+        }
+        for name, (queryset, ordering) in feeds.items():
+            for page_cursor in (None, cursor):
+                with self.subTest(feed=name, cursor=page_cursor):
+                    paginator = CursorPaginator(queryset, POST_ON_PAGE,
+                                                ordering=ordering)
+                    self.assertUsesIndex(
+                        paginator.page_queryset(page_cursor)[2])
+
+    def test_follow_lookup_uses_unique_index(self):
+        """Проверка подписки идёт по уникальному индексу."""
+        self.assertUsesIndex(Follow.objects.filter(
+            user=FeedQueryPlanTest.reader, author=FeedQueryPlanTest.user))
+
+    def test_follow_is_unique(self):
+        """Повторная подписка на автора запрещена на уровне базы."""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user=FeedQueryPlanTest.reader,
+                                  author=FeedQueryPlanTest.user)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other_slug',
+            description='Тестовое описание',
+        )
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_post_counters(self):
+        """Счётчики постов автора и группы следуют за постами."""
+        post = Post.objects.create(author=CountersTest.user,
+                                   text='Тестовый текст поста',
+                                   group=CountersTest.group)
+        self.assertEqual(self.stats(CountersTest.user).posts_count, 1)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        post.group = CountersTest.other_group
+        post.save()
+        self.group.refresh_from_db()
+        self.other_group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(self.other_group.posts_count, 1)
+        post.delete()
+        self.other_group.refresh_from_db()
+        self.assertEqual(self.stats(CountersTest.user).posts_count, 0)
+        self.assertEqual(self.other_group.posts_count, 0)
+
+    def test_comment_and_follow_counters(self):
+        """Счётчики комментариев и подписок следуют за записями."""
+        post = Post.objects.create(author=CountersTest.user,
+                                   text='Тестовый текст поста')
+        comment = Comment.objects.create(post=post,
+                                         author=CountersTest.reader,
+                                         text='Комментарий')
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        follow = Follow.objects.create(user=CountersTest.reader,
+                                       author=CountersTest.user)
+        self.assertEqual(self.stats(CountersTest.user).followers_count, 1)
+        self.assertEqual(self.stats(CountersTest.reader).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.stats(CountersTest.user).followers_count, 0)
+        self.assertEqual(self.stats(CountersTest.reader).following_count, 0)
+
+    def test_stale_instance_does_not_overwrite_counter(self):
+        """Сохранение устаревшего поста не затирает счётчик."""
+        post = Post.objects.create(author=CountersTest.user,
+                                   text='Тестовый текст поста')
+        Comment.objects.create(post=post, author=CountersTest.reader,
+                               text='Комментарий')
+        post.text = 'Новый текст'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+    def test_reconcile_counters_fixes_drift(self):
+        """Команда reconcile_counters исправляет расхождения."""
+        Post.objects.bulk_create(
+            Post(author=CountersTest.user, group=CountersTest.group,
+                 text=f'Пост {i}') for i in range(3))
+        UserStats.objects.filter(user=CountersTest.reader).delete()
+        call_command('reconcile_counters', stdout=StringIO())
+        self.group.refresh_from_db()
+        self.assertEqual(self.stats(CountersTest.user).posts_count, 3)
+        self.assertEqual(self.group.posts_count, 3)
+        self.assertEqual(self.stats(CountersTest.reader).posts_count, 0)
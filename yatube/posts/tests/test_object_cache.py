@@ -0,0 +1,102 @@
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import Http404
+from django.test import TestCase
+
+from ..caching import group_scope
+from ..models import Comment, Group, Post
+from ..object_cache import ObjectCache, author_cache, post_cache
+
+User = get_user_model()
+
+
+class FakeGroups:
+    '''Чтение из «базы» с подсчётом обращений.'''
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, slug):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return Group(pk=len(slug), slug=slug, title=slug.upper())
+
+
+class ObjectCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(text='Пост', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def make(self, fetch, size=10):
+        return ObjectCache('test', fetch,
+                           lambda group: (group_scope(group.pk),), size=size)
+
+    def test_repeated_lookup_skips_database(self):
+        post_cache.get(ObjectCacheTest.post.pk)
+        with self.assertNumQueries(0):
+            post = post_cache.get(ObjectCacheTest.post.pk)
+            self.assertEqual(post.author.stats.posts_count, 1)
+        self.assertEqual(post, ObjectCacheTest.post)
+
+    def test_each_lookup_gets_own_copy(self):
+        post = post_cache.get(ObjectCacheTest.post.pk)
+        post.text = 'Изменено без сохранения'
+        self.assertEqual(post_cache.get(ObjectCacheTest.post.pk).text, 'Пост')
+
+    def test_writes_invalidate_objects(self):
+        post_cache.get(ObjectCacheTest.post.pk)
+        author_cache.get('auth')
+        Comment.objects.create(text='Комментарий', author=ObjectCacheTest.user,
+                               post=ObjectCacheTest.post)
+        Post.objects.create(text='Второй', author=ObjectCacheTest.user)
+        self.assertEqual(
+            post_cache.get(ObjectCacheTest.post.pk).comments_count, 1)
+        self.assertEqual(author_cache.get('auth').stats.posts_count, 2)
+
+    def test_missing_object(self):
+        self.assertIsNone(post_cache.get(0))
+        with self.assertRaises(Http404):
+            author_cache.get_or_404('nobody')
+
+    def test_lru_eviction(self):
+        fetch = FakeGroups()
+        objects = self.make(fetch, size=2)
+        for slug in ('a', 'bb', 'a', 'ccc'):
+            objects.get(slug)
+        self.assertEqual(list(objects._entries), ['a', 'ccc'])
+        # Вытесненный объект ещё лежит в общем кэше.
+        objects.get('bb')
+        self.assertEqual(fetch.calls, 3)
+
+    def test_burst_of_misses_reads_database_once(self):
+        fetch = FakeGroups(delay=0.05)
+        objects = self.make(fetch)
+        threads = [threading.Thread(target=objects.get, args=('viral',))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(fetch.calls, 1)
+
+    def test_waits_for_other_process(self):
+        here, there = FakeGroups(), FakeGroups()
+        objects, other = self.make(here), self.make(there)
+        lock_key = objects.cache_key('viral') + ':lock'
+        cache.add(lock_key, 1)
+        loader = threading.Timer(0.05, other._load, args=('viral',))
+        loader.start()
+        self.assertEqual(objects.get('viral').title, 'VIRAL')
+        loader.join()
+        self.assertEqual((here.calls, there.calls), (0, 1))
@@ -0,0 +1,105 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Group, Post
+
+User = get_user_model()
+
+
+class AnonymousPageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        cls.post = Post.objects.create(text='Пост', author=cls.user,
+                                       group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.pages = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=('group',)),
+            reverse('posts:profile', args=('auth',)),
+            reverse('posts:post_detail',
+                    args=(AnonymousPageCacheTest.post.pk,)),
+        )
+
+    def test_repeated_page_is_served_from_cache(self):
+        for url in self.pages:
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                self.assertIn('Cookie', first['Vary'])
+                with self.assertNumQueries(0):
+                    repeated = self.client.get(url)
+                self.assertEqual(repeated.status_code, 200)
+                self.assertIsNone(repeated.context)
+                self.assertEqual(repeated.content, first.content)
+                self.assertEqual(repeated['ETag'], first['ETag'])
+
+    def test_cursor_is_part_of_key(self):
+        url = reverse('posts:index')
+        self.client.get(url)
+        response = self.client.get(url, {'cursor': 'x'})
+        self.assertIsNotNone(response.context)
+
+    def test_unknown_params_bypass_cache(self):
+        url = reverse('posts:index')
+        self.client.get(url)
+        with mock.patch.object(cache, 'set') as store:
+            for number in range(5):
+                response = self.client.get(url, {'x': number})
+                self.assertEqual(response.status_code, 200)
+                self.assertIsNotNone(response.context)
+        store.assert_not_called()
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_conditional_request_on_hit(self):
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_new_content_invalidates_page(self):
+        url = reverse('posts:post_detail',
+                      args=(AnonymousPageCacheTest.post.pk,))
+        self.client.get(url)
+        Comment.objects.create(text='Новый комментарий',
+                               post=AnonymousPageCacheTest.post,
+                               author=AnonymousPageCacheTest.user)
+        response = self.client.get(url)
+        self.assertIsNotNone(response.context)
+        self.assertContains(response, 'Новый комментарий')
+        index = reverse('posts:index')
+        self.client.get(index)
+        Post.objects.create(text='Свежий пост',
+                            author=AnonymousPageCacheTest.user)
+        self.assertContains(self.client.get(index), 'Свежий пост')
+
+    def test_logged_in_reader_bypasses_cache(self):
+        url = reverse('posts:index')
+        self.client.get(url)
+        reader = Client()
+        reader.force_login(AnonymousPageCacheTest.user)
+        response = reader.get(url)
+        self.assertIsNotNone(response.context)
+        self.assertTrue(response.context['user'].is_authenticated)
+        reader.get(url)
+        self.assertIsNone(self.client.get(url).context)
+        # Страница вошедшего читателя в кэш не попадает.
+        cache.clear()
+        reader.get(url)
+        self.assertIsNotNone(self.client.get(url).context)
+
+    def test_pages_without_marker_are_not_cached(self):
+        url = reverse('posts:search')
+        self.client.get(url, {'q': 'пост'})
+        self.assertIsNotNone(self.client.get(url, {'q': 'пост'}).context)
@@ -0,0 +1,145 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Post
+from ..search import POSTS_TABLE
+from ..stemmer import stem
+
+User = get_user_model()
+
+
+class StemmerTest(TestCase):
+    def test_word_forms_share_stem(self):
+        forms = (
+            ('котики', 'котиков', 'котиками'),
+            ('красивая', 'красивый', 'красивейший'),
+            ('прочитал', 'прочитали', 'прочитала'),
+        )
+        for words in forms:
+            with self.subTest(words=words):
+                self.assertEqual(len({stem(word) for word in words}), 1)
+
+    def test_non_cyrillic_words(self):
+        self.assertEqual(stem('Django'), 'django')
+        self.assertEqual(stem('Ёлки'), stem('елки'))
+
+
+class SearchViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    def setUp(self):
+        self.client = Client()
+
+    def search(self, query, cursor=None):
+        params = {'q': query}
+        if cursor:
+            params['cursor'] = cursor
+        response = self.client.get(reverse('posts:search'), params)
+        return response.context['page_obj']
+
+    def test_finds_word_forms_in_posts_and_comments(self):
+        post = Post.objects.create(text='Фотографии котиков',
+                                   author=SearchViewTest.user)
+        other = Post.objects.create(text='Просто пост',
+                                    author=SearchViewTest.user)
+        Comment.objects.create(post=other, author=SearchViewTest.user,
+                               text='Тут тоже про котика')
+        Post.objects.create(text='Про собак', author=SearchViewTest.user)
+        page = self.search('котики')
+        self.assertEqual(list(page), [post, other])
+        self.assertEqual(list(self.search('фотография котика')), [post])
+        self.assertEqual(list(self.search('')), [])
+
+    def test_index_follows_changes(self):
+        post = Post.objects.create(text='Старый текст',
+                                   author=SearchViewTest.user)
+        comment = Comment.objects.create(post=post, author=post.author,
+                                         text='Комментарий про море')
+        post.text = 'Новый текст'
+        post.save()
+        self.assertEqual(list(self.search('старый')), [])
+        self.assertEqual(list(self.search('новый')), [post])
+        comment.delete()
+        self.assertEqual(list(self.search('море')), [])
+        post.delete()
+        self.assertEqual(list(self.search('текст')), [])
+
+    def test_cursor_pagination(self):
+        posts = [Post.objects.create(text=f'Пост про горы номер {number}',
+                                     author=SearchViewTest.user)
+                 for number in range(15)]
+        first = self.search('горы')
+        self.assertEqual(len(first), 10)
+        self.assertTrue(first.has_next())
+        second = self.search('горы', first.paginator.next_cursor)
+        self.assertEqual(len(second), 5)
+        self.assertEqual(set(first) | set(second), set(posts))
+        back = self.search('горы', second.paginator.previous_cursor)
+        self.assertEqual(list(back), list(first))
+        self.assertEqual(list(self.search('горы', 'мусор')), list(first))
+
+    def test_pagination_keeps_query(self):
+        for number in range(11):
+            Post.objects.create(text=f'Река {number}',
+                                author=SearchViewTest.user)
+        response = self.client.get(reverse('posts:search'), {'q': 'река'})
+        self.assertContains(response,
+                            '?q=%D1%80%D0%B5%D0%BA%D0%B0&amp;cursor=')
+
+    @mock.patch('posts.search.is_enabled', return_value=False)
+    def test_without_index_falls_back_to_icontains(self, enabled):
+        """Без таблиц FTS5 запись их не трогает, а поиск идёт по LIKE."""
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {POSTS_TABLE}')
+        post = Post.objects.create(text='Фотографии котиков',
+                                   author=SearchViewTest.user)
+        other = Post.objects.create(text='Просто пост',
+                                    author=SearchViewTest.user)
+        Comment.objects.create(post=other, author=SearchViewTest.user,
+                               text='Тут тоже про котиков')
+        post.delete()
+        self.assertEqual(list(self.search('котиков')), [other])
+        self.assertEqual(list(self.search('')), [])
+
+    def test_query_uses_fts_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'EXPLAIN QUERY PLAN SELECT rowid FROM {POSTS_TABLE} '
+                f'WHERE {POSTS_TABLE} MATCH %s', ['"кот"'])
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('VIRTUAL TABLE INDEX', plan)
+
+
+class SearchAdminTest(TestCase):
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        Post.objects.create(text='Отпуск на море', author=admin)
+        Post.objects.create(text='Морской бой', author=admin)
+        client = Client()
+        client.force_login(admin)
+        response = client.get('/admin/posts/post/', {'q': 'морем'})
+        self.assertEqual(
+            [post.text for post in response.context['cl'].result_list],
+            ['Отпуск на море'])
+
+    def test_rebuild_command(self):
+        user = User.objects.create_user(username='auth')
+        post = Post.objects.create(text='Пост', author=user)
+        Comment.objects.create(post=post, author=user, text='Комментарий')
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {POSTS_TABLE}')
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Проиндексировано записей: 2', out.getvalue())
+        self.assertEqual(
+            list(Client().get(reverse('posts:search'),
+                              {'q': 'пост'}).context['page_obj']), [post])
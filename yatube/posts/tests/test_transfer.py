@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase
+
+from .. import transfer
+from ..models import Comment, FeedEntry, Follow, Group, Post
+
+User = get_user_model()
+
+PUB_DATE = datetime(2020, 5, 17, 12, 30, tzinfo=timezone.utc)
+
+
+class TransferTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        author = User.objects.create_user(username='leo')
+        reader = User.objects.create_user(username='reader')
+        group = Group.objects.create(title='Группа', slug='group',
+                                     description='Описание')
+        for number in range(5):
+            Post.objects.create(text=f'Пост про горы {number}',
+                                author=author, group=group)
+        Post.objects.update(pub_date=PUB_DATE)
+        Comment.objects.create(post=Post.objects.first(), author=reader,
+                               text='Комментарий')
+        Comment.objects.update(created=PUB_DATE)
+        Follow.objects.create(user=reader, author=author)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def export_and_clear(self, name, format=transfer.JSONL):
+        call_command('export_content', self.path(name), format=format,
+                     stdout=StringIO())
+        User.objects.all().delete()
+        Group.objects.all().delete()
+
+    def assert_restored(self):
+        author = User.objects.get(username='leo')
+        self.assertEqual(author.posts.count(), 5)
+        self.assertTrue(all(post.pub_date == PUB_DATE
+                            for post in author.posts.all()))
+        self.assertEqual(Group.objects.get(slug='group').posts_count, 5)
+        comment = Comment.objects.get()
+        self.assertEqual(comment.created, PUB_DATE)
+        self.assertEqual(comment.author.username, 'reader')
+        self.assertEqual(comment.post.comments_count, 1)
+        self.assertEqual(author.stats.followers_count, 1)
+        self.assertEqual(FeedEntry.objects.filter(
+            user__username='reader').count(), 5)
+        self.assertFalse(author.has_usable_password())
+
+    def test_jsonl_round_trip(self):
+        for name in ('dump.jsonl', 'dump.jsonl.gz'):
+            with self.subTest(name=name):
+                self.export_and_clear(name)
+                call_command('import_content', self.path(name),
+                             stdout=StringIO())
+                self.assert_restored()
+
+    def test_csv_round_trip(self):
+        self.export_and_clear('dump', transfer.CSV)
+        out = StringIO()
+        call_command('import_content', self.path('dump'), batch_size=2,
+                     stdout=out)
+        self.assertIn('Загружено post: 5', out.getvalue())
+        self.assert_restored()
+        results = Client().get('/search/', {'q': 'горы'}).context['page_obj']
+        self.assertEqual(len(results), 5)
+
+    def test_ids_are_shifted_and_authors_matched(self):
+        call_command('export_content', self.path('dump.jsonl'),
+                     stdout=StringIO())
+        before = set(Post.objects.values_list('pk', flat=True))
+        call_command('import_content', self.path('dump.jsonl'),
+                     stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 10)
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(Group.objects.count(), 1)
+        self.assertEqual(Follow.objects.count(), 1)
+        imported = Post.objects.exclude(pk__in=before)
+        self.assertGreater(min(post.pk for post in imported), max(before))
+        self.assertEqual(Comment.objects.filter(
+            post__in=imported).count(), 1)
+
+    def test_import_keeps_auto_now_add(self):
+        '''Импорт не снимает auto_now_add с общих для процесса полей'''
+        self.export_and_clear('dump.jsonl')
+        fields = (Post._meta.get_field('pub_date'),
+                  Comment._meta.get_field('created'))
+
+        def watched(records):
+            for record in records:
+                self.assertTrue(all(field.auto_now_add for field in fields))
+                yield record
+
+        importer = transfer.Importer()
+        importer.load(watched(transfer.read(self.path('dump.jsonl'))))
+        importer.finish()
+        self.assert_restored()
+
+    def test_import_resumes_from_checkpoint(self):
+        self.export_and_clear('dump.jsonl')
+        checkpoint = self.path('dump.jsonl.checkpoint')
+        records = transfer.read(self.path('dump.jsonl'))
+        interrupted = (record for number, record in enumerate(records)
+                       if number < 4 or 1 / 0)
+        with self.assertRaises(ZeroDivisionError):
+            transfer.Importer(checkpoint, batch_size=2).load(interrupted)
+        self.assertEqual(Post.objects.count(), 2)
+        out = StringIO()
+        call_command('import_content', self.path('dump.jsonl'),
+                     batch_size=2, stdout=out)
+        self.assertIn('Загружено post: 5', out.getvalue())
+        self.assert_restored()
+        out = StringIO()
+        call_command('import_content', self.path('dump.jsonl'),
+                     stdout=out)
+        self.assertIn('Загрузка уже завершена', out.getvalue())
+        self.assertEqual(Post.objects.count(), 5)
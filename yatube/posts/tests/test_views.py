@@ -1,24 +1,35 @@
 import shutil
 import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from PIL import Image
 
-from yatube.constants import POST_ON_LAS_PAGE_TEST, POST_ON_PAGE
+from yatube.constants import (COMMENTS_ON_PAGE, POST_ON_LAS_PAGE_TEST,
+                              POST_ON_PAGE)
 
-from ..models import Follow, Group, Post
+from .. import cards, derivatives, thumbnails
+from ..caching import POSTS, feed_version
+from ..models import (Comment, FeedEntry, Follow, Group, ImageDerivative,
+                      Post, PostCard)
+from ..utilits import CursorPaginator
 
 User = get_user_model()
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
 class PostViewTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -125,6 +136,22 @@ class PostViewTest(TestCase):
         self.assertEqual(page_context.group, self.post.group)
         self.assertEqual(page_context.image, self.post.image)
 
+    def test_feeds_use_post_card(self):
+        """Ленты и поиск выводят посты общей карточкой."""
+        group_url = reverse('posts:group_list', args=(self.group.slug,))
+        search_url = reverse('posts:search') + '?q=описание'
+        for url in (reverse('posts:index'), group_url,
+                    reverse('posts:profile', args=(self.user.username,)),
+                    search_url):
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertTemplateUsed(response,
+                                        'posts/includes/post_card.html')
+                self.assertContains(response, self.post.text)
+        # На странице группы ссылка на неё же не нужна.
+        response = self.authorized_client.get(group_url)
+        self.assertNotContains(response, f'href="{group_url}"')
+
     def test_post_detail_show_correct_context(self):
         """Шаблон post_detail сформирован с правильным контекстом."""
         response = self.authorized_client.get(
@@ -197,8 +224,11 @@ class PaginatorViewsTest(TestCase):
             )
             for i in range(POST_ON_LAS_PAGE_TEST + POST_ON_PAGE)
         )
+        # bulk_create не шлёт сигналов: карточки лент собираем сами.
+        cards.rebuild()
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(PaginatorViewsTest.user)
@@ -219,12 +249,53 @@ class PaginatorViewsTest(TestCase):
         for position, page in data.items():
             with self.subTest(position=position):
                 response_page_1 = self.guest_client.get(page)
-                response_page_2 = self.guest_client.get(page + '?page=2')
-                self.assertEqual(len(response_page_1.context['page_obj']),
-                                 POST_ON_PAGE)
+                page_1 = response_page_1.context['page_obj']
+                response_page_2 = self.guest_client.get(
+                    page, {'cursor': page_1.paginator.next_cursor})
+                self.assertEqual(len(page_1), POST_ON_PAGE)
                 self.assertEqual(len(response_page_2.context['page_obj']),
                                  POST_ON_LAS_PAGE_TEST)
 
+    def test_cursor_pages_walk_forward_and_back(self):
+        '''Курсоры ведут вперёд и назад без пропусков и повторов'''
+        url = reverse('posts:index')
+        expected = list(Post.objects.order_by('-pub_date', '-pk'))
+        page_1 = self.guest_client.get(url).context['page_obj']
+        self.assertFalse(page_1.has_previous())
+        self.assertTrue(page_1.has_next())
+        page_2 = self.guest_client.get(
+            url, {'cursor': page_1.paginator.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(page_1) + list(page_2), expected)
+        self.assertTrue(page_2.has_previous())
+        self.assertFalse(page_2.has_next())
+        back = self.guest_client.get(
+            url, {'cursor': page_2.paginator.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(back), list(page_1))
+        self.assertFalse(back.has_previous())
+
+    def test_invalid_cursor_returns_first_page(self):
+        '''Испорченный курсор отдаёт первую страницу'''
+        url = reverse('posts:index')
+        for cursor in ('garbage', 'eyJkIjoibmV4dCJ9', '%%%'):
+            with self.subTest(cursor=cursor):
+                response = self.guest_client.get(url, {'cursor': cursor})
+                page = response.context['page_obj']
+                self.assertEqual(len(page), POST_ON_PAGE)
+                self.assertFalse(page.has_previous())
+
+    def test_cursor_page_does_not_count_or_offset(self):
+        '''Страница выбирается без COUNT(*) и OFFSET'''
+        page_1 = CursorPaginator(Post.objects.all(), POST_ON_PAGE).page()
+        paginator = CursorPaginator(Post.objects.all(), POST_ON_PAGE)
+        with CaptureQueriesContext(connection) as queries:
+            list(paginator.page(page_1.paginator.next_cursor))
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]['sql'].upper()
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('OFFSET', sql)
+
 
 class CacheTest(TestCase):
     @classmethod
@@ -233,6 +304,7 @@ class CacheTest(TestCase):
         cls.user = User.objects.create_user(username='auth')
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
 
     def test_cache_index(self):
@@ -240,15 +312,171 @@ class CacheTest(TestCase):
         self.post = Post.objects.create(text='Тестируем кэширование',
                                         author=self.user)
         response_before = self.guest_client.get(reverse('posts:index'))
-        self.post = Post.objects.filter(
-            text='Тестируем кэширование',
-            author=self.user
-        ).delete()
-        response_after = self.guest_client.get(reverse('posts:index'))
-        self.assertEqual(response_before.content, response_after.content)
+        # Правка мимо сигналов не сбрасывает версию: отдаётся кэш.
+        Post.objects.filter(pk=self.post.pk).update(text='Тихая правка')
+        PostCard.objects.filter(pk=self.post.pk).update(text='Тихая правка')
+        response_cached = self.guest_client.get(reverse('posts:index'))
+        self.assertEqual(response_before.content, response_cached.content)
         cache.clear()
         next_response = self.guest_client.get(reverse('posts:index'))
-        self.assertNotEqual(response_before.content, next_response)
+        self.assertNotEqual(response_before.content, next_response.content)
+
+    def test_cache_is_invalidated_by_events(self):
+        '''Создание и удаление поста сбрасывают кэш его лент'''
+        group = Group.objects.create(title='Тестовая группа',
+                                     slug='test_url',
+                                     description='Тестовое описание')
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': CacheTest.user.username}),
+        )
+        for page in pages:
+            self.guest_client.get(page)
+        post = Post.objects.create(text='Новый пост в кэше',
+                                   author=CacheTest.user, group=group)
+        for page in pages:
+            with self.subTest(page=page):
+                self.assertContains(self.guest_client.get(page), post.text)
+        post.delete()
+        for page in pages:
+            with self.subTest(page=page):
+                self.assertNotContains(self.guest_client.get(page),
+                                       post.text)
+
+    def test_comment_invalidates_post_detail(self):
+        '''Новый комментарий сразу виден на странице поста'''
+        post = Post.objects.create(text='Пост', author=CacheTest.user)
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        self.guest_client.get(url)
+        Comment.objects.create(post=post, author=CacheTest.user,
+                               text='Свежий комментарий')
+        self.assertContains(self.guest_client.get(url), 'Свежий комментарий')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ImageDerivativeTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(ImageDerivativeTest.user)
+
+    @staticmethod
+    def uploaded(size=(1000, 800)):
+        buffer = BytesIO()
+        Image.new('RGB', size, (200, 30, 30)).save(buffer, 'PNG')
+        return SimpleUploadedFile('picture.png', buffer.getvalue(),
+                                  content_type='image/png')
+
+    def test_saving_image_schedules_derivatives(self):
+        """Копии строятся после фиксации транзакции с постом."""
+        with mock.patch('posts.thumbnails.transaction.on_commit') as hook:
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Пост с картинкой', 'image': self.uploaded()})
+        post = Post.objects.get(text='Пост с картинкой')
+        self.assertFalse(post.derivatives.exists())
+        for callback, *_ in hook.call_args_list:
+            callback[0]()
+        jpeg = post.derivatives.filter(format='jpeg')
+        self.assertEqual(
+            list(jpeg.values_list('width', 'height')),
+            [(320, 113), (640, 226), (960, 339)])
+        for derivative in jpeg:
+            with self.subTest(width=derivative.width):
+                self.assertEqual(derivative.size, derivative.file.size)
+
+    def test_small_image_is_not_upscaled_past_smallest_width(self):
+        post = Post.objects.create(
+            text='Пост', author=ImageDerivativeTest.user,
+            image=self.uploaded((500, 500)))
+        built = derivatives.build_derivatives(post)
+        self.assertEqual({item.width for item in built}, {320})
+        derivatives.build_derivatives(post)
+        self.assertEqual(post.derivatives.count(), len(built))
+
+    def test_page_never_resizes_in_request(self):
+        """Без готовых копий страница отдаёт заглушку."""
+        post = Post.objects.create(
+            text='Пост', author=ImageDerivativeTest.user,
+            image=self.uploaded())
+        with mock.patch('posts.thumbnails.build_derivatives') as build, \
+                mock.patch('posts.thumbnails.schedule') as schedule:
+            response = self.authorized_client.get(reverse('posts:index'))
+        build.assert_not_called()
+        schedule.assert_called_once_with(post)
+        self.assertContains(response, 'aspect-ratio')
+        index_version = feed_version(POSTS)
+        thumbnails.generate(post.pk, post.image.name)
+        # Готовая картинка сбрасывает области поста, а не все ленты.
+        self.assertEqual(feed_version(POSTS), index_version)
+        response = self.authorized_client.get(
+            reverse('posts:profile', args=(ImageDerivativeTest.user,)))
+        self.assertNotContains(response, 'aspect-ratio')
+        for derivative in post.derivatives.all():
+            with self.subTest(width=derivative.width):
+                self.assertContains(
+                    response, f'{derivative.file.url} {derivative.width}w')
+
+    def test_command_resets_versions_once(self):
+        for number in range(3):
+            Post.objects.create(text=f'Пост {number}',
+                                author=ImageDerivativeTest.user,
+                                image=self.uploaded((400, 300)))
+        out = StringIO()
+        with mock.patch('posts.caching.bump') as bump:
+            call_command('build_image_derivatives', stdout=out)
+        self.assertIn('Подготовлено картинок: 3', out.getvalue())
+        bump.assert_called_once()
+        self.assertIn(POSTS, bump.call_args[0])
+
+    def test_failed_image_is_not_rescheduled_on_every_view(self):
+        post = Post.objects.create(
+            text='Пост', author=ImageDerivativeTest.user,
+            image='posts/missing.png')
+        with self.assertLogs('posts.thumbnails', 'ERROR'):
+            thumbnails.generate(post.pk, post.image.name)
+        self.assertTrue(thumbnails.failed(post.image.name))
+        with mock.patch('posts.thumbnails.schedule') as schedule:
+            response = self.authorized_client.get(reverse('posts:index'))
+        schedule.assert_not_called()
+        self.assertContains(response, 'aspect-ratio')
+
+    @override_settings(THUMBNAIL_WORKERS=2)
+    def test_no_background_work_inside_transaction(self):
+        """Внутри транзакции копии строятся в вызывающем потоке."""
+        with mock.patch('posts.thumbnails._executor') as executor, \
+                mock.patch('posts.thumbnails.generate') as generate:
+            thumbnails.submit(0, 'posts/inline.png')
+        executor.assert_not_called()
+        generate.assert_called_once_with(0, 'posts/inline.png')
+
+    def test_picture_markup(self):
+        post = Post.objects.create(
+            text='Пост', author=ImageDerivativeTest.user,
+            image=self.uploaded())
+        ImageDerivative.objects.bulk_create(
+            ImageDerivative(post=post, file=f'd/{width}.{fmt}', format=fmt,
+                            width=width, height=width // 3, size=1)
+            for fmt in ('webp', 'jpeg') for width in (640, 320))
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertContains(
+            response, 'type="image/webp" srcset="/media/d/320.webp 320w, '
+                      '/media/d/640.webp 640w"')
+        self.assertContains(response, 'src="/media/d/640.jpeg"')
+        self.assertContains(response, 'width="640" height="213"')
 
 
 class FollowViewsTest(TestCase):
@@ -302,3 +530,206 @@ class FollowViewsTest(TestCase):
         last_post_not_foll = response_of_not_follower.context['page_obj']
         self.assertIn(post, last_post_foll)
         self.assertNotIn(post, last_post_not_foll)
+
+    def test_follow_index_reads_fanned_out_feed(self):
+        '''Новые посты раскладываются в ленты подписчиков по порядку'''
+        Follow.objects.create(user=FollowViewsTest.user,
+                              author=FollowViewsTest.author)
+        posts = [Post.objects.create(author=FollowViewsTest.author,
+                                     text=f'Пост {i}') for i in range(3)]
+        self.assertEqual(
+            FeedEntry.objects.filter(user=FollowViewsTest.user).count(), 3)
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']),
+                         posts[::-1])
+
+    def test_unfollow_drops_author_from_feed(self):
+        '''После отписки посты автора пропадают из ленты'''
+        Post.objects.create(author=FollowViewsTest.author, text='Текст')
+        Follow.objects.create(user=FollowViewsTest.user,
+                              author=FollowViewsTest.author)
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow',
+            kwargs={'username': FollowViewsTest.author.username}))
+        self.assertFalse(FeedEntry.objects.filter(
+            user=FollowViewsTest.user).exists())
+
+    def test_feed_is_capped(self):
+        '''Лента пользователя не растёт больше FEED_SIZE записей'''
+        Follow.objects.create(user=FollowViewsTest.user,
+                              author=FollowViewsTest.author)
+        with mock.patch('posts.feed.FEED_SIZE', 2):
+            for i in range(4):
+                Post.objects.create(author=FollowViewsTest.author,
+                                    text=f'Пост {i}')
+        self.assertEqual(
+            FeedEntry.objects.filter(user=FollowViewsTest.user).count(), 2)
+
+    def test_popular_author_is_read_on_fan_in(self):
+        '''Посты популярного автора лента добирает при чтении'''
+        Follow.objects.create(user=FollowViewsTest.user,
+                              author=FollowViewsTest.author)
+        Follow.objects.create(user=FollowViewsTest.user2,
+                              author=FollowViewsTest.author)
+        with mock.patch('posts.feed.FEED_FANOUT_LIMIT', 1):
+            post = Post.objects.create(author=FollowViewsTest.author,
+                                       text='Популярный пост')
+            self.assertFalse(FeedEntry.objects.filter(post=post).exists())
+            response = self.authorized_client.get(
+                reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'])
+
+    @mock.patch('posts.feed.FEED_FANOUT_LIMIT', 1)
+    def test_author_leaving_popular_keeps_posts_in_feeds(self):
+        '''Посты, написанные в популярности, остаются в лентах'''
+        Follow.objects.create(user=FollowViewsTest.user,
+                              author=FollowViewsTest.author)
+        Follow.objects.create(user=FollowViewsTest.user2,
+                              author=FollowViewsTest.author)
+        post = Post.objects.create(author=FollowViewsTest.author,
+                                   text='Популярный пост')
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=FollowViewsTest.author)
+        # Подписка на популярного автора ленту не заполняет.
+        self.assertFalse(FeedEntry.objects.filter(user=reader).exists())
+        Follow.objects.filter(user__in=(FollowViewsTest.user2, reader)
+                              ).delete()
+        self.assertEqual(list(FeedEntry.objects.filter(
+            post=post).values_list('user_id', flat=True)),
+            [FollowViewsTest.user.pk])
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'])
+
+
+class QueryCountTest(TestCase):
+    '''Число запросов страниц не зависит от числа строк на них.'''
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_url',
+            description='Тестовое описание',
+        )
+        authors = [User.objects.create_user(username=f'author_{i}',
+                                            first_name=f'Имя {i}')
+                   for i in range(POST_ON_PAGE)]
+        for i in range(POST_ON_PAGE * 2):
+            Post.objects.create(author=authors[i % POST_ON_PAGE],
+                                group=cls.group,
+                                text=f'Тестовый пост {i}')
+        for i in range(POST_ON_PAGE):
+            Post.objects.create(author=authors[0],
+                                text=f'Пост первого автора {i}')
+        for author in authors:
+            Follow.objects.create(user=cls.reader, author=author)
+        cls.author = authors[0]
+        cls.post = Post.objects.filter(author=cls.author).first()
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(QueryCountTest.reader)
+
+    def test_feed_pages_query_budget(self):
+        '''Ленты укладываются в фиксированное число запросов'''
+        budgets = (
+            (self.guest_client, reverse('posts:index'), 1),
+            (self.guest_client,
+             reverse('posts:group_list',
+                     kwargs={'slug': QueryCountTest.group.slug}), 2),
+            (self.guest_client,
+             reverse('posts:profile',
+                     kwargs={'username': QueryCountTest.author.username}),
+             2),
+            (self.authorized_client, reverse('posts:follow_index'), 4),
+        )
+        for client, url, queries in budgets:
+            with self.subTest(url=url), self.assertNumQueries(queries):
+                response = client.get(url)
+                self.assertEqual(len(response.context['page_obj']),
+                                 POST_ON_PAGE)
+
+    def test_post_detail_query_budget(self):
+        '''Страница поста не делает запросов на каждый комментарий'''
+        url = reverse('posts:post_detail',
+                      kwargs={'post_id': QueryCountTest.post.pk})
+        commenters = [User.objects.create_user(username=f'commenter_{i}')
+                      for i in range(10)]
+        created = 0
+        for total in (10, 100, 1000):
+            Comment.objects.bulk_create(
+                Comment(post=QueryCountTest.post,
+                        author=commenters[i % len(commenters)],
+                        text=f'Комментарий {i}')
+                for i in range(created, total)
+            )
+            created = total
+            cache.clear()
+            with self.subTest(comments=total), self.assertNumQueries(2):
+                self.guest_client.get(url)
+
+
+class CommentPagesTest(TestCase):
+    TOTAL = COMMENTS_ON_PAGE * 2 + 5
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(text='Популярный пост',
+                                       author=cls.user)
+        for i in range(cls.TOTAL):
+            Comment.objects.create(post=cls.post, author=cls.user,
+                                   text=f'Комментарий {i}')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.url = reverse('posts:post_comments',
+                           kwargs={'post_id': CommentPagesTest.post.pk})
+
+    def test_post_detail_renders_first_page_and_count(self):
+        response = self.guest_client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': CommentPagesTest.post.pk}))
+        page = response.context['comment_page']
+        self.assertEqual(len(page), COMMENTS_ON_PAGE)
+        self.assertEqual(page[0].text, f'Комментарий {self.TOTAL - 1}')
+        self.assertContains(response, f'Комментариев: {self.TOTAL}')
+        self.assertContains(response, 'js-more-comments')
+
+    def test_fragments_walk_all_comments(self):
+        seen, cursor = [], None
+        while True:
+            response = self.guest_client.get(
+                self.url, {'cursor': cursor} if cursor else {})
+            page = response.context['comment_page']
+            seen.extend(comment.pk for comment in page)
+            self.assertTemplateUsed(response,
+                                    'posts/includes/comment_list.html')
+            self.assertNotContains(response, '<html')
+            cursor = page.paginator.next_cursor
+            if cursor is None:
+                break
+        expected = list(CommentPagesTest.post.comments.order_by(
+            '-created', '-pk').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_json_format(self):
+        data = self.guest_client.get(self.url, {'format': 'json'}).json()
+        self.assertEqual(data['count'], self.TOTAL)
+        self.assertEqual(len(data['comments']), COMMENTS_ON_PAGE)
+        self.assertEqual(set(data['comments'][0]),
+                         {'id', 'author', 'text', 'created'})
+        second = self.guest_client.get(
+            self.url, {'format': 'json', 'cursor': data['next_cursor']}).json()
+        self.assertEqual(len(second['comments']), COMMENTS_ON_PAGE)
+        self.assertIsNotNone(second['next_cursor'])
+
+    def test_missing_post(self):
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 0}))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,105 @@
+'''Фоновая подготовка картинок постов.
+
+Шаблоны только читают готовый набор копий из ``ImageDerivative`` и
+никогда не запускают Pillow в потоке запроса. Копии строит пул фоновых
+потоков без внешнего брокера: задача ставится после фиксации транзакции,
+в которой пост сохранили с новой картинкой, а также при первом показе
+поста, для которого копий ещё нет. Готовый набор сбрасывает версии
+фрагментов поста, и вместо заглушки появляется картинка.
+
+Число потоков задаёт настройка ``THUMBNAIL_WORKERS``; при нуле (так в
+тестах) и внутри открытой транзакции копии строятся сразу в вызывающем
+потоке: фоновый поток не должен писать в базу, пока вызывающий держит
+блокировку записи. Каждая задача пула закрывает своё соединение.
+
+Неудачная сборка (файл пропал или битый) помечается в кэше на
+``THUMBNAIL_RETRY_TIMEOUT``: показ поста не ставит её в очередь снова
+на каждый запрос. Новая картинка получает новое имя и строится сразу,
+``build_image_derivatives`` пробует и помеченные.
+'''
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+
+from core import metrics
+
+from . import caching
+from .derivatives import build_derivatives
+from .models import Post
+from yatube.constants import THUMBNAIL_RETRY_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = set()
+_pool = {'executor': None, 'pid': None}
+
+FAILED_KEY = 'thumbnail-failed:{}'
+
+
+def _failed_key(name):
+    return FAILED_KEY.format(hashlib.md5(name.encode()).hexdigest())
+
+
+def failed(name):
+    '''Сборка копий этой картинки недавно не удалась.'''
+    return cache.get(_failed_key(name)) is not None
+
+
+def _executor():
+    # После fork потоки пула родителя не существуют: создаём пул заново.
+    if _pool['pid'] != os.getpid():
+        _pool['executor'] = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails')
+        _pool['pid'] = os.getpid()
+    return _pool['executor']
+
+
+def generate(post_id, name):
+    '''Строит копии картинки и сбрасывает кэш фрагментов поста.'''
+    try:
+        post = Post.objects.filter(pk=post_id, image=name).only(
+            'author_id', 'group_id', 'image').first()
+        if post is not None:
+            with metrics.timed('thumbnails', metrics.THUMBNAIL_SECONDS):
+                build_derivatives(post)
+            caching.image_changed(post)
+    except Exception:
+        logger.exception('Не удалось подготовить картинку %s', name)
+        cache.set(_failed_key(name), 1, THUMBNAIL_RETRY_TIMEOUT)
+    finally:
+        with _lock:
+            _pending.discard(name)
+
+
+def _run(post_id, name):
+    try:
+        generate(post_id, name)
+    finally:
+        connections.close_all()
+
+
+def submit(post_id, name):
+    '''Ставит картинку в очередь, если она ещё не ждёт обработки.'''
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    if settings.THUMBNAIL_WORKERS and not connection.in_atomic_block:
+        _executor().submit(_run, post_id, name)
+    else:
+        generate(post_id, name)
+
+
+def schedule(post):
+    '''Готовит картинку после фиксации транзакции с сохранённым постом.'''
+    if post.image:
+        post_id, name = post.pk, post.image.name
+        transaction.on_commit(lambda: submit(post_id, name))
@@ -0,0 +1,348 @@
+'''Перенос контента между окружениями: выгрузка и загрузка.
+
+Выгрузка читает таблицы курсором по первичному ключу, так что память
+не зависит от их размера. Форматы: JSON Lines (один файл, строка на
+запись с полем ``model``; ``.gz`` сжимается) и CSV (каталог, файл на
+модель). Связи записываются как username и slug, а не id.
+
+Загрузка пишет пачками ``bulk_create``, каждая пачка — своя
+транзакция. После фиксации пачки позиция во входных данных попадает в
+файл контрольной точки, и прерванный импорт продолжается с неё. Пачки
+вставляются с ``ignore_conflicts``, поэтому повтор последней пачки
+после сбоя ничего не дублирует. Id постов и комментариев сдвигаются за
+максимальный id в базе на момент начала импорта.
+
+Сигналы при ``bulk_create`` не срабатывают: счётчики, поисковый индекс,
+карточки постов и ленты пересчитываются в конце одним проходом
+(``rebuild_derived``).
+'''
+import csv
+import gzip
+import json
+import os
+from datetime import datetime
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Case, Max, Value, When
+from django.utils.dateparse import parse_datetime
+
+from . import cards, caching, counters, feed, search
+from .models import Comment, Follow, Group, Post, User
+from yatube.constants import EXPORT_CHUNK_SIZE, TRANSFER_BATCH_SIZE
+
+JSONL = 'jsonl'
+CSV = 'csv'
+FORMATS = (JSONL, CSV)
+
+# Порядок важен: группы и посты загружаются раньше ссылок на них.
+MODELS = ('group', 'post', 'comment', 'follow')
+FIELDS = {
+    'group': ('slug', 'title', 'description'),
+    'post': ('id', 'author', 'group', 'text', 'pub_date', 'image'),
+    'comment': ('id', 'post', 'author', 'text', 'created'),
+    'follow': ('user', 'author'),
+}
+SOURCES = {
+    'group': lambda: Group.objects.values_list(
+        'slug', 'title', 'description'),
+    'post': lambda: Post.objects.values_list(
+        'pk', 'author__username', 'group__slug', 'text', 'pub_date',
+        'image'),
+    'comment': lambda: Comment.objects.values_list(
+        'pk', 'post_id', 'author__username', 'text', 'created'),
+    'follow': lambda: Follow.objects.values_list(
+        'user__username', 'author__username'),
+}
+# Столько параметров помещается в один запрос SQLite.
+LOOKUP_CHUNK = 500
+
+
+def _open(path, mode):
+    opener = gzip.open if path.endswith('.gz') else open
+    if 'b' in mode:
+        return opener(path, mode)
+    return opener(path, mode + 't', encoding='utf-8')
+
+
+def csv_path(directory, model):
+    return os.path.join(directory, f'{model}.csv')
+
+
+def rows(model):
+    '''Строки модели по возрастанию первичного ключа.'''
+    for values in SOURCES[model]().order_by('pk').iterator(
+            chunk_size=EXPORT_CHUNK_SIZE):
+        yield [value.isoformat() if isinstance(value, datetime) else value
+               for value in values]
+
+
+def export_jsonl(stream, models=MODELS):
+    counts = dict.fromkeys(models, 0)
+    for model in models:
+        for row in rows(model):
+            stream.write(json.dumps({'model': model,
+                                     **dict(zip(FIELDS[model], row))},
+                                    ensure_ascii=False) + '\n')
+            counts[model] += 1
+    return counts
+
+
+def export_csv(directory, models=MODELS):
+    os.makedirs(directory, exist_ok=True)
+    counts = dict.fromkeys(models, 0)
+    for model in models:
+        with open(csv_path(directory, model), 'w', newline='',
+                  encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(FIELDS[model])
+            for row in rows(model):
+                writer.writerow(row)
+                counts[model] += 1
+    return counts
+
+
+def export(path, format=JSONL):
+    '''Выгружает контент в файл JSONL или каталог CSV; возвращает счётчики.'''
+    if format == CSV:
+        return export_csv(path)
+    with _open(path, 'w') as stream:
+        return export_jsonl(stream)
+
+
+def read_jsonl(path, position=None):
+    '''Записи ``(позиция после записи, модель, поля)`` из файла JSONL.
+
+    Позиция — смещение в байтах, с него чтение и продолжается.
+    '''
+    offset = position or 0
+    with _open(path, 'rb') as file:
+        file.seek(offset)
+        for line in file:
+            offset += len(line)
+            if line.strip():
+                record = json.loads(line)
+                yield offset, record.pop('model', None), record
+
+
+def read_csv(directory, position=None):
+    '''Записи из каталога CSV; позиция — ``[модель, номер строки]``.'''
+    start_model, start_row = position or (MODELS[0], 0)
+    for model in MODELS[MODELS.index(start_model):]:
+        path = csv_path(directory, model)
+        if not os.path.exists(path):
+            continue
+        skip = start_row if model == start_model else 0
+        with open(path, newline='', encoding='utf-8') as file:
+            for number, record in enumerate(csv.DictReader(file), 1):
+                if number > skip:
+                    yield [model, number], model, record
+
+
+def read(path, format=JSONL, position=None):
+    reader = read_csv if format == CSV else read_jsonl
+    return reader(path, position)
+
+
+def _chunks(items, size=LOOKUP_CHUNK):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def restore_dates(model, field, dates):
+    '''Ставит датам ``{pk: дата}`` значения из выгрузки.
+
+    ``auto_now_add`` подставляет при вставке время импорта, а поле
+    модели общее для процесса и его не трогаем: даты пишутся вторым
+    ``UPDATE ... CASE`` в той же транзакции.
+    '''
+    output_field = model._meta.get_field(field)
+    for chunk in _chunks(dates.items(), LOOKUP_CHUNK // 2):
+        model.objects.filter(pk__in=[pk for pk, _ in chunk]).update(**{
+            field: Case(*(When(pk=pk, then=Value(date))
+                          for pk, date in chunk),
+                        output_field=output_field)})
+
+
+class Importer:
+    '''Пачечная загрузка с контрольной точкой.
+
+    Состояние — позиция во входных данных, сдвиги id и число
+    загруженных записей — хранится в JSON-файле ``checkpoint``.
+    '''
+
+    def __init__(self, checkpoint=None, batch_size=TRANSFER_BATCH_SIZE):
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.users = {}
+        self.groups = {}
+        self.state = self._load_state() or {
+            'position': None,
+            'offsets': {
+                'post': Post.objects.aggregate(top=Max('pk'))['top'] or 0,
+                'comment': Comment.objects.aggregate(
+                    top=Max('pk'))['top'] or 0,
+            },
+            'counts': dict.fromkeys(MODELS, 0),
+            'finished': False,
+        }
+
+    @property
+    def position(self):
+        return self.state['position']
+
+    @property
+    def finished(self):
+        return self.state['finished']
+
+    @property
+    def counts(self):
+        return self.state['counts']
+
+    def _load_state(self):
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return None
+        with open(self.checkpoint, encoding='utf-8') as file:
+            return json.load(file)
+
+    def _save_state(self):
+        if not self.checkpoint:
+            return
+        temporary = self.checkpoint + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(self.state, file)
+        os.replace(temporary, self.checkpoint)
+
+    def load(self, records):
+        '''Загружает записи ``(позиция, модель, поля)`` пачками.'''
+        batch, model, position = [], None, None
+        for next_position, next_model, record in records:
+            if next_model not in MODELS:
+                raise ValueError(f'Неизвестная модель: {next_model!r}')
+            if batch and (next_model != model
+                          or len(batch) >= self.batch_size):
+                self._flush(model, batch, position)
+                batch = []
+            model, position = next_model, next_position
+            batch.append(record)
+        if batch:
+            self._flush(model, batch, position)
+        return self.counts
+
+    def _flush(self, model, records, position):
+        with transaction.atomic():
+            loaded = getattr(self, f'_load_{model}')(records)
+        self.state['counts'][model] += loaded
+        self.state['position'] = position
+        self._save_state()
+
+    def finish(self, derived=True):
+        if derived:
+            rebuild_derived()
+        self.state['finished'] = True
+        self._save_state()
+
+    def _user_ids(self, usernames):
+        '''Id пользователей по username; недостающие создаются.
+
+        Новые пользователи получают непригодный пароль: войти они смогут
+        только после его сброса.
+        '''
+        missing = set(usernames) - self.users.keys()
+        for chunk in _chunks(missing):
+            User.objects.bulk_create(
+                (User(username=name, password=make_password(None))
+                 for name in chunk),
+                ignore_conflicts=True,
+            )
+            self.users.update(User.objects.filter(
+                username__in=chunk).values_list('username', 'pk'))
+        return self.users
+
+    def _group_ids(self, slugs):
+        missing = set(slugs) - self.groups.keys() - {None, ''}
+        for chunk in _chunks(missing):
+            self.groups.update(Group.objects.filter(
+                slug__in=chunk).values_list('slug', 'pk'))
+        return self.groups
+
+    def _load_group(self, records):
+        Group.objects.bulk_create(
+            (Group(slug=record['slug'], title=record['title'],
+                   description=record['description'])
+             for record in records),
+            ignore_conflicts=True,
+        )
+        return len(records)
+
+    def _load_post(self, records):
+        users = self._user_ids(record['author'] for record in records)
+        groups = self._group_ids(record['group'] for record in records)
+        offset = self.state['offsets']['post']
+        dates = {int(record['id']) + offset:
+                 parse_datetime(record['pub_date']) for record in records}
+        Post.objects.bulk_create(
+            (Post(pk=int(record['id']) + offset,
+                  author_id=users[record['author']],
+                  group_id=groups.get(record['group']),
+                  text=record['text'],
+                  image=record['image'] or '')
+             for record in records),
+            ignore_conflicts=True,
+        )
+        restore_dates(Post, 'pub_date', dates)
+        return len(records)
+
+    def _load_comment(self, records):
+        users = self._user_ids(record['author'] for record in records)
+        post_offset = self.state['offsets']['post']
+        offset = self.state['offsets']['comment']
+        # Комментарии к постам, которых нет в выгрузке, пропускаются.
+        existing = set()
+        for chunk in _chunks({int(record['post']) + post_offset
+                              for record in records}):
+            existing.update(Post.objects.filter(
+                pk__in=chunk).values_list('pk', flat=True))
+        comments = [
+            Comment(pk=int(record['id']) + offset,
+                    post_id=int(record['post']) + post_offset,
+                    author_id=users[record['author']],
+                    text=record['text'])
+            for record in records
+            if int(record['post']) + post_offset in existing
+        ]
+        Comment.objects.bulk_create(comments, ignore_conflicts=True)
+        restore_dates(Comment, 'created', {
+            int(record['id']) + offset: parse_datetime(record['created'])
+            for record in records
+            if int(record['post']) + post_offset in existing})
+        return len(comments)
+
+    def _load_follow(self, records):
+        users = self._user_ids(
+            name for record in records
+            for name in (record['user'], record['author']))
+        follows = [
+            Follow(user_id=users[record['user']],
+                   author_id=users[record['author']])
+            for record in records if record['user'] != record['author']
+        ]
+        Follow.objects.bulk_create(follows, ignore_conflicts=True)
+        return len(follows)
+
+
+def rebuild_derived():
+    '''Пересчитывает то, что при обычной записи обновляют сигналы.'''
+    with transaction.atomic():
+        counters.recount_users()
+        counters.recount_posts()
+        counters.recount_groups()
+    with transaction.atomic():
+        search.rebuild()
+    with transaction.atomic():
+        cards.rebuild()
+    with transaction.atomic():
+        feed.fill_feeds()
+    # Версия ``meta`` входит в ключ каждого фрагмента.
+    caching.bump(caching.META)
@@ -0,0 +1,103 @@
+'''Приём картинок постов с ограничением по размеру.
+
+Загрузка пишется на диск частями и перестаёт писаться, как только
+превысит ``IMAGE_MAX_BYTES``. Размер в пикселях проверяется по заголовку
+файла, без декодирования. Принятая картинка один раз поворачивается
+по EXIF, теряет метаданные и уменьшается до ``IMAGE_MASTER_SIZE``
+по большей стороне. Эта копия и хранится как оригинал поста.
+'''
+import math
+import os
+import warnings
+from io import BytesIO
+
+from django.core.exceptions import ValidationError
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.core.files.uploadedfile import SimpleUploadedFile, UploadedFile
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+
+from yatube.constants import (IMAGE_MASTER_SIZE, IMAGE_MAX_BYTES,
+                              IMAGE_MAX_PIXELS)
+
+# Эти форматы храним как есть; остальные перекодируем в JPEG или PNG.
+KEPT_FORMATS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif'}
+EXIF_ORIENTATION = 0x0112
+
+
+class BoundedUploadHandler(TemporaryFileUploadHandler):
+    '''Пишет загрузку во временный файл, но не больше лимита.
+
+    Остаток слишком большого файла читается из запроса и выбрасывается:
+    размер итогового объекта — полный размер загрузки, по нему форма
+    и сообщает об ошибке.
+    '''
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > IMAGE_MAX_BYTES:
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+
+def check_upload(upload):
+    '''Проверяет вес и размер картинки, не декодируя её.'''
+    if upload.size > IMAGE_MAX_BYTES:
+        raise ValidationError(
+            'Файл весит больше %(limit)s.',
+            code='file_too_large',
+            params={'limit': filesizeformat(IMAGE_MAX_BYTES)})
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            with Image.open(upload) as image:
+                width, height = image.size
+    except (Image.DecompressionBombWarning, Image.DecompressionBombError):
+        width = height = math.inf
+    except Exception:
+        # Битый файл — забота ImageField, он скажет об этом сам.
+        return
+    finally:
+        upload.seek(0)
+    if width * height > IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка больше %(limit)s мегапикселей.',
+            code='too_many_pixels',
+            params={'limit': IMAGE_MAX_PIXELS // 1_000_000})
+
+
+def _needs_master(image):
+    return (image.format not in KEPT_FORMATS
+            or max(image.size) > IMAGE_MASTER_SIZE
+            or bool(image.info.get('exif'))
+            or EXIF_ORIENTATION in image.getexif())
+
+
+def make_master(upload):
+    '''Каноническая копия загруженной картинки для хранения.'''
+    if not isinstance(upload, UploadedFile):
+        return upload
+    with Image.open(upload) as image:
+        if getattr(image, 'is_animated', False) or not _needs_master(image):
+            upload.seek(0)
+            return upload
+        source_format = image.format
+        ratio = min(1, IMAGE_MASTER_SIZE / max(image.size))
+        # JPEG умеет декодироваться сразу в уменьшенном масштабе.
+        image.draft('RGB', (math.ceil(image.width * ratio),
+                            math.ceil(image.height * ratio)))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((IMAGE_MASTER_SIZE, IMAGE_MASTER_SIZE),
+                        Image.LANCZOS)
+    target = source_format
+    if target not in KEPT_FORMATS:
+        target = 'PNG' if 'A' in image.getbands() else 'JPEG'
+    if target == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, target, **({'quality': 90, 'optimize': True}
+                                  if target == 'JPEG' else {}))
+    name = upload.name
+    if target != source_format:
+        name = os.path.splitext(name)[0] + KEPT_FORMATS[target]
+    return SimpleUploadedFile(name, buffer.getvalue(),
+                              content_type=Image.MIME[target])
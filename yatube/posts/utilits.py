@@ -1,10 +1,214 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+import json
 
-from yatube.constants import POST_ON_PAGE
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db.models import Q, prefetch_related_objects
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
 
+from .cards import hydrate
+from yatube.constants import COMMENTS_ON_PAGE, POST_ON_PAGE
 
-def get_page_context(queryset, request):
-    paginator = Paginator(queryset, POST_ON_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+CURSOR_PARAM = 'cursor'
+COMMENT_ORDERING = ('-created', '-pk')
+
+FORWARD = 'next'
+BACKWARD = 'prev'
+
+
+class InvalidCursor(Exception):
+    '''Токен курсора повреждён или собран не этим паджинатором.'''
+
+
+def encode_cursor(values, direction=FORWARD):
+    '''Упаковывает значения ключа сортировки в непрозрачный токен.'''
+    payload = json.dumps(
+        {'d': direction, 'v': [value.isoformat()
+                               if hasattr(value, 'isoformat') else value
+                               for value in values]},
+        separators=(',', ':'),
+    )
+    return base64.urlsafe_b64encode(
+        payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    '''Распаковывает токен курсора в направление и значения ключа.'''
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        direction, values = data['d'], data['v']
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidCursor(token)
+    if direction not in (FORWARD, BACKWARD) or not isinstance(values, list):
+        raise InvalidCursor(token)
+    return direction, values
+
+
+class CursorPaginator(Paginator):
+    '''Паджинатор по ключу сортировки вместо OFFSET.
+
+    Страница выбирается условием «строго после/до курсора» по составному
+    ключу (по умолчанию ``(pub_date, id)``), поэтому стоимость любой
+    страницы одинакова, а общий COUNT(*) не выполняется. Паджинатор
+    знает только соседние страницы: ``number`` равен 2, если есть
+    предыдущая страница, а ``num_pages`` на единицу больше ``number``,
+    если есть следующая, — так стандартные методы ``Page`` работают
+    без изменений.
+    '''
+
+    def __init__(self, object_list, per_page,
+                 ordering=('-pub_date', '-pk'), **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.ordering = tuple(ordering)
+        self.cursor = None
+        self.next_cursor = None
+        self.previous_cursor = None
+        self._number = 1
+        self._num_pages = 1
+
+    def _check_object_list_is_ordered(self):
+        '''Порядок задаёт сам паджинатор, предупреждение не нужно.'''
+
+    @cached_property
+    def fields(self):
+        return tuple(field.lstrip('-') for field in self.ordering)
+
+    @property
+    def count(self):
+        '''Число объектов на известном окне страниц, без COUNT(*).'''
+        return self._num_pages * self.per_page
+
+    @property
+    def num_pages(self):
+        return self._num_pages
+
+    @property
+    def page_range(self):
+        return range(1, self._num_pages + 1)
+
+    def _parse_values(self, values):
+        if len(values) != len(self.fields):
+            raise InvalidCursor(values)
+        opts = self.object_list.model._meta
+        annotations = self.object_list.query.annotations
+        parsed = []
+        for field, value in zip(self.fields, values):
+            if field in annotations:
+                model_field = annotations[field].output_field
+            elif field == 'pk':
+                model_field = opts.pk
+            else:
+                model_field = opts.get_field(field)
+            try:
+                if model_field.get_internal_type() == 'DateTimeField':
+                    value = parse_datetime(value)
+                    if value is None:
+                        raise ValueError(value)
+                else:
+                    value = model_field.to_python(value)
+            except (TypeError, ValueError, ValidationError):
+                raise InvalidCursor(values)
+            parsed.append(value)
+        return parsed
+
+    def _seek(self, values, direction):
+        '''Строит условие «строго за курсором» для составного ключа.'''
+        condition = Q()
+        for position in reversed(range(len(self.fields))):
+            field = self.fields[position]
+            descending = self.ordering[position].startswith('-')
+            after = descending == (direction == FORWARD)
+            step = Q(**{f'{field}__{"lt" if after else "gt"}':
+                        values[position]})
+            if position < len(self.fields) - 1:
+                step |= Q(**{field: values[position]}) & condition
+            condition = step
+        leading = self.fields[0]
+        descending = self.ordering[0].startswith('-')
+        bound = 'lte' if descending == (direction == FORWARD) else 'gte'
+        # Нестрогая граница по первому полю превращает условие в диапазон
+        # индекса, иначе SQLite просматривает индекс с самого начала.
+        return Q(**{f'{leading}__{bound}': values[0]}) & condition
+
+    def _reversed_ordering(self):
+        return tuple(field[1:] if field.startswith('-') else '-' + field
+                     for field in self.ordering)
+
+    def _cursor_for(self, obj, direction):
+        return encode_cursor(
+            [getattr(obj, field) for field in self.fields], direction)
+
+    def page_queryset(self, cursor=None):
+        '''Запрос страницы: на одну строку больше, чтобы узнать о следующей.'''
+        direction, values = FORWARD, None
+        if cursor:
+            direction, values = decode_cursor(cursor)
+            values = self._parse_values(values)
+        queryset = self.object_list
+        ordering = self.ordering
+        if direction == BACKWARD:
+            ordering = self._reversed_ordering()
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, direction))
+        return (direction, values is not None,
+                queryset.order_by(*ordering)[:self.per_page + 1])
+
+    def page(self, cursor=None):
+        self.cursor = cursor or None
+        direction, seeking, queryset = self.page_queryset(cursor)
+        rows = list(queryset)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == BACKWARD:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, seeking
+        if not rows:
+            has_next = has_previous = False
+        self.next_cursor = (self._cursor_for(rows[-1], FORWARD)
+                            if has_next else None)
+        self.previous_cursor = (self._cursor_for(rows[0], BACKWARD)
+                                if has_previous else None)
+        self._number = 2 if has_previous else 1
+        self._num_pages = self._number + (1 if has_next else 0)
+        return Page(rows, self._number, self)
+
+    def get_page(self, cursor=None):
+        '''Как ``Paginator.get_page``: на негодный курсор — первая страница.'''
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page(None)
+
+
+def get_page_context(queryset, request, ordering=('-pub_date', '-pk')):
+    paginator = CursorPaginator(queryset, POST_ON_PAGE, ordering=ordering)
+    page_obj = paginator.get_page(request.GET.get(CURSOR_PARAM))
+    prefetch_derivatives(page_obj)
+    return page_obj
+
+
+def get_card_page(cards, request):
+    '''Страница ленты по карточкам постов: один запрос без JOIN.'''
+    paginator = CursorPaginator(cards, POST_ON_PAGE,
+                                ordering=('-pub_date', '-pk'))
+    page_obj = paginator.get_page(request.GET.get(CURSOR_PARAM))
+    page_obj.object_list = [hydrate(card) for card in page_obj]
     return page_obj
+
+
+def get_comment_page(post, cursor=None):
+    '''Страница комментариев поста, новые сверху.'''
+    paginator = CursorPaginator(post.comments.select_related('author'),
+                                COMMENTS_ON_PAGE, ordering=COMMENT_ORDERING)
+    return paginator.get_page(cursor)
+
+
+def prefetch_derivatives(posts):
+    # Копии картинок нужны только постам с картинками: без них нет запроса.
+    prefetch_related_objects(
+        [post for post in posts if post.image], 'derivatives')
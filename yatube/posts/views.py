@@ -1,42 +1,92 @@
+from urllib.parse import urlencode
+
 from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.functional import SimpleLazyObject
 
-from .forms import CommentForm, PostForm
-from .models import Comment, Follow, Group, Post, User
-from .utilits import get_page_context
-from yatube.constants import SYMBOLS_TITLE_POST
-
+from core.db.routers import read_only
 
+from .caching import (POSTS, author_scope, feed_version, follow_scope,
+                      group_scope, post_scope)
+from .conditional import PageValidators
+from .counters import stats_for
+from .feed import FEED_ORDERING, follow_feed
+from .forms import CommentForm, PostForm
+from .models import Follow, PostCard, User
+from .object_cache import author_cache, group_cache, post_cache
+from .page_cache import cache_anonymous
+from .search import results_paginator
+from .utilits import (CURSOR_PARAM, get_card_page, get_comment_page,
+                      get_page_context, prefetch_derivatives)
+from yatube.constants import (FEED_CACHE_TIMEOUT, POST_ON_PAGE,
+                              SYMBOLS_TITLE_POST)
+
+
+@read_only
+@cache_anonymous
 def index(request):
-    posts = Post.objects.all().order_by('-pub_date')
-    page_obj = get_page_context(posts, request)
+    validators = PageValidators(request, POSTS)
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    page_obj = get_card_page(PostCard.objects.all(), request)
     context = {
-        'posts': posts,
         'page_obj': page_obj,
+        'feed_version': feed_version(POSTS),
+        'cache_timeout': FEED_CACHE_TIMEOUT,
     }
+    return validators.apply(render(request, 'posts/index.html', context))
+
 
-    return render(request, 'posts/index.html', context)
+@read_only
+def search(request):
+    query = request.GET.get('q', '').strip()
+    paginator = results_paginator(query, POST_ON_PAGE)
+    page_obj = paginator.get_page(request.GET.get(CURSOR_PARAM))
+    prefetch_derivatives(page_obj)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_params': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
 
 
+@read_only
+@cache_anonymous
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all().order_by('-pub_date')
-    page_obj = get_page_context(posts, request)
+    group = group_cache.get_or_404(slug)
+    validators = PageValidators(request, group_scope(group.pk))
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    page_obj = get_card_page(PostCard.objects.filter(group_id=group.pk),
+                             request)
     context = {
         'group': group,
         'description': group.description,
-        'posts': posts,
         'page_obj': page_obj,
+        'feed_version': feed_version(group_scope(group.pk)),
+        'cache_timeout': FEED_CACHE_TIMEOUT,
     }
-    return render(request, 'posts/group_list.html', context)
+    return validators.apply(
+        render(request, 'posts/group_list.html', context))
 
 
+@read_only
+@cache_anonymous
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    count_posts = author.posts.all().count()
-    profile_list = author.posts.select_related(
-        'group', 'author').order_by('-pub_date')
-    page_obj = get_page_context(profile_list, request)
+    author = author_cache.get_or_404(username)
+    # Кнопка подписки зависит от подписок читателя.
+    validators = PageValidators(request, author_scope(author.pk),
+                                follow_scope(request.user.pk))
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    count_posts = stats_for(author).posts_count
+    page_obj = get_card_page(PostCard.objects.filter(author_id=author.pk),
+                             request)
     following = (request.user.is_authenticated
                  and Follow.objects.filter(
                      user=request.user,
@@ -47,24 +97,62 @@ def profile(request, username):
         'count_posts': count_posts,
         'page_obj': page_obj,
         'following': following,
+        'feed_version': feed_version(author_scope(author.pk)),
+        'cache_timeout': FEED_CACHE_TIMEOUT,
     }
-    return render(request, 'posts/profile.html', context)
+    return validators.apply(render(request, 'posts/profile.html', context))
 
 
+@read_only
+@cache_anonymous
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    posts_count = Post.objects.filter(author=post.author).count()
+    post = post_cache.get_or_404(post_id)
+    # Рядом с постом выводится число постов автора.
+    validators = PageValidators(request, post_scope(post.pk),
+                                author_scope(post.author_id))
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    posts_count = stats_for(post.author).posts_count
     title = post.text[:SYMBOLS_TITLE_POST]
-    comments = Comment.objects.filter(post=post)
     form = CommentForm(request.POST or None)
     context = {
         'post': post,
         'posts_count': posts_count,
         'title': title,
-        'comments': comments,
+        # Первая страница читается, только если фрагмент не в кэше.
+        'comment_page': SimpleLazyObject(lambda: get_comment_page(post)),
         'form': form,
+        'feed_version': feed_version(post_scope(post.pk)),
+        'cache_timeout': FEED_CACHE_TIMEOUT,
     }
-    return render(request, 'posts/post_detail.html', context)
+    return validators.apply(
+        render(request, 'posts/post_detail.html', context))
+
+
+@read_only
+@cache_anonymous
+def post_comments(request, post_id):
+    post = post_cache.get_or_404(post_id)
+    validators = PageValidators(request, post_scope(post.pk))
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    page_obj = get_comment_page(post, request.GET.get(CURSOR_PARAM))
+    if request.GET.get('format') == 'json':
+        return validators.apply(JsonResponse({
+            'count': post.comments_count,
+            'comments': [
+                {'id': comment.pk,
+                 'author': comment.author.username,
+                 'text': comment.text,
+                 'created': comment.created.isoformat()}
+                for comment in page_obj],
+            'next_cursor': page_obj.paginator.next_cursor,
+        }))
+    context = {'post': post, 'comment_page': page_obj}
+    return validators.apply(
+        render(request, 'posts/includes/comment_list.html', context))
 
 
 @login_required
@@ -80,11 +168,11 @@ def post_create(request):
 
 @login_required
 def post_edit(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = post_cache.get_or_404(post_id)
     form = PostForm(request.POST or None, instance=post,
                     files=request.FILES or None)
-    if post.author != request.user or (form.is_valid()
-                                       and request.method == 'POST'):
+    if post.author_id != request.user.pk or (form.is_valid()
+                                             and request.method == 'POST'):
         post = form.save()
         return redirect('posts:post_detail', post_id)
     return render(request, 'posts/create_post.html',
@@ -93,7 +181,7 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = post_cache.get_or_404(post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
@@ -103,12 +191,21 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@read_only
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = get_page_context(posts, request)
-    context = {'page_obj': page_obj}
-    return render(request, 'posts/follow.html', context)
+    validators = PageValidators(request, POSTS, follow_scope(request.user.pk))
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    posts = follow_feed(request.user).select_related('author', 'group')
+    page_obj = get_page_context(posts, request, ordering=FEED_ORDERING)
+    context = {
+        'page_obj': page_obj,
+        'feed_version': feed_version(POSTS, follow_scope(request.user.pk)),
+        'cache_timeout': FEED_CACHE_TIMEOUT,
+    }
+    return validators.apply(render(request, 'posts/follow.html', context))
 
 
 @login_required
@@ -2,6 +2,46 @@ SYMBOLS_TITLE_POST = 30
 
 POST_ON_PAGE = 10
 
+COMMENTS_ON_PAGE = 20
+
+API_PAGE_SIZE = 50
+
+API_MAX_PAGE_SIZE = 100
+
+API_BATCH_SIZE = 100
+
 POST_ON_LAS_PAGE_TEST = 3
 
 SYMBOLS_ON_POST = 15
+
+FEED_SIZE = 1000
+
+FEED_FANOUT_LIMIT = 10000
+
+FEED_BATCH_SIZE = 500
+
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+
+PAGE_CACHE_TIMEOUT = 60 * 60
+
+OBJECT_CACHE_SIZE = 1000
+
+OBJECT_CACHE_TIMEOUT = 60 * 60
+
+OBJECT_LOCK_TIMEOUT = 5
+
+THUMBNAIL_RETRY_TIMEOUT = 60 * 60
+
+IMAGE_WIDTHS = (320, 640, 960)
+
+IMAGE_ASPECT = (960, 339)
+
+IMAGE_MAX_BYTES = 10 * 1024 * 1024
+
+IMAGE_MAX_PIXELS = 40_000_000
+
+IMAGE_MASTER_SIZE = 2048
+
+TRANSFER_BATCH_SIZE = 1000
+
+EXPORT_CHUNK_SIZE = 2000
@@ -12,6 +12,10 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 
 import os
 
+from core.caches.config import cache_from_url
+from core.db.config import sqlite_databases
+from core.template_config import django_templates
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 SECRET_KEY = os.getenv("SECRET_KEY", default='c2@th*g=uviuxy8ctp%di%$0_2q^mlh=!n1fa@106iiw0s84ja')
@@ -30,6 +34,7 @@ INSTALLED_APPS = [
     'core.apps.CoreConfig',
     'users.apps.UsersConfig',
     'posts.apps.PostsConfig',
+    'api.apps.ApiConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -40,43 +45,45 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'posts.page_cache.AnonymousPageCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.db.routers.ReadOnlyViewMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
-TEMPLATES = [
-    {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
-        'OPTIONS': {
-            'context_processors': [
-                'django.template.context_processors.debug',
-                'django.template.context_processors.request',
-                'django.contrib.auth.context_processors.auth',
-                'django.contrib.messages.context_processors.messages',
-                'core.context_processors.year.year',
-            ]
-        },
-    }
-]
+# TEMPLATE_PROFILE=production включает кэширующий загрузчик шаблонов,
+# подробности в core/template_config.py.
+TEMPLATES = django_templates(
+    [TEMPLATES_DIR],
+    [
+        'django.template.context_processors.debug',
+        'django.template.context_processors.request',
+        'django.contrib.auth.context_processors.auth',
+        'django.contrib.messages.context_processors.messages',
+        'core.context_processors.year.year',
+    ],
+    os.getenv('TEMPLATE_PROFILE', default='development'),
+)
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
-}
+# DATABASE_PROFILE=production включает WAL, прагмы и реплику для
+# чтения, подробности в core/db/config.py.
+DATABASES = sqlite_databases(
+    os.path.join(BASE_DIR, 'db.sqlite3'),
+    os.getenv('DATABASE_PROFILE', default='development'),
+)
+
+DATABASE_ROUTERS = ['core.db.routers.ReadReplicaRouter']
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -120,16 +127,31 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+# Общий для воркеров кэш: sqlite:///путь, file:///путь или
+# memcached://host:port, подробности в core/caches/config.py.
 CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    'default': cache_from_url(os.getenv('CACHE_URL', default='locmem://')),
 }
 
+# /metrics и /metrics/queries отдаются только с заголовком
+# ``Authorization: Bearer <METRICS_TOKEN>``; без токена — лишь при DEBUG.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Потоки, которые строят копии картинок постов (posts/thumbnails.py);
+# 0 — строить сразу в вызывающем потоке. Тесты ставят 0.
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', default=2))
+
+# Запросы дольше этого порога (мс) пишутся в журнал yatube.queries
+# вместе с планом выполнения.
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', default=100))
+
 MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Загрузки пишутся на диск частями и обрезаются по IMAGE_MAX_BYTES.
+FILE_UPLOAD_HANDLERS = ['posts.uploads.BoundedUploadHandler']
+
 # OST_ON_PAGE = 10
 
 # POST_ON_LAS_PAGE_TEST = 3
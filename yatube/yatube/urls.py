@@ -19,6 +19,8 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from core.views import prometheus_metrics, query_stats
+
 handler404 = 'core.views.page_not_found'
 handler403 = 'core.views.csrf_failure'
 
@@ -28,6 +30,9 @@ urlpatterns = [
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls')),
+    path('api/v1/', include('api.urls', namespace='api')),
+    path('metrics', prometheus_metrics, name='metrics'),
+    path('metrics/queries', query_stats, name='query_stats'),
 ]
 
 if settings.DEBUG: